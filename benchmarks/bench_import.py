@@ -0,0 +1,92 @@
+"""
+Import time of the application (`import main`), measured with `python -X importtime`
+in a fresh interpreter for each routers configuration (ENABLED_ROUTERS). The shared
+state is preloaded too, so that the modules it imports are listed.
+
+Fails (exit status 1) when a CEH-only application imports openai or pandas, or
+when its import takes longer than the budget.
+
+Usage:
+    python -m benchmarks.bench_import [--budget-ms 1500] [--repeat 3] [--top 8]
+"""
+# CORE
+from typing import Dict, List, Tuple
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Configurations mesurées: (ENABLED_ROUTERS, modules interdits, soumise au budget)
+CONFIGURATIONS: List[Tuple[str, Tuple[str, ...], bool]] = [
+    ("ceh", ("openai", "pandas"), True),
+    ("ceh,rh,breakdown,methode", (), False),
+]
+
+PROGRAM = "import main; main.preload_state(main.app.state)"
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| *(\S+)")
+
+
+def measure(routers: str) -> Tuple[float, Dict[str, int]]:
+    """
+    Import main and preload its state in a new interpreter.
+
+    Returns:
+        The import time of main in milliseconds, and the self time in microseconds of
+        every imported module.
+    """
+    env = dict(os.environ, ENABLED_ROUTERS=routers)
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", PROGRAM], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True)
+    total = 0.0
+    modules: Dict[str, int] = {}
+    for line in process.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, name = match.groups()
+        modules[name] = int(self_us)
+        if name == "main":
+            total = int(cumulative_us) / 1000
+    return total, modules
+
+
+def by_package(modules: Dict[str, int]) -> List[Tuple[str, float]]:
+    """Self times summed by top-level package, in milliseconds, slowest first."""
+    packages: Dict[str, int] = {}
+    for name, self_us in modules.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return sorted(((package, us / 1000) for package, us in packages.items()), key=lambda item: -item[1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=1500, help="maximal import time of a CEH-only app")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per configuration, the fastest is kept")
+    parser.add_argument("--top", type=int, default=8, help="slowest packages shown")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for routers, forbidden, budgeted in CONFIGURATIONS:
+        runs = [measure(routers) for _ in range(args.repeat)]
+        total, modules = min(runs, key=lambda run: run[0])
+        print(f"ENABLED_ROUTERS={routers}: import main {total:.0f} ms, {len(modules)} modules")
+        for package, ms in by_package(modules)[:args.top]:
+            print(f"{package:>40}: {ms:8.1f} ms")
+
+        imported = [name for name in forbidden if name in modules]
+        if imported:
+            failures.append(f"ENABLED_ROUTERS={routers} imports {', '.join(imported)}")
+        if budgeted and total > args.budget_ms:
+            failures.append(f"ENABLED_ROUTERS={routers}: import main {total:.0f} ms > budget {args.budget_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+Micro-benchmarks of the rule functions of ceh_utils.tools (apply_rules,
+check_condition, get_value_from_path, select_highest_priority_rule) and of the
+compiled engine, on synthetic payloads and rule sets.
+
+Usage:
+    python -m benchmarks.bench_micro [--rules 100] [--payloads 50]
+"""
+# CORE
+import argparse
+import copy
+import logging
+import re
+import timeit
+
+# OWN
+from benchmarks.synthetic import generate_payloads, generate_rules
+from ceh_utils.engine import compile_rules
+from ceh_utils.tools import apply_rules, apply_transcoding, check_condition, get_value_from_path, select_highest_priority_rule
+
+
+def bench(name, function, number):
+    seconds = min(timeit.repeat(function, number=number, repeat=3)) / number
+    print(f"{name:>40}: {seconds * 1e6:10.2f} us")
+    return seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, default=100)
+    parser.add_argument("--payloads", type=int, default=50)
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    rules, transcoding = generate_rules(args.rules)
+    payloads = generate_payloads(args.payloads)
+    payload = payloads[0]
+    rule_set = compile_rules(copy.deepcopy(rules), transcoding)
+
+    # apply_rules transcode les chemins en place: une copie déjà transcodée mesure le régime établi
+    transcoded = copy.deepcopy(rules)
+    for rule in transcoded:
+        for member in rule["conditions"]["condition_members"].values():
+            apply_transcoding(member, transcoding)
+    members = [member for rule in transcoded for member in rule["conditions"]["condition_members"].values()]
+    matches = [rule.as_match() for rule in rule_set.rules]
+    path = transcoding["ville"]
+    path_parts = re.split(r'\.|\[|\]', path.replace(']', ''))
+
+    print(f"{args.rules} rules, {len(members)} condition members")
+    bench("get_value_from_path", lambda: get_value_from_path(payload, path_parts), 100000)
+    bench(f"check_condition x {len(members)} members", lambda: [check_condition(payload, None, m) for m in members], 200)
+    bench("select_highest_priority_rule", lambda: select_highest_priority_rule(matches), 2000)
+    bench("apply_rules (legacy, per payload)", lambda: apply_rules(payload, transcoded), 50)
+    bench("CompiledRuleSet.evaluate (per payload)", lambda: rule_set.evaluate(payload), 2000)
+    bench(f"evaluate x {len(payloads)} payloads", lambda: [rule_set.evaluate(p) for p in payloads], 50)
+
+
+if __name__ == "__main__":
+    main()
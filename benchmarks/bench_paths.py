@@ -0,0 +1,52 @@
+"""
+Micro-benchmark of the compiled path accessors of ceh_utils.paths against the
+regex split + get_value_from_path walk used before.
+
+Usage:
+    python -m benchmarks.bench_paths
+"""
+# CORE
+import json
+import re
+import timeit
+
+# OWN
+from data.rules_data.path_transcoding import path_transcoding
+from ceh_utils.tools import get_value_from_path
+from ceh_utils.paths import compile_path
+
+
+FIXTURE = './tests/cas_de_test/test_01.json'
+NUMBER = 20000
+
+
+def regex_lookup(ceh_data, data_path):
+    path_parts = re.split(r'\.|\[|\]', data_path.replace(']', ''))
+    return get_value_from_path(ceh_data, path_parts)
+
+
+def main():
+    with open(FIXTURE) as f:
+        payload = json.load(f)
+    paths = list(path_transcoding.values())
+    compiled = [compile_path(path) for path in paths]
+
+    for path, compiled_path in zip(paths, compiled):
+        assert regex_lookup(payload, path) == compiled_path.resolve(payload), path
+
+    candidates = {
+        "re.split + get_value_from_path": lambda: [regex_lookup(payload, path) for path in paths],
+        "compile_path (LRU) + resolve": lambda: [compile_path(path).resolve(payload) for path in paths],
+        "precompiled resolve": lambda: [compiled_path.resolve(payload) for compiled_path in compiled],
+    }
+    print(f"{len(paths)} paths per iteration, {NUMBER} iterations")
+    for name, function in candidates.items():
+        seconds = min(timeit.repeat(function, number=NUMBER, repeat=3))
+        print(f"{name:>32}: {seconds / NUMBER / len(paths) * 1e9:8.0f} ns/path")
+
+    wildcard = compile_path("flows[*].documents[*].type")
+    print(f"{'flows[*].documents[*].type':>32}: {wildcard.resolve(payload)}")
+
+
+if __name__ == "__main__":
+    main()
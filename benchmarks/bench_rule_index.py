@@ -0,0 +1,78 @@
+"""
+Benchmark of the indexed rule matching of ceh_utils.engine against a linear
+evaluation of every rule, for rule sets from 10 to 10,000 rules.
+
+Usage:
+    python -m benchmarks.bench_rule_index
+"""
+# CORE
+from datetime import date
+import json
+import logging
+import random
+import time
+
+# OWN
+from data.rules_data.path_transcoding import path_transcoding
+from ceh_utils.engine import compile_rules
+
+
+RULE_COUNTS = (10, 100, 1000, 10000)
+FIXTURE = './tests/cas_de_test/test_01.json'
+
+
+def generate_rules(count, seed=0):
+    """
+    Generate `count` rules of 1 to 3 members over the transcoded paths, with equality
+    values that mostly do not match the fixture and a few numeric ranges.
+    """
+    rng = random.Random(seed)
+    transcoding = dict(path_transcoding, **{"temps d'attente": "_embedded.documents[0].content.collectedData.waitingTime"})
+    names = list(path_transcoding)
+    rules = []
+    for i in range(count):
+        members = {}
+        for j in range(rng.randint(1, 3)):
+            if rng.random() < 0.2:
+                members[f"member_{j}"] = {"path": "temps d'attente", "value": f"> {rng.randint(0, 1000)} or < {rng.randint(0, 10)}"}
+            else:
+                members[f"member_{j}"] = {"path": rng.choice(names), "value": f"value_{rng.randint(0, count)}"}
+        rules.append({"conditions": {
+            "condition_members": members,
+            "message": f"message {i}",
+            "priority": rng.randint(1, 3),
+            "created_at": date(2023, 1, 1),
+            "name": f"rule {i}",
+            "code": f"RULE_{i}",
+        }})
+    return rules, transcoding
+
+
+def measure(function, payload, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(payload)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    logging.disable(logging.WARNING)
+    with open(FIXTURE) as f:
+        payload = json.load(f)
+    payload['_embedded']['documents'][0]['content']['collectedData']['waitingTime'] = 12
+
+    print(f"{'rules':>8} {'linear (us)':>14} {'indexed (us)':>14}")
+    for count in RULE_COUNTS:
+        rules, transcoding = generate_rules(count)
+        rule_set = compile_rules(rules, transcoding)
+        repeat = max(20, 20000 // count)
+
+        def linear(ceh_data):
+            return [rule for rule in rule_set.rules if rule.matches(ceh_data)]
+
+        assert [rule_set.rules.index(rule) for rule in linear(payload)] == rule_set.matching_rule_ids(payload)
+        print(f"{count:>8} {measure(linear, payload, repeat):>14.1f} {measure(rule_set.matching_rule_ids, payload, repeat):>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
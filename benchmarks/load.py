@@ -0,0 +1,298 @@
+"""
+In-process load test of the FastAPI app: requests go through httpx.ASGITransport
+(no network, no uvicorn) and OpenAI is replaced by benchmarks.openai_stub, so the
+figures measure the application code. The CEH rules are a synthetic rule set of
+--rules rules (benchmarks.synthetic).
+
+Reports p50/p95/p99 latency and throughput per endpoint. Absolute figures depend on
+the host, so the regression check compares with a baseline measured in the same
+session on the same host: with --against REF, the same load test is first run on
+REF (a git worktree, with this version of the benchmarks package), and the command
+exits with 1 when an endpoint is slower than on REF by more than --tolerance.
+
+The stored baseline (--save-baseline) is only shown for information.
+
+Usage:
+    python -m benchmarks.load [--requests 300] [--concurrency 16] [--rules 1000]
+                              [--openai-delay 0.05] [--only /ceh ...] [--against main]
+                              [--baseline benchmarks/baseline.json] [--save-baseline]
+                              [--tolerance 0.5] [--output results.json]
+"""
+# CORE
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# THIRD PARTY
+import httpx
+import yaml
+
+# OWN
+from benchmarks.openai_stub import create_openai_stub
+from benchmarks.synthetic import generate_payloads, generate_rules
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baseline.json")
+CLIENT_SECRET = "benchmark"
+
+Scenario = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def prepare_environment(directory: str, rules_count: int) -> Dict[str, str]:
+    """Write the synthetic rules and point the app settings to `directory` (before importing main)."""
+    rules, transcoding = generate_rules(rules_count)
+    rules_path = os.path.join(directory, "rules.yaml")
+    transcoding_path = os.path.join(directory, "path_transcoding.py")
+    with open(rules_path, "w") as f:
+        yaml.safe_dump(rules, f, allow_unicode=True)
+    with open(transcoding_path, "w") as f:
+        f.write(f"path_transcoding = {transcoding!r}\n")
+
+    os.environ.update({
+        "UPLOAD_DIR": os.path.join(directory, "uploads"),
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": "http://openai.stub/v1",
+        "CLIENT_SECRET": CLIENT_SECRET,
+        "RULES_POLL_INTERVAL": "3600",
+        "RH_EVAL_CACHE_PATH": "",
+        # Mesure de la soumission des travaux, pas du refus quand la file est pleine
+        "METHODE_JOB_MAX_PENDING": "100000",
+    })
+    return {"rules": rules_path, "transcoding": transcoding_path}
+
+
+def build_scenarios(payloads: List[Dict[str, Any]]) -> Dict[str, Scenario]:
+    ndjson = "\n".join(json.dumps(payload) for payload in payloads[:50])
+    answers = [f"réponse numéro {i % 20} de l'apprenant" for i in range(1000)]
+    pdfs = [b"%PDF-1.4\n% benchmark document " + str(i).encode() for i in range(4)]
+
+    async def ceh(client, i):
+        return await client.post("/ceh", json=payloads[i % len(payloads)])
+
+    async def ceh_batch(client, i):
+        return await client.post("/ceh/batch", content=ndjson)
+
+    async def rh_question(client, i):
+        return await client.post("/rh/get_question", json={"survey_name": "set_questions_reponses.csv"})
+
+    async def rh_evaluation(client, i):
+        # 20 réponses distinctes: la plupart des requêtes sont servies par le cache d'évaluations
+        return await client.post("/rh/get_evaluation", json={
+            "survey_name": "set_questions_reponses.csv", "question_id": 1 + i % 5,
+            "client_secret": CLIENT_SECRET, "user_answer": answers[i % len(answers)]})
+
+    async def breakdown(client, i):
+        start = await client.post("/breakdown/get_classif", json={
+            "user_answer": "la voiture ne démarre pas", "client_secret": CLIENT_SECRET,
+            "problem": "suspicion_panne_moteur"})
+        return await client.post("/breakdown/get_classif", json={
+            "user_answer": "oui" if i % 2 else "non", "client_secret": CLIENT_SECRET,
+            "conversation_id": start.json()["conversation_id"]})
+
+    async def methode(client, i):
+        return await client.post("/methode/redacteur", params={"user_question": "Que couvre le contrat ?"},
+                                 files={"file": ("contrat.pdf", pdfs[i % len(pdfs)], "application/pdf")})
+
+    async def health(client, i):
+        return await client.get("/health")
+
+    async def metrics(client, i):
+        return await client.get("/metrics")
+
+    return {
+        "POST /ceh": ceh,
+        "POST /ceh/batch (50 docs)": ceh_batch,
+        "POST /rh/get_question": rh_question,
+        "POST /rh/get_evaluation": rh_evaluation,
+        "POST /breakdown/get_classif (2 turns)": breakdown,
+        "POST /methode/redacteur (submit)": methode,
+        "GET /health": health,
+        "GET /metrics": metrics,
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int,
+                       concurrency: int) -> Dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, i)
+                failed = response.status_code >= 400
+            except Exception as e:
+                logging.error("Request %d failed: %s", i, e)
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    # Quelques requêtes de chauffe (imports paresseux, caches) hors mesure
+    for i in range(min(3, requests)):
+        await scenario(client, i)
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rps": requests / elapsed if elapsed else 0.0,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """Regressions: p95 above the baseline by more than `tolerance`, throughput below it, or new errors."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if result["errors"] > reference["errors"]:
+            regressions.append(f"{name}: {result['errors']} errors > baseline {reference['errors']}")
+        if result["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.2f} ms > baseline {reference['p95_ms']:.2f} ms")
+        if result["rps"] < reference["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['rps']:.0f} req/s < baseline {reference['rps']:.0f} req/s")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]],
+                 label: str = "base") -> None:
+    print(f"{'endpoint':<40} {'n':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'p95 vs ' + label:>12}")
+    for name, result in results.items():
+        reference = (baseline or {}).get(name)
+        delta = f"{(result['p95_ms'] / reference['p95_ms'] - 1) * 100:+.0f}%" if reference and reference["p95_ms"] else ""
+        print(f"{name:<40} {result['requests']:>6} {result['errors']:>4} {result['p50_ms']:>9.2f} "
+              f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['rps']:>9.0f} {delta:>12}")
+
+
+async def run(args: argparse.Namespace, paths: Dict[str, str]) -> Dict[str, Dict[str, float]]:
+    import main
+    from llm_utils import client as llm_client
+    from routers import ceh as ceh_routes
+
+    ceh_routes.RULES_PATH, ceh_routes.TRANSCODING_PATH = paths["rules"], paths["transcoding"]
+    stub = create_openai_stub(args.openai_delay)
+    llm_client._llm_client = llm_client.LLMClient(http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=stub)))
+
+    scenarios = build_scenarios(generate_payloads(200))
+    if args.only:
+        scenarios = {name: scenario for name, scenario in scenarios.items() if any(o in name for o in args.only)}
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+            results = {}
+            for name, scenario in scenarios.items():
+                results[name] = await run_scenario(client, scenario, args.requests, args.concurrency)
+    print(f"OpenAI stub calls: {stub.state.calls}")
+    return results
+
+
+def run_reference(ref: str, args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    """
+    Run the same load test on the git ref `ref`, in a temporary worktree and a separate
+    process: the baseline is measured on this host, in this session.
+
+    The benchmarks package of the current tree replaces the one of `ref`, so that both
+    runs use the same scenarios and the same OpenAI stub.
+    """
+    repository = os.path.dirname(BENCHMARKS_DIR)
+    with tempfile.TemporaryDirectory() as directory:
+        worktree, output = os.path.join(directory, "tree"), os.path.join(directory, "results.json")
+        subprocess.run(["git", "-C", repository, "worktree", "add", "--detach", worktree, ref],
+                       check=True, capture_output=True)
+        try:
+            shutil.copytree(BENCHMARKS_DIR, os.path.join(worktree, "benchmarks"), dirs_exist_ok=True,
+                            ignore=shutil.ignore_patterns("__pycache__", "baseline.json"))
+            command = [sys.executable, "-m", "benchmarks.load", "--output", output, "--baseline", "",
+                       "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+                       "--rules", str(args.rules), "--openai-delay", str(args.openai_delay)]
+            if args.only:
+                command += ["--only", *args.only]
+            print(f"Baseline: load test of {ref}")
+            subprocess.run(command, cwd=worktree, check=True)
+            with open(output) as f:
+                return json.load(f)
+        finally:
+            subprocess.run(["git", "-C", repository, "worktree", "remove", "--force", worktree], capture_output=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rules", type=int, default=1000, help="size of the synthetic rule set")
+    parser.add_argument("--openai-delay", type=float, default=0.05, help="latency of the OpenAI stub (seconds)")
+    parser.add_argument("--only", nargs="*", help="only the endpoints whose name contains one of these strings")
+    parser.add_argument("--against", metavar="REF", help="git ref measured first in this session, as the baseline to compare with")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="stored baseline, shown when --against is not given")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new stored baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative regression (sub-millisecond endpoints are noisy)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+    logging.disable(logging.WARNING)
+
+    # La référence d'abord, avant que l'environnement de ce processus ne soit modifié
+    reference = run_reference(args.against, args) if args.against else None
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = prepare_environment(directory, args.rules)
+        results = asyncio.run(run(args, paths))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if reference is None:
+        baseline = None
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        # Chiffres absolus d'une autre machine ou d'une autre session: affichés, pas comparés
+        print_report(results, baseline)
+    else:
+        print_report(results, reference, label=args.against)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+
+    regressions = compare(results, reference, args.tolerance) if reference is not None else []
+    regressions += [f"{name}: {result['errors']} errors" for name, result in results.items()
+                    if result["errors"] and (reference is None or name not in reference)]
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Local stand-in for the OpenAI API used by the load tests: the endpoints called by
+llm_utils / methodes_utils, answering canned objects after a configurable delay.
+It is an ASGI app, mounted in-process with httpx.ASGITransport.
+"""
+# CORE
+from typing import Any, Dict
+import asyncio
+import itertools
+import json
+import time
+
+# THIRD PARTY
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+
+EVALUATION = json.dumps({"response": "Bonne réponse, bravo.", "score": 80}, ensure_ascii=False)
+
+
+def create_openai_stub(delay: float = 0.05) -> Starlette:
+    """
+    Args:
+        delay: seconds spent by every model call (completions and runs), to emulate
+            the latency of the API.
+    """
+    ids = itertools.count()
+    calls: Dict[str, int] = {}
+
+    def new(kind: str, **fields: Any) -> Dict[str, Any]:
+        return dict({"id": f"{kind.split('.')[-1]}_{next(ids)}", "object": kind, "created_at": int(time.time())},
+                    **fields)
+
+    def counted(path: str) -> None:
+        calls[path] = calls.get(path, 0) + 1
+
+    async def chat_completions(request: Request) -> Response:
+        counted("chat.completions")
+        body = await request.json()
+        system = body["messages"][0]["content"]
+        if "json" in system:
+            content = EVALUATION
+        elif "catégories" in system:
+            content = "A"
+        else:
+            content = "True"
+        await asyncio.sleep(delay)
+        usage = {"prompt_tokens": sum(len(m["content"]) // 4 for m in body["messages"]),
+                 "completion_tokens": len(content) // 4, "total_tokens": 0}
+        if body.get("stream"):
+            chunks = [{"id": "chatcmpl", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                       "choices": [{"index": 0, "delta": {"content": content[i:i + 8]}, "finish_reason": None}]}
+                      for i in range(0, len(content), 8)]
+            data = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+            return Response(data, media_type="text/event-stream")
+        return JSONResponse({"id": "chatcmpl", "object": "chat.completion", "created": 0, "model": body["model"],
+                             "usage": usage, "choices": [{"index": 0, "finish_reason": "stop",
+                                                          "message": {"role": "assistant", "content": content}}]})
+
+    async def assistants(request: Request) -> Response:
+        if request.method == "GET":
+            return JSONResponse({"object": "list", "data": [], "has_more": False})
+        body = await request.json()
+        return JSONResponse(new("assistant", name=body.get("name"), model=body["model"], tools=body.get("tools", []),
+                                instructions=body.get("instructions"), metadata=body.get("metadata")))
+
+    async def vector_stores(request: Request) -> Response:
+        body = await request.json()
+        return JSONResponse(new("vector_store", name=body.get("name"), usage_bytes=0, status="completed",
+                                last_active_at=0, metadata=None, file_counts=_file_counts()))
+
+    async def vector_store(request: Request) -> Response:
+        return JSONResponse({"id": request.path_params["vector_store_id"], "object": "vector_store.deleted",
+                             "deleted": True})
+
+    async def files(request: Request) -> Response:
+        await request.body()
+        return JSONResponse(new("file", bytes=1, filename="document.pdf", purpose="assistants", status="processed"))
+
+    async def file(request: Request) -> Response:
+        return JSONResponse({"id": request.path_params["file_id"], "object": "file", "deleted": True})
+
+    async def file_batches(request: Request) -> Response:
+        await asyncio.sleep(delay)
+        return JSONResponse(dict(new("vector_store.files_batch"), vector_store_id=request.path_params["vector_store_id"],
+                                 status="completed", file_counts=_file_counts()))
+
+    async def file_batch(request: Request) -> Response:
+        return JSONResponse({"id": request.path_params["batch_id"], "object": "vector_store.files_batch",
+                             "created_at": 0, "vector_store_id": request.path_params["vector_store_id"],
+                             "status": "completed", "file_counts": _file_counts()})
+
+    async def threads(request: Request) -> Response:
+        body = await request.json()
+        return JSONResponse(new("thread", metadata=None, tool_resources=body.get("tool_resources")))
+
+    def run_object(thread_id: str, run_id: str, assistant_id: str = "asst") -> Dict[str, Any]:
+        return {"id": run_id, "object": "thread.run", "created_at": 0, "thread_id": thread_id,
+                "assistant_id": assistant_id, "status": "completed", "instructions": "", "model": "gpt-4o",
+                "tools": [], "parallel_tool_calls": True, "truncation_strategy": None, "usage": None}
+
+    async def runs(request: Request) -> Response:
+        counted("runs")
+        body = await request.json()
+        await asyncio.sleep(delay)
+        return JSONResponse(run_object(request.path_params["thread_id"], f"run_{next(ids)}", body["assistant_id"]))
+
+    async def run(request: Request) -> Response:
+        return JSONResponse(run_object(request.path_params["thread_id"], request.path_params["run_id"]))
+
+    async def messages(request: Request) -> Response:
+        message = new("thread.message", thread_id=request.path_params["thread_id"], role="assistant",
+                      status="completed", attachments=[], metadata=None,
+                      content=[{"type": "text", "text": {"value": "Réponse du stub.", "annotations": []}}])
+        return JSONResponse({"object": "list", "data": [message], "has_more": False})
+
+    async def stats(request: Request) -> Response:
+        return JSONResponse(calls)
+
+    app = Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/assistants", assistants, methods=["GET", "POST"]),
+        Route("/v1/vector_stores", vector_stores, methods=["POST"]),
+        Route("/v1/vector_stores/{vector_store_id}", vector_store, methods=["DELETE"]),
+        Route("/v1/vector_stores/{vector_store_id}/file_batches", file_batches, methods=["POST"]),
+        Route("/v1/vector_stores/{vector_store_id}/file_batches/{batch_id}", file_batch, methods=["GET"]),
+        Route("/v1/files", files, methods=["POST"]),
+        Route("/v1/files/{file_id}", file, methods=["DELETE"]),
+        Route("/v1/threads", threads, methods=["POST"]),
+        Route("/v1/threads/{thread_id}/runs", runs, methods=["POST"]),
+        Route("/v1/threads/{thread_id}/runs/{run_id}", run, methods=["GET"]),
+        Route("/v1/threads/{thread_id}/messages", messages, methods=["GET"]),
+        Route("/stub/stats", stats, methods=["GET"]),
+    ])
+    app.state.calls = calls
+    return app
+
+
+def _file_counts() -> Dict[str, int]:
+    return {"in_progress": 0, "completed": 1, "failed": 0, "cancelled": 0, "total": 1}
@@ -0,0 +1,94 @@
+"""
+Synthetic CEH payloads and rule sets for the benchmarks: the fixture
+tests/cas_de_test/test_01.json with its rule fields drawn from small value pools,
+and rules drawn from the same pools so that a realistic share of them match.
+"""
+# CORE
+from datetime import date
+from typing import Any, Dict, List, Tuple
+import copy
+import json
+import random
+
+# OWN
+from data.rules_data.path_transcoding import path_transcoding
+
+
+FIXTURE = './tests/cas_de_test/test_01.json'
+WAITING_TIME = "temps d'attente"
+TRANSCODING = dict(path_transcoding, **{WAITING_TIME: "_embedded.documents[0].content.collectedData.waitingTime"})
+
+VALUE_POOLS: Dict[str, List[Any]] = {
+    "à la maison": [True, False],
+    "autoroute": [True, False],
+    "type d'incident véhicule": ["panne", "accident"],
+    "effet client véhicule": ["demarrage", "crevaison", "batterie", "cle"],
+    "contexte final": ["domicile", "route", "parking"],
+    "assureur": ["MC", "MAIF", "MACIF", "AXA"],
+    "benef insultant": [True, False],
+    "nom de la rue": ["rue de la Paix", "avenue Foch", "boulevard Victor Hugo"],
+    "ville": ["Lille", "Paris", "Lyon", "Niort"],
+    "departement": ["59", "75", "69", "79"],
+    "type de demande": ["Claim", "RoadSideAssistance"],
+    "is abuser": [True, False],
+    "intent": ["assistance_habitation", "assistance_deces", "assistance_auto"],
+}
+
+
+def load_fixture(path: str = FIXTURE) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _set_path(data: Dict[str, Any], path: str, value: Any) -> None:
+    # Chemins du transcodage: clefs séparées par des points, index de liste entre crochets
+    parts = path.replace("]", "").replace("[", ".").split(".")
+    for part in parts[:-1]:
+        if isinstance(data, list):
+            data = data[int(part)]
+        else:
+            data = data.setdefault(part, {})
+    data[parts[-1]] = value
+
+
+def generate_payloads(count: int, seed: int = 0, fixture: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """`count` copies of the fixture with every rule field drawn at random from VALUE_POOLS."""
+    rng = random.Random(seed)
+    fixture = fixture or load_fixture()
+    payloads = []
+    for i in range(count):
+        payload = copy.deepcopy(fixture)
+        payload["id"] = f"synthetic-{seed}-{i}"
+        for name, pool in VALUE_POOLS.items():
+            _set_path(payload, TRANSCODING[name], rng.choice(pool))
+        _set_path(payload, TRANSCODING[WAITING_TIME], rng.randint(0, 120))
+        payloads.append(payload)
+    return payloads
+
+
+def generate_rules(count: int, seed: int = 0) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """
+    `count` rules of 2 to 5 members drawn from VALUE_POOLS (plus a waiting time range
+    for one rule in five), without validity so that they never expire.
+
+    Returns:
+        The rules (rules.yaml structure) and the transcoding they need.
+    """
+    rng = random.Random(seed)
+    names = list(VALUE_POOLS)
+    rules = []
+    for i in range(count):
+        members = {}
+        for j, name in enumerate(rng.sample(names, rng.randint(2, 5))):
+            members[f"member_{j}"] = {"path": name, "value": rng.choice(VALUE_POOLS[name])}
+        if rng.random() < 0.2:
+            members["waiting"] = {"path": WAITING_TIME, "value": f"> {rng.randint(10, 110)} or < {rng.randint(0, 5)}"}
+        rules.append({"conditions": {
+            "condition_members": members,
+            "message": f"message {i}",
+            "priority": rng.randint(1, 3),
+            "created_at": date(2023, 1, rng.randint(1, 28)),
+            "name": f"rule {i}",
+            "code": f"RULE_{i}",
+        }})
+    return rules, TRANSCODING
@@ -0,0 +1,516 @@
+# CORE
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+import asyncio
+import json
+import logging
+import os
+import re
+import unicodedata
+import uuid
+
+# OWN
+from breakdown_spec_utils.sessions import create_session_store
+from breakdown_spec_utils.tools import load_prompts, load_questions_from_yaml
+from llm_utils.client import get_llm_client
+
+
+END = "END"
+YES_NO = "yes_no"
+MODEL_CLASSIFICATION = "model_classification"
+CLASSIF_PREFIX = "if_classif_"
+
+BREAKDOWN_MODEL = "gpt-4o"
+BREAKDOWN_MAX_SESSIONS = int(os.environ.get("BREAKDOWN_MAX_SESSIONS", 10000))
+# Une conversation sans réponse pendant ce délai (secondes) est oubliée
+BREAKDOWN_SESSION_TTL = float(os.environ.get("BREAKDOWN_SESSION_TTL", 30 * 60))
+# Appels au modèle simultanés pour un même tour de conversation
+BREAKDOWN_MAX_CONCURRENCY = int(os.environ.get("BREAKDOWN_MAX_CONCURRENCY", 4))
+
+# Prompt des questions oui/non qui n'ont pas le leur dans prompts_list.json
+DEFAULT_YES_NO_PROMPT = ("L'utilisateur va répondre par oui ou par non à une question donnée. Transforme sa réponse "
+                         "en booléen True ou False. Ne fait ni propos introductif, ni conclusion. Je veux juste le booléen.")
+# Réponse du modèle quand la réponse de l'utilisateur ne tranche pas la question (plusieurs questions posées)
+NOT_ADDRESSED = "NON_TRAITE"
+NOT_ADDRESSED_INSTRUCTION = ("\nPlusieurs questions ont été posées ensemble à l'utilisateur. Si sa réponse ne répond pas "
+                             f"clairement à la question donnée, réponds uniquement {NOT_ADDRESSED}, sans rien deviner.")
+
+
+class Outcome(NamedTuple):
+    label: str              # "yes", "no" ou la lettre de la classification
+    message: str
+    moyen: Optional[str]
+    code_breakdown: Optional[str]
+    next: str               # id de la question suivante ou END
+
+
+class QuestionNode(NamedTuple):
+    id: str
+    text: str
+    type: str
+    outcomes: Dict[str, Outcome]
+    prompt: Optional[str]
+
+
+class ProblemGraph(NamedTuple):
+    name: str
+    first_question: str
+    nodes: Dict[str, QuestionNode]
+
+
+def _outcome(label: str, branch: Dict[str, Any]) -> Outcome:
+    return Outcome(label, branch.get('message', ''), branch.get('moyen'), branch.get('code_breakdown'),
+                   branch.get('next', END))
+
+
+def compile_graph(parcours: Any, prompts: Dict[str, str]) -> Dict[str, ProblemGraph]:
+    """
+    Compile parcours.yml into one graph per problem, indexed by question id.
+
+    Every "next" must name a question of the same problem (or END), yes/no questions
+    need both branches, and classification questions need a prompt. A yes/no question
+    without a prompt falls back to DEFAULT_YES_NO_PROMPT; prompts that match no
+    question are reported as warnings.
+
+    Raises:
+        ValueError: with every problem found.
+    """
+    errors: List[str] = []
+    if not isinstance(parcours, dict) or not isinstance(parcours.get('problems'), list):
+        raise ValueError("parcours must have a 'problems' list")
+
+    graphs: Dict[str, ProblemGraph] = {}
+    question_ids = set()
+    for position, problem in enumerate(parcours['problems']):
+        name = problem.get('name') if isinstance(problem, dict) else None
+        questions = problem.get('questions') if isinstance(problem, dict) else None
+        if not name or not questions:
+            errors.append(f"problem #{position}: missing 'name' or 'questions'")
+            continue
+        if name in graphs:
+            errors.append(f"problem {name}: defined twice")
+
+        nodes: Dict[str, QuestionNode] = {}
+        for question in questions:
+            question_id, question_type = question.get('id'), question.get('type')
+            where = f"problem {name}, question {question_id}"
+            if not question_id or not question.get('text'):
+                errors.append(f"problem {name}: question without 'id' or 'text'")
+                continue
+            if question_id in nodes:
+                errors.append(f"{where}: defined twice")
+
+            if question_type == YES_NO:
+                missing = [branch for branch in ('if_yes', 'if_no') if not isinstance(question.get(branch), dict)]
+                if missing:
+                    errors.append(f"{where}: missing {', '.join(missing)}")
+                    continue
+                outcomes = {"yes": _outcome("yes", question['if_yes']), "no": _outcome("no", question['if_no'])}
+                prompt = prompts.get(question_id, DEFAULT_YES_NO_PROMPT)
+            elif question_type == MODEL_CLASSIFICATION:
+                outcomes = {key[len(CLASSIF_PREFIX):]: _outcome(key[len(CLASSIF_PREFIX):], branch)
+                            for key, branch in question.items() if key.startswith(CLASSIF_PREFIX)}
+                if not outcomes:
+                    errors.append(f"{where}: no '{CLASSIF_PREFIX}*' branch")
+                prompt = prompts.get(question_id)
+                if not prompt:
+                    errors.append(f"{where}: no prompt in prompts_list.json")
+            else:
+                errors.append(f"{where}: unknown type {question_type!r}")
+                continue
+
+            nodes[question_id] = QuestionNode(question_id, question['text'], question_type, outcomes, prompt)
+            question_ids.add(question_id)
+
+        for node in nodes.values():
+            for outcome in node.outcomes.values():
+                if outcome.next != END and outcome.next not in nodes:
+                    errors.append(f"problem {name}, question {node.id}: unknown next {outcome.next!r}")
+        if nodes:
+            graphs[name] = ProblemGraph(name, questions[0].get('id'), nodes)
+
+    for prompt_id in prompts.keys() - question_ids:
+        logging.warning("Prompt %r matches no breakdown question", prompt_id)
+    if errors:
+        raise ValueError("; ".join(errors))
+    return graphs
+
+
+def load_graph(parcours_path: str, prompts_path: str) -> Dict[str, ProblemGraph]:
+    return compile_graph(load_questions_from_yaml(parcours_path), load_prompts(prompts_path))
+
+
+def normalize_text(text: str) -> str:
+    """Minuscules, sans accents ni ponctuation."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"\w+", text))
+
+
+# Un mot positif précédé ou suivi de "pas" ("pas tout a fait", "absolument pas") n'est pas un oui
+YES_PATTERN = re.compile(r"(?<!pas )\b(oui|ouais|ouai|yes|yep|ok|okay|exact|exactement|effectivement|affirmatif"
+                         r"|absolument|bien sur|tout a fait|en effet|c est ca|d accord|evidemment|certainement"
+                         r"|carrement)\b(?! pas\b)")
+# Seulement des réponses franchement négatives: "pas", "aucun" ou "rien" seuls se trouvent aussi dans les doutes
+NO_PATTERN = re.compile(r"\b(non|nan|no|nope|negatif|nullement|pas du tout|absolument pas|certainement pas"
+                        r"|surement pas|bien sur que non|jamais de la vie)\b")
+# Doutes ("je ne sais pas", "pas sur", "aucune idee"...): laissés au modèle
+UNCERTAIN_PATTERN = re.compile(r"\b(sais pas|sait pas|sais rien|sais plus|sait plus|aucune idee|aucun idee|pas sur|pas sure"
+                               r"|pas certain|pas certaine|peut etre|probablement|possible|je crois|je pense"
+                               r"|il me semble|me souviens pas|rappelle pas|j ignore|ca depend|difficile a dire)\b")
+
+
+def match_yes_no(answer: str) -> Optional[bool]:
+    """
+    Réponse oui/non reconnue sans modèle: True, False, ou None si la réponse est
+    ambiguë (aucun mot-clef, des mots-clefs des deux sens, ou un doute).
+    """
+    text = normalize_text(answer)
+    if text == "si":
+        return True
+    if UNCERTAIN_PATTERN.search(text):
+        return None
+    is_yes, is_no = YES_PATTERN.search(text) is not None, NO_PATTERN.search(text) is not None
+    if is_yes != is_no:
+        return is_yes
+    return None
+
+
+async def ask_model(node: QuestionNode, answer: str, asked: Tuple[str, ...] = ()) -> str:
+    """
+    La réponse du modèle pour la question `node`; `asked` liste les questions posées
+    ensemble à l'utilisateur, le modèle peut alors répondre NOT_ADDRESSED.
+    """
+    llm = get_llm_client()
+    prompt, content = node.prompt, f"Question: {node.text}\nRéponse: {answer}"
+    if asked:
+        prompt += NOT_ADDRESSED_INSTRUCTION
+        content = "Questions posées: " + " / ".join(asked) + "\n" + content
+    completion = await llm.call(
+        llm.client.chat.completions.create,
+        model=BREAKDOWN_MODEL,
+        messages=[
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": content},
+        ],
+        temperature=0,
+    )
+    return completion.choices[0].message.content or ""
+
+
+def parse_model_label(node: QuestionNode, content: str) -> Optional[str]:
+    """
+    Branche choisie d'après la réponse du modèle, None s'il indique que la réponse
+    ne traite pas la question (NOT_ADDRESSED).
+
+    Raises:
+        ValueError: si la réponse ne désigne aucune branche de la question.
+    """
+    if NOT_ADDRESSED.lower() in normalize_text(content):
+        return None
+    if node.type == YES_NO:
+        text = normalize_text(content)
+        if re.search(r"\b(true|vrai|oui)\b", text):
+            return "yes"
+        if re.search(r"\b(false|faux|non)\b", text):
+            return "no"
+    else:
+        for letter in re.findall(r"\b([A-Z])\b", content):
+            if letter in node.outcomes:
+                return letter
+    raise ValueError(f"Unexpected model answer for {node.id}: {content!r}")
+
+
+class Step(NamedTuple):
+    question_id: str
+    answer: str
+    outcome: Outcome
+    resolved_by: str  # "local" ou "model"
+
+
+class Session(NamedTuple):
+    problem: str
+    question_id: str
+    steps: Tuple[Step, ...]
+
+
+class MultiSession(NamedTuple):
+    # Tous les problèmes candidats suivis en parallèle; question_id vaut END une fois le parcours fini
+    candidates: Tuple[Session, ...]
+
+
+def encode_session(session: Union[Session, MultiSession]) -> str:
+    """The conversation as JSON text, for the session store (the named tuples become lists)."""
+    multi = isinstance(session, MultiSession)
+    return json.dumps({"multi": multi, "candidates": session.candidates if multi else (session,)}, ensure_ascii=False)
+
+
+def decode_session(text: str) -> Union[Session, MultiSession]:
+    data = json.loads(text)
+    candidates = tuple(Session(problem, question_id, tuple(Step(step_question, answer, Outcome(*outcome), resolved_by)
+                                                           for step_question, answer, outcome, resolved_by in steps))
+                       for problem, question_id, steps in data["candidates"])
+    return MultiSession(candidates) if data["multi"] else candidates[0]
+
+
+class BreakdownEngine:
+    """
+    Runs the breakdown decision graphs: one session per conversation (bounded in number
+    and idle time, in memory or in the SQLite file shared by the workers, see
+    breakdown_spec_utils.sessions) remembers the problem and the current question.
+
+    Yes/no answers are resolved locally by keywords when they are unambiguous; the
+    model is only called for the ambiguous ones and for classification questions.
+
+    start_all() follows every candidate problem in the same conversation: each answer
+    is resolved against all the pending questions concurrently, a question shared by
+    several problems being resolved once, and the candidates are ranked.
+
+    The opening message (the user's description of the problem) is applied to the first
+    questions by the model, which leaves the questions it does not answer to be asked.
+    """
+
+    def __init__(self, graphs: Dict[str, ProblemGraph], max_sessions: int = BREAKDOWN_MAX_SESSIONS,
+                 session_ttl: float = BREAKDOWN_SESSION_TTL, sessions: Optional[Any] = None):
+        self.graphs = graphs
+        self.sessions = sessions if sessions is not None else create_session_store(max_sessions, session_ttl)
+        self.local_resolutions = 0
+        self.model_resolutions = 0
+
+    async def has_session(self, conversation_id: str) -> bool:
+        """Whether the conversation is still open (not finished nor expired)."""
+        return await self.sessions.get(conversation_id) is not None
+
+    async def _save(self, conversation_id: str, session: Union[Session, MultiSession]) -> None:
+        await self.sessions.set(conversation_id, encode_session(session))
+
+    async def start(self, problem: str, conversation_id: Optional[str] = None, opening: str = "") -> Dict[str, Any]:
+        """
+        Open a conversation on `problem` and return its first question, or the next one
+        when the `opening` message already answers it.
+
+        Raises:
+            KeyError: if the problem is unknown.
+        """
+        if problem not in self.graphs:
+            raise KeyError(f"Unknown problem: {problem}")
+        conversation_id = conversation_id or uuid.uuid4().hex
+        session = Session(problem, self.graphs[problem].first_question, ())
+        if opening:
+            return await self._answer_one(conversation_id, session, opening, opening=True)
+        await self._save(conversation_id, session)
+        return {"conversation_id": conversation_id, "problem": problem, "done": False,
+                "question": self._question(self.graphs[problem].nodes[session.question_id])}
+
+    async def resolve_label(self, node: QuestionNode, answer: str, asked: Tuple[str, ...] = (),
+                            local: bool = True) -> Tuple[Optional[str], str]:
+        """
+        The branch label matching the answer ("yes", "no" or a classification letter),
+        and whether it was resolved "local"ly or by the "model".
+
+        A yes/no answer without ambiguity is resolved by keywords, even with several
+        questions `asked` together (a plain "oui" answers all of them); otherwise the
+        model decides, and with `asked` the label is None when the answer does not
+        address `node`. `local=False` skips the keywords, for a message that was not an
+        answer to the question (the opening message).
+
+        Raises:
+            ValueError: if the model answer matches no branch.
+        """
+        if node.type == YES_NO and local:
+            is_yes = match_yes_no(answer)
+            if is_yes is not None:
+                self.local_resolutions += 1
+                return "yes" if is_yes else "no", "local"
+        self.model_resolutions += 1
+        return parse_model_label(node, await ask_model(node, answer, asked)), "model"
+
+    async def resolve(self, node: QuestionNode, answer: str) -> Tuple[Outcome, str]:
+        """
+        The branch matching the answer, and whether it was resolved "local"ly or by the "model".
+
+        Raises:
+            ValueError: if the model answer matches no branch.
+        """
+        label, resolved_by = await self.resolve_label(node, answer)
+        if label is None:
+            raise ValueError(f"Unexpected model answer for {node.id}: {NOT_ADDRESSED}")
+        return node.outcomes[label], resolved_by
+
+    async def answer(self, conversation_id: str, answer: str) -> Dict[str, Any]:
+        """
+        Apply the answer to the current question of the conversation and return the
+        next question, or the final result once the path reaches END.
+
+        Raises:
+            KeyError: if the conversation is unknown or expired.
+        """
+        encoded = await self.sessions.get(conversation_id)
+        if encoded is None:
+            raise KeyError(f"Unknown conversation: {conversation_id}")
+        session = decode_session(encoded)
+        if isinstance(session, MultiSession):
+            return await self._answer_all(conversation_id, session, answer)
+        return await self._answer_one(conversation_id, session, answer)
+
+    async def _answer_one(self, conversation_id: str, session: Session, answer: str,
+                          opening: bool = False) -> Dict[str, Any]:
+        graph = self.graphs[session.problem]
+        node = graph.nodes[session.question_id]
+        if opening:
+            # La question n'a pas encore été posée: le modèle dit si le message d'ouverture y répond
+            try:
+                label, resolved_by = await self.resolve_label(node, answer, (node.text,), local=False)
+            except ValueError as e:
+                logging.warning(e)
+                label = None
+            if label is None:
+                await self._save(conversation_id, session)
+                return {"conversation_id": conversation_id, "problem": session.problem, "done": False,
+                        "question": self._question(node)}
+            outcome = node.outcomes[label]
+        else:
+            outcome, resolved_by = await self.resolve(node, answer)
+        steps = session.steps + (Step(node.id, answer, outcome, resolved_by),)
+        response = {"conversation_id": conversation_id, "problem": session.problem,
+                    "step": self._step(steps[-1])}
+
+        if outcome.next == END:
+            await self.sessions.pop(conversation_id)
+            response.update(done=True, question=None, result=self._result(steps))
+        else:
+            await self._save(conversation_id, session._replace(question_id=outcome.next, steps=steps))
+            response.update(done=False, question=self._question(graph.nodes[outcome.next]))
+        return response
+
+    async def start_all(self, conversation_id: Optional[str] = None, problems: Optional[List[str]] = None,
+                        opening: str = "") -> Dict[str, Any]:
+        """
+        Open a conversation following every candidate problem (all of them by default)
+        at once, and return their first questions, each shared question once; those the
+        `opening` message answers are resolved first.
+
+        Raises:
+            KeyError: if a problem is unknown.
+        """
+        problems = problems or list(self.graphs)
+        for problem in problems:
+            if problem not in self.graphs:
+                raise KeyError(f"Unknown problem: {problem}")
+        conversation_id = conversation_id or uuid.uuid4().hex
+        session = MultiSession(tuple(Session(problem, self.graphs[problem].first_question, ()) for problem in problems))
+        if opening:
+            return await self._answer_all(conversation_id, session, opening, opening=True)
+        await self._save(conversation_id, session)
+        return self._multi_response(conversation_id, session, [])
+
+    def _pending(self, session: MultiSession) -> Dict[str, QuestionNode]:
+        # Questions en attente, une seule fois par id même si plusieurs parcours la partagent
+        pending: Dict[str, QuestionNode] = {}
+        for candidate in session.candidates:
+            if candidate.question_id != END and candidate.question_id not in pending:
+                pending[candidate.question_id] = self.graphs[candidate.problem].nodes[candidate.question_id]
+        return pending
+
+    async def _answer_all(self, conversation_id: str, session: MultiSession, answer: str,
+                          opening: bool = False) -> Dict[str, Any]:
+        """
+        Resolve one answer against every pending question concurrently (each question
+        id once, keywords first, at most BREAKDOWN_MAX_CONCURRENCY model calls at a
+        time), then move every candidate forward. A question the answer does not settle
+        (the model answers NOT_ADDRESSED, or an unexpected label) stays pending.
+        """
+        pending = self._pending(session)
+        # Avec plusieurs questions posées (ou pas encore posées, pour le message d'ouverture), le
+        # modèle les reçoit toutes et peut laisser une question sans réponse
+        asked = tuple(node.text for node in pending.values()) if opening or len(pending) > 1 else ()
+        semaphore = asyncio.Semaphore(BREAKDOWN_MAX_CONCURRENCY)
+
+        async def resolve(node: QuestionNode) -> Optional[Tuple[str, str]]:
+            async with semaphore:
+                try:
+                    label, resolved_by = await self.resolve_label(node, answer, asked, local=not opening)
+                except ValueError as e:
+                    logging.warning(e)
+                    return None
+            return None if label is None else (label, resolved_by)
+
+        labels = dict(zip(pending, await asyncio.gather(*(resolve(node) for node in pending.values()))))
+
+        candidates = []
+        for candidate in session.candidates:
+            resolution = labels.get(candidate.question_id)
+            if resolution is None:
+                candidates.append(candidate)
+                continue
+            label, resolved_by = resolution
+            outcome = self.graphs[candidate.problem].nodes[candidate.question_id].outcomes[label]
+            step = Step(candidate.question_id, answer, outcome, resolved_by)
+            candidates.append(candidate._replace(question_id=outcome.next, steps=candidate.steps + (step,)))
+        session = MultiSession(tuple(candidates))
+
+        resolved = [{"question_id": question_id, "answer": resolution[0], "resolved_by": resolution[1]}
+                    for question_id, resolution in labels.items() if resolution is not None]
+        response = self._multi_response(conversation_id, session, resolved)
+        if response["done"]:
+            await self.sessions.pop(conversation_id)
+        else:
+            await self._save(conversation_id, session)
+        return response
+
+    def _multi_response(self, conversation_id: str, session: MultiSession,
+                        resolved: List[Dict[str, str]]) -> Dict[str, Any]:
+        questions = [self._question(node) for node in self._pending(session).values()]
+        return {"conversation_id": conversation_id, "problem": None, "done": not questions,
+                "resolved": resolved, "questions": questions, "candidates": self.rank(session)}
+
+    def rank(self, session: MultiSession) -> List[Dict[str, Any]]:
+        """
+        Candidate problems, most likely first: finished paths first, then by the share
+        of answered steps that gave a concrete code_breakdown (not "NA"), then by the
+        number of answered steps. Ties keep the parcours.yml order.
+        """
+        ranked = []
+        for candidate in session.candidates:
+            result = self._result(candidate.steps)
+            codes = sum(1 for step in candidate.steps if step.outcome.code_breakdown not in (None, "NA"))
+            ranked.append({
+                "problem": candidate.problem,
+                "done": candidate.question_id == END,
+                "score": round(codes / len(candidate.steps), 3) if candidate.steps else 0.0,
+                "moyen": result["moyen"],
+                "code_breakdown": result["code_breakdown"],
+                "question_id": None if candidate.question_id == END else candidate.question_id,
+                "steps": result["steps"],
+            })
+        ranked.sort(key=lambda c: (not c["done"], -c["score"], -len(c["steps"])))
+        return ranked
+
+    @staticmethod
+    def _question(node: QuestionNode) -> Dict[str, str]:
+        return {"id": node.id, "text": node.text, "type": node.type}
+
+    @staticmethod
+    def _step(step: Step) -> Dict[str, Any]:
+        return {"question_id": step.question_id, "answer": step.outcome.label, "message": step.outcome.message,
+                "moyen": step.outcome.moyen, "code_breakdown": step.outcome.code_breakdown,
+                "resolved_by": step.resolved_by}
+
+    def _result(self, steps: Tuple[Step, ...]) -> Dict[str, Any]:
+        # Le moyen et le code retenus sont les derniers renseignés (hors "NA") le long du parcours
+        known = lambda value: value not in (None, "NA")
+        return {
+            "moyen": next((s.outcome.moyen for s in reversed(steps) if known(s.outcome.moyen)), None),
+            "code_breakdown": next((s.outcome.code_breakdown for s in reversed(steps)
+                                    if known(s.outcome.code_breakdown)), None),
+            "messages": [step.outcome.message for step in steps],
+            "steps": [self._step(step) for step in steps],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.local_resolutions + self.model_resolutions
+        return {
+            "sessions": len(self.sessions),
+            "local_resolutions": self.local_resolutions,
+            "model_resolutions": self.model_resolutions,
+            "local_ratio": self.local_resolutions / total if total else 0.0,
+        }
@@ -3,13 +3,17 @@ from pydantic import BaseModel
 class UserAnswer(BaseModel):
     user_answer: str
     client_secret: str = None
+    # Absent au premier message: la conversation est ouverte sur `problem`
+    conversation_id: str = None
+    problem: str = None
 
     model_config = {
         "json_schema_extra": {
             "examples": [
                 {
                 "user_answer": "la voiture de démarre pas",
-                "client_secret": "123456789"
+                "client_secret": "123456789",
+                "problem": "suspicion_panne_batterie"
                  }
             ]
         }
@@ -0,0 +1,126 @@
+"""
+Conversations de qualification de panne en cours. Sous server.py, le tour suivant
+d'une conversation peut arriver sur un autre worker: les conversations sont alors
+gardées dans un fichier SQLite partagé (BREAKDOWN_SESSIONS_PATH) plutôt qu'en mémoire.
+
+Les deux stockages ont la même interface (get / set / pop, en async) et gardent la
+conversation encodée par le moteur (texte JSON), bornés en nombre et en inactivité.
+"""
+# CORE
+from typing import Optional
+import os
+import sqlite3
+import threading
+import time
+
+# THIRD PARTY
+from fastapi.concurrency import run_in_threadpool
+
+# OWN
+from cache_utils.tools import LRUCache
+
+
+# Fichier SQLite partagé par les processus (vide: conversations en mémoire, un seul processus)
+BREAKDOWN_SESSIONS_PATH = os.environ.get("BREAKDOWN_SESSIONS_PATH", "")
+# Le nombre de conversations n'est ramené à la borne qu'une écriture sur PURGE_EVERY
+PURGE_EVERY = 64
+
+
+class MemorySessionStore:
+    """Conversations in memory (one process), in an LRU with a sliding idle TTL."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float]):
+        self._sessions: LRUCache[str] = LRUCache(maxsize, ttl or None, sliding=True)
+
+    async def get(self, conversation_id: str) -> Optional[str]:
+        return self._sessions.get(conversation_id, count=False)
+
+    async def set(self, conversation_id: str, session: str) -> None:
+        self._sessions.set(conversation_id, session)
+
+    async def pop(self, conversation_id: str) -> None:
+        self._sessions.pop(conversation_id)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """
+    Conversations in a SQLite file shared by the worker processes, bounded in number
+    (least recently used first) and in idle time. The queries run in the threadpool.
+
+    The connection is opened by each process on first use: a store created before
+    the fork (server.py preloads the state) is not shared with the workers.
+    """
+
+    def __init__(self, path: str, maxsize: int, ttl: Optional[float]):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                               " id TEXT PRIMARY KEY, session TEXT NOT NULL, used_at REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_used_at ON sessions (used_at)")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _oldest_valid(self) -> float:
+        return time.time() - self.ttl if self.ttl else float("-inf")
+
+    def _get(self, conversation_id: str) -> Optional[str]:
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT session FROM sessions WHERE id = ? AND used_at >= ?",
+                                     (conversation_id, self._oldest_valid())).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE sessions SET used_at = ? WHERE id = ?", (time.time(), conversation_id))
+            return row[0]
+
+    def _set(self, conversation_id: str, session: str) -> None:
+        with self._lock:
+            connection = self._connect()
+            connection.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                               (conversation_id, session, time.time()))
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                connection.execute("DELETE FROM sessions WHERE used_at < ?", (self._oldest_valid(),))
+                connection.execute("DELETE FROM sessions WHERE id IN ("
+                                   " SELECT id FROM sessions ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                                   (self.maxsize,))
+
+    def _pop(self, conversation_id: str) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM sessions WHERE id = ?", (conversation_id,))
+
+    async def get(self, conversation_id: str) -> Optional[str]:
+        return await run_in_threadpool(self._get, conversation_id)
+
+    async def set(self, conversation_id: str, session: str) -> None:
+        await run_in_threadpool(self._set, conversation_id, session)
+
+    async def pop(self, conversation_id: str) -> None:
+        await run_in_threadpool(self._pop, conversation_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM sessions WHERE used_at >= ?",
+                                           (self._oldest_valid(),)).fetchone()[0]
+
+
+def create_session_store(maxsize: int, ttl: Optional[float], path: str = BREAKDOWN_SESSIONS_PATH):
+    """The SQLite store of BREAKDOWN_SESSIONS_PATH, or an in-memory store when it is not set."""
+    if path:
+        return SQLiteSessionStore(path, maxsize, ttl)
+    return MemorySessionStore(maxsize, ttl)
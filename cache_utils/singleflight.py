@@ -0,0 +1,92 @@
+"""
+Regroupement des appels identiques en cours (single flight): quand plusieurs
+requêtes demandent en même temps la même évaluation, la même indexation ou la même
+réponse, un seul appel est fait et tous reçoivent son résultat (ou son erreur).
+"""
+# CORE
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, TypeVar
+import asyncio
+
+# OWN
+from metrics_utils.tools import COALESCED_CALLS
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces the concurrent calls made with the same key: the first caller starts
+    the call, the callers arriving while it runs await the same result. Nothing is
+    kept once the call is over (see LRUCache for that).
+
+    The call runs in its own task: a caller that is cancelled (client gone) only
+    stops waiting, the others still get the result. When no caller waits anymore,
+    the call is cancelled.
+
+    Args:
+        name: the operation, as labelled in the coalesced_calls_total metric.
+        timeout: seconds given to each call, counted from its start and shared by
+            every caller of the key (None: no limit). On expiry the call is cancelled
+            and its callers get asyncio.TimeoutError.
+    """
+
+    def __init__(self, name: str, timeout: Optional[float] = None):
+        self.name = name
+        self.timeout = timeout
+        self.executed = 0
+        self.shared = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, function: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        """
+        Await `function(*args, **kwargs)`, or the call already running for `key`.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._start(key, function(*args, **kwargs))
+            self.executed += 1
+            COALESCED_CALLS.inc(operation=self.name, role="executed")
+        else:
+            self.shared += 1
+            COALESCED_CALLS.inc(operation=self.name, role="shared")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Plus personne n'attend: l'appel est annulé et un nouvel appelant en relance un autre
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    def _start(self, key: Hashable, call: Awaitable[T]) -> _Flight:
+        if self.timeout is not None:
+            call = asyncio.wait_for(call, self.timeout)
+        flight = _Flight(asyncio.ensure_future(call))
+        self._flights[key] = flight
+
+        def done(task: "asyncio.Task") -> None:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            # Erreur déjà transmise aux appelants, ou sans appelant: pas d'avertissement "never retrieved"
+            if not task.cancelled():
+                task.exception()
+
+        flight.task.add_done_callback(done)
+        return flight
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._flights), "executed": self.executed, "shared": self.shared}
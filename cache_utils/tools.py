@@ -0,0 +1,101 @@
+# CORE
+from typing import Any, Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+from collections import OrderedDict
+import threading
+import time
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class LRUCache(Generic[V]):
+    """
+    Thread-safe cache bounded in size (least recently used entries are evicted first)
+    and optionally in age (entries older than `ttl` seconds are dropped). With
+    `sliding=True` the age is counted from the last access instead of the last write.
+
+    set() and purge() return the evicted entries so that callers can release
+    what they hold (remote resources, files...).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, sliding: bool = False,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sliding = sliding
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def _is_expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        with self._lock:
+            now = self.clock()
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and self._is_expired(entry[0], now):
+                del self._data[key]
+                entry = _MISSING
+            if entry is _MISSING:
+                if count:
+                    self.misses += 1
+                return default
+            if self.sliding:
+                self._data[key] = (now, entry[1])
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: V) -> List[Tuple[Hashable, V]]:
+        """Store `value` and return the entries evicted to make room."""
+        with self._lock:
+            self._data[key] = (self.clock(), value)
+            self._data.move_to_end(key)
+            evicted = []
+            while len(self._data) > self.maxsize:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+            return evicted
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[1]
+
+    def purge(self) -> List[Tuple[Hashable, V]]:
+        """Drop and return the expired entries."""
+        with self._lock:
+            now = self.clock()
+            expired = [(key, value) for key, (stored_at, value) in self._data.items() if self._is_expired(stored_at, now)]
+            for key, _ in expired:
+                del self._data[key]
+            return expired
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def items(self) -> List[Tuple[Hashable, V]]:
+        with self._lock:
+            return [(key, value) for key, (_, value) in self._data.items()]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
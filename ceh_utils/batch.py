@@ -0,0 +1,231 @@
+# CORE
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple, Union
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import json
+import logging
+
+# OWN
+from ceh_utils.engine import CompiledRuleSet
+from ceh_utils.payload import parse_payload
+from ceh_utils.tools import format_matched_message
+from metrics_utils.tools import RULE_MATCHES, RULE_SELECTED, STAGE_LATENCY
+
+
+# Élément d'un lot: (position, payload brut NDJSON ou déjà décodé)
+BatchItem = Tuple[int, Union[bytes, Any]]
+
+_worker_rule_set: Optional[CompiledRuleSet] = None
+
+
+def evaluate_payload(rule_set: CompiledRuleSet, index: int, payload: Union[bytes, Any]) -> str:
+    """
+    Evaluate one payload of a batch and return its NDJSON line.
+
+    Args:
+        rule_set: the compiled rules.
+        index: the position of the payload in the batch.
+        payload: the CEH document, raw (NDJSON line) or already decoded.
+
+    Returns:
+        str: the JSON line {"index", "id", "result"} or {"index", "error"}, with its newline.
+    """
+    try:
+        ceh_data = parse_payload(payload) if isinstance(payload, (bytes, str)) else payload
+        selected_message = rule_set.evaluate(ceh_data)
+        record: Dict[str, Any] = {
+            "index": index,
+            "id": ceh_data.get("id") if isinstance(ceh_data, dict) else None,
+            "result": format_matched_message(selected_message),
+        }
+    except Exception as e:
+        logging.error("Batch item %d: %s", index, e)
+        record = {"index": index, "error": str(e)}
+    return json.dumps(record, default=str, ensure_ascii=False) + "\n"
+
+
+def evaluate_chunk(rule_set: CompiledRuleSet, items: List[BatchItem]) -> str:
+    return "".join(evaluate_payload(rule_set, index, payload) for index, payload in items)
+
+
+def _init_worker(rule_set: CompiledRuleSet) -> None:
+    global _worker_rule_set
+    _worker_rule_set = rule_set
+    # Un fils créé par fork hérite des compteurs du parent: ils sont déjà comptés
+    RULE_MATCHES.drain()
+    RULE_SELECTED.drain()
+
+
+def _evaluate_chunk_in_worker(items: List[BatchItem]) -> Tuple[str, Dict, Dict]:
+    # Les compteurs du processus fils sont renvoyés avec le résultat pour être cumulés dans le parent
+    return evaluate_chunk(_worker_rule_set, items), RULE_MATCHES.drain(), RULE_SELECTED.drain()
+
+
+def _merge_worker_result(result: Tuple[str, Dict, Dict]) -> str:
+    lines, matches, selected = result
+    RULE_MATCHES.merge(matches)
+    RULE_SELECTED.merge(selected)
+    return lines
+
+
+async def read_items(body: AsyncIterator[bytes], max_buffer: Optional[int] = None) -> AsyncIterator[BatchItem]:
+    """
+    Split a request body into batch items, as they arrive for NDJSON.
+    A body starting with '[' is read entirely and decoded as a JSON array.
+
+    Raises:
+        ValueError: when more than `max_buffer` bytes must be held at once (a JSON array
+            body, or a single NDJSON line, larger than that).
+    """
+    buffer = b""
+    is_array: Optional[bool] = None
+    index = 0
+    async for chunk in body:
+        buffer += chunk
+        if is_array is None:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            is_array = stripped.startswith(b"[")
+        if not is_array:
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield index, line
+                    index += 1
+        if max_buffer is not None and len(buffer) > max_buffer:
+            form = "JSON array body" if is_array else f"NDJSON line {index}"
+            raise ValueError(f"{form} larger than {max_buffer} bytes (send large batches as NDJSON)")
+
+    if is_array:
+        for index, payload in enumerate(parse_payload(buffer)):
+            yield index, payload
+    elif buffer.strip():
+        yield index, buffer
+
+
+class _Pool:
+    """A process pool for one rules version, and the number of streams using it."""
+    __slots__ = ('executor', 'version', 'streams', 'retired')
+
+    def __init__(self, executor: ProcessPoolExecutor, version: str):
+        self.executor = executor
+        self.version = version
+        self.streams = 0
+        self.retired = False
+
+
+class BatchEvaluator:
+    """
+    Evaluates batches of CEH payloads in input order, by chunks, either in the
+    current process or fanned out to a process pool (workers > 0).
+
+    The pool workers receive the compiled rule set once, at start; a new pool is
+    created when the rules version changes (or when a worker died). A retired pool
+    is shut down once the last stream started on it has finished.
+    """
+
+    def __init__(self, workers: int = 0, chunk_size: int = 256, max_buffer: Optional[int] = None):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_buffer = max_buffer
+        self._pool: Optional[_Pool] = None
+        self._pools: Set[_Pool] = set()
+
+    def _acquire(self, rule_set: CompiledRuleSet, version: str) -> _Pool:
+        if self._pool is None or self._pool.version != version:
+            if self._pool is not None:
+                self._retire(self._pool)
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(rule_set,))
+            self._pool = _Pool(executor, version)
+            self._pools.add(self._pool)
+        self._pool.streams += 1
+        return self._pool
+
+    def _retire(self, pool: _Pool) -> None:
+        # Les flux en cours sur ce pool le gardent jusqu'à leur fin; les nouveaux en ont un autre
+        pool.retired = True
+        if self._pool is pool:
+            self._pool = None
+        if pool.streams == 0:
+            self._close(pool)
+
+    def _release(self, pool: _Pool) -> None:
+        pool.streams -= 1
+        if pool.retired and pool.streams == 0:
+            self._close(pool)
+
+    def _close(self, pool: _Pool) -> None:
+        self._pools.discard(pool)
+        pool.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _chunks(self, body: AsyncIterator[bytes]) -> AsyncIterator[List[BatchItem]]:
+        chunk: List[BatchItem] = []
+        async for item in read_items(body, self.max_buffer):
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def _enriched_chunks(self, body: AsyncIterator[bytes], rule_set: CompiledRuleSet,
+                               weather: Optional[Any]) -> AsyncIterator[List[BatchItem]]:
+        async for chunk in self._chunks(body):
+            if weather is not None:
+                # Une recherche par lieu distinct du lot, avant l'envoi aux workers
+                with STAGE_LATENCY.time(stage="weather_enrichment_batch_chunk"):
+                    chunk = await weather.enrich_chunk(rule_set, chunk)
+            yield chunk
+
+    async def stream(self, body: AsyncIterator[bytes], rule_set: CompiledRuleSet, version: str,
+                     weather: Optional[Any] = None) -> AsyncIterator[str]:
+        """
+        Evaluate the payloads of `body` and yield the NDJSON results in input order.
+        With a WeatherEnricher (`weather`), the weather is added to the payloads first.
+        """
+        pending: Deque[asyncio.Future] = deque()
+        pool: Optional[_Pool] = None
+        try:
+            if self.workers <= 0:
+                async for chunk in self._enriched_chunks(body, rule_set, weather):
+                    with STAGE_LATENCY.time(stage="rule_evaluation_batch_chunk"):
+                        lines = evaluate_chunk(rule_set, chunk)
+                    yield lines
+                return
+
+            loop = asyncio.get_running_loop()
+            pool = self._acquire(rule_set, version)
+            async for chunk in self._enriched_chunks(body, rule_set, weather):
+                pending.append(loop.run_in_executor(pool.executor, _evaluate_chunk_in_worker, chunk))
+                # Limite le nombre de lots en vol pour ne pas charger tout le corps en mémoire
+                if len(pending) >= 2 * self.workers:
+                    yield _merge_worker_result(await pending.popleft())
+            while pending:
+                yield _merge_worker_result(await pending.popleft())
+        except ValueError as e:
+            # Corps invalide (tableau JSON mal formé) ou trop gros pour max_buffer
+            logging.error("Invalid batch body: %s", e)
+            yield json.dumps({"error": f"Invalid batch body: {e}"}) + "\n"
+        except BrokenProcessPool as e:
+            # Un worker est mort (OOM, signal): ce pool est inutilisable, le prochain lot en crée un autre
+            logging.error("Batch process pool broken: %s", e)
+            self._retire(pool)
+            yield json.dumps({"error": f"Batch worker crashed: {e}"}) + "\n"
+        except RuntimeError as e:
+            # Pool arrêté pendant le flux (arrêt de l'application)
+            logging.error("Batch process pool unavailable: %s", e)
+            yield json.dumps({"error": f"Batch evaluation interrupted: {e}"}) + "\n"
+        finally:
+            for future in pending:
+                future.cancel()
+            if pool is not None:
+                self._release(pool)
+
+    def shutdown(self) -> None:
+        """Shut every pool down (at application shutdown, the streams are over)."""
+        for pool in list(self._pools):
+            self._close(pool)
+        self._pool = None
@@ -0,0 +1,98 @@
+"""
+Cache des décisions /ceh: un callbot renvoie souvent le même document au fil de la
+conversation (version, lastChangeDate et champs non lus par les règles qui changent),
+alors que la décision ne dépend que des valeurs aux chemins de path_transcoding.
+
+La clef est (version des règles, date du jour, valeurs à ces chemins): un document
+déjà vu, ou qui ne diffère que par des champs non lus, est servi sans évaluation.
+La date fait partie de la clef car les règles expirées ne sont plus retenues.
+"""
+# CORE
+from datetime import date
+from typing import Any, Dict, Hashable, Optional, Tuple
+import json
+import os
+
+# OWN
+from cache_utils.tools import LRUCache
+from ceh_utils.engine import CompiledRuleSet, MatchedRule, count_matches, record_decision
+from ceh_utils.tools import select_highest_priority_rule
+
+
+# Nombre de décisions conservées par processus (0: cache désactivé)
+CEH_DECISION_CACHE_SIZE = int(os.environ.get("CEH_DECISION_CACHE_SIZE", 4096))
+
+# Marque les valeurs non hachables (listes, objets) remplacées par leur JSON dans l'empreinte
+_UNHASHABLE = object()
+
+# Règle retenue, et règles remplies par code (compteurs /metrics)
+Decision = Tuple[Optional[MatchedRule], Dict[Tuple[str], int]]
+
+
+def fingerprint(values: Tuple[Any, ...]) -> Hashable:
+    """
+    The resolved values as a cache key: the tuple itself when it is hashable, otherwise
+    the lists and objects it holds are replaced by their canonical JSON.
+    """
+    try:
+        hash(values)
+        return values
+    except TypeError:
+        return tuple(_hashable(value) for value in values)
+
+
+def _hashable(value: Any) -> Hashable:
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return (_UNHASHABLE, json.dumps(value, sort_keys=True, default=str))
+
+
+class DecisionCache:
+    """
+    Selected rule (and the matched rule counts, for the metrics) per projection of the
+    payload on the paths read by the rule set.
+
+    Args:
+        maxsize: number of decisions kept, least recently used evicted first (0: disabled).
+    """
+
+    def __init__(self, maxsize: int = CEH_DECISION_CACHE_SIZE):
+        self.enabled = maxsize > 0
+        self._decisions: LRUCache[Decision] = LRUCache(max(maxsize, 1))
+
+    def evaluate(self, rule_set: CompiledRuleSet, version: str, ceh_data: Dict[str, Any],
+                 current_date: Optional[date] = None) -> Optional[MatchedRule]:
+        """
+        Equivalent of rule_set.evaluate(ceh_data, current_date), served from the cache
+        when a payload with the same values at the rule paths was already evaluated.
+
+        Args:
+            rule_set: the compiled rules.
+            version: the version of `rule_set`, so that a reload never serves old decisions.
+            ceh_data: the CEH payload.
+            current_date: the date used for the rule validity (today by default).
+        """
+        if not self.enabled:
+            return rule_set.evaluate(ceh_data, current_date)
+
+        current_date = current_date or date.today()
+        values = rule_set.resolve_paths(ceh_data)
+        key = (version, current_date.toordinal(), fingerprint(values))
+        decision = self._decisions.get(key)
+        if decision is None:
+            matched = rule_set.match(ceh_data, current_date, values)
+            decision = (select_highest_priority_rule(matched), count_matches(matched))
+            self._decisions.set(key, decision)
+
+        selected, match_counts = decision
+        # Les compteurs de règles restent ceux d'une évaluation complète
+        record_decision(match_counts, selected)
+        return selected
+
+    def clear(self) -> None:
+        self._decisions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._decisions.stats()
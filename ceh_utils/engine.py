@@ -0,0 +1,433 @@
+# CORE
+from typing import List, Dict, Any, Tuple, Optional, Callable, Sequence, Iterable
+from dataclasses import dataclass
+from datetime import date
+from bisect import bisect_left, bisect_right
+from collections import Counter
+import json
+import logging
+import operator
+
+# OWN
+from data.rules_data.path_transcoding import path_transcoding
+from ceh_utils.tools import parse_condition, is_comparison, select_highest_priority_rule
+from ceh_utils.paths import CompiledPath, compile_path
+from files_utils.tools import load_rules_from_yaml
+from metrics_utils.tools import RULE_MATCHES, RULE_SELECTED
+
+
+MatchedRule = Tuple[str, str, int, date, date, str, int]
+
+OPERATOR_SYMBOLS = {operator.gt: '>', operator.ge: '>=', operator.lt: '<', operator.le: '<=', operator.eq: '='}
+
+
+class Equals:
+    """Predicate for a plain equality condition (ex: `value: true`)."""
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __call__(self, data: Any) -> bool:
+        return data == self.value
+
+    def __repr__(self) -> str:
+        return f"== {self.value!r}"
+
+
+class Comparison:
+    """Predicate for a comparison condition (ex: `value: ">= 10 or < 3"`), parsed once."""
+    __slots__ = ('clauses',)
+
+    def __init__(self, clauses: List[Tuple[Callable[[Any, Any], bool], Any]]):
+        self.clauses = tuple(clauses)
+
+    def __call__(self, data: Any) -> bool:
+        try:
+            return any(op(data, val) for op, val in self.clauses)
+        except TypeError:
+            # Valeur absente ou non numérique: la condition n'est pas remplie
+            return False
+
+    def __repr__(self) -> str:
+        return " or ".join(f"{OPERATOR_SYMBOLS.get(op, op)} {val:g}" for op, val in self.clauses)
+
+
+def compile_condition(condition_value: Any) -> Callable[[Any], bool]:
+    """
+    Turn the 'value' of a condition member into a ready-to-call predicate.
+
+    Args:
+        condition_value: the raw value from rules.yaml.
+
+    Returns:
+        A predicate taking the value found in the CEH data.
+    """
+    if is_comparison(condition_value):
+        return Comparison(parse_condition(condition_value))
+    return Equals(condition_value)
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    name: str
+    message: str
+    priority: int
+    created_at: date
+    validity: Optional[date]
+    code: str
+    members: Tuple[Tuple[CompiledPath, Callable[[Any], bool]], ...]
+
+    def matches(self, ceh_data: Dict[str, Any]) -> bool:
+        return all(predicate(path.resolve(ceh_data)) for path, predicate in self.members)
+
+    def is_expired(self, current_date: date) -> bool:
+        return bool(self.validity) and self.validity < current_date
+
+    def as_match(self) -> MatchedRule:
+        """Same tuple as the one built by apply_rules."""
+        return (self.name, self.message, self.priority, self.created_at, self.validity, self.code, len(self.members))
+
+
+class PathIndex:
+    """
+    Index of the condition members that read one data path:
+    - equality values are looked up in a dict (value -> member ids),
+    - numeric comparisons in sorted threshold lists, one per operator,
+    - anything else (unhashable values) is kept as a plain predicate.
+    """
+    RANGE_OPERATORS = (operator.gt, operator.ge, operator.lt, operator.le)
+
+    def __init__(self, path: CompiledPath):
+        self.path = path
+        self.equals: Dict[Any, List[int]] = {}
+        self.ranges: Dict[Callable, Tuple[List[float], List[int]]] = {op: ([], []) for op in self.RANGE_OPERATORS}
+        self.others: List[Tuple[int, Callable[[Any], bool]]] = []
+        self.has_ranges = False
+        self.predicates: Dict[int, Callable[[Any], bool]] = {}
+
+    def add(self, member_id: int, predicate: Callable[[Any], bool]) -> None:
+        self.predicates[member_id] = predicate
+        if isinstance(predicate, Equals):
+            try:
+                self.equals.setdefault(predicate.value, []).append(member_id)
+                return
+            except TypeError:
+                pass  # Valeur non hashable
+        elif isinstance(predicate, Comparison):
+            for op, val in predicate.clauses:
+                if op is operator.eq:
+                    self.equals.setdefault(val, []).append(member_id)
+                else:
+                    thresholds, member_ids = self.ranges[op]
+                    self.has_ranges = True
+                    position = bisect_right(thresholds, val)
+                    thresholds.insert(position, val)
+                    member_ids.insert(position, member_id)
+            return
+        self.others.append((member_id, predicate))
+
+    def satisfied(self, data: Any) -> List[int]:
+        """Ids of the members satisfied by the value found at this path (may contain duplicates)."""
+        satisfied: List[int] = []
+        try:
+            satisfied.extend(self.equals.get(data, ()))
+        except TypeError:
+            pass  # Valeur non hashable (liste, dict)
+
+        # bool est un int: comme dans parse_condition, True >= 1 est vrai
+        if self.has_ranges and isinstance(data, (int, float)) and data == data:
+            thresholds, member_ids = self.ranges[operator.gt]
+            satisfied.extend(member_ids[:bisect_left(thresholds, data)])
+            thresholds, member_ids = self.ranges[operator.ge]
+            satisfied.extend(member_ids[:bisect_right(thresholds, data)])
+            thresholds, member_ids = self.ranges[operator.lt]
+            satisfied.extend(member_ids[bisect_right(thresholds, data):])
+            thresholds, member_ids = self.ranges[operator.le]
+            satisfied.extend(member_ids[bisect_left(thresholds, data):])
+
+        if self.others:
+            satisfied.extend(member_id for member_id, predicate in self.others if predicate(data))
+        return satisfied
+
+    def build_rule_masks(self, member_rules: List[int]) -> None:
+        """
+        Precompute the lookups of `satisfied` as bit masks of rules (bit n = rule n), for
+        CompiledRuleSet. A rule with several members on this path passes only if all of them
+        are satisfied: those members go to a separate index, whose satisfied members are counted.
+        """
+        members_per_rule = Counter(member_rules[member_id] for member_id in self.predicates)
+        multiple = {rule_id for rule_id, count in members_per_rule.items() if count > 1}
+        self.rules_mask = sum(1 << rule_id for rule_id in members_per_rule)
+        self.other_rules_mask = ~self.rules_mask
+        # Règles à plusieurs membres sur ce chemin: un index à part, dont on compte les membres satisfaits
+        self.multiple_index: Optional[PathIndex] = None
+        self.multiple_sizes = {rule_id: members_per_rule[rule_id] for rule_id in multiple}
+        self.multiple_rules = {member_id: member_rules[member_id] for member_id in self.predicates
+                               if member_rules[member_id] in multiple}
+        if multiple:
+            self.multiple_index = PathIndex(self.path)
+            for member_id, rule_id in self.multiple_rules.items():
+                self.multiple_index.add(member_id, self.predicates[member_id])
+
+        def mask_of(member_ids: Iterable[int]) -> int:
+            mask = 0
+            for member_id in member_ids:
+                if member_rules[member_id] not in multiple:
+                    mask |= 1 << member_rules[member_id]
+            return mask
+
+        self.equals_masks: Dict[Any, int] = {value: mask_of(member_ids) for value, member_ids in self.equals.items()}
+        # Par opérateur: (recherche du seuil, seuils triés, masque des membres satisfaits par position)
+        self.range_masks: List[Tuple[Callable, List[float], List[int]]] = []
+        for op, search in ((operator.gt, bisect_left), (operator.ge, bisect_right),
+                           (operator.lt, bisect_right), (operator.le, bisect_left)):
+            thresholds, member_ids = self.ranges[op]
+            if not thresholds:
+                continue
+            # > et >=: membres satisfaits avant la position trouvée (seuils inférieurs); < et <=: après
+            masks = [0]
+            for member_id in (member_ids if op in (operator.gt, operator.ge) else reversed(member_ids)):
+                masks.append(masks[-1] | mask_of((member_id,)))
+            if op in (operator.lt, operator.le):
+                masks.reverse()
+            self.range_masks.append((search, thresholds, masks))
+        self.other_masks = [(1 << member_rules[member_id], predicate) for member_id, predicate in self.others
+                            if member_rules[member_id] not in multiple]
+
+    def passed_rules(self, data: Any) -> int:
+        """Mask of the rules whose members on this path are all satisfied by `data`."""
+        try:
+            passed = self.equals_masks.get(data, 0)
+        except TypeError:
+            passed = 0  # Valeur non hashable (liste, dict)
+
+        # bool est un int: comme dans parse_condition, True >= 1 est vrai
+        if self.range_masks and isinstance(data, (int, float)) and data == data:
+            for search, thresholds, masks in self.range_masks:
+                passed |= masks[search(thresholds, data)]
+
+        for bit, predicate in self.other_masks:
+            if predicate(data):
+                passed |= bit
+        if self.multiple_index is not None:
+            satisfied = self.multiple_index.satisfied(data)
+            if satisfied:
+                satisfied_counts: Dict[int, int] = {}
+                for member_id in set(satisfied):
+                    rule_id = self.multiple_rules[member_id]
+                    satisfied_counts[rule_id] = satisfied_counts.get(rule_id, 0) + 1
+                for rule_id, count in satisfied_counts.items():
+                    if count == self.multiple_sizes[rule_id]:
+                        passed |= 1 << rule_id
+        return passed
+
+
+class CompiledRuleSet:
+    """
+    Immutable, precompiled set of rules: paths are transcoded and compiled and conditions
+    are parsed once, so evaluating a CEH payload does no YAML or regex work.
+
+    Rules are matched through a discrimination index: each distinct path is resolved
+    at most once per payload and gives, by dict and bisect lookups, the bit mask of the
+    rules it satisfies, so the cost follows the number of distinct paths, not of rules.
+
+    Paths are visited in `path_order` (most selective first, see ceh_utils.profiler),
+    by default in the order of the file. A path that no rule still in the running reads
+    is not resolved, and the evaluation stops as soon as no rule can match any more.
+    """
+
+    def __init__(self, rules: Tuple[CompiledRule, ...], path_order: Optional[Sequence[str]] = None,
+                 transcoding: Optional[Dict[str, str]] = None):
+        self.rules = rules
+        # Transcodage avec lequel les règles ont été compilées (lu aussi par l'enrichissement météo)
+        self.transcoding: Dict[str, str] = dict(transcoding if transcoding is not None else path_transcoding)
+        self.always_matching: List[int] = []
+        self.member_rules: List[int] = []
+        indexes: Dict[CompiledPath, PathIndex] = {}
+
+        for rule_id, rule in enumerate(rules):
+            if not rule.members:
+                self.always_matching.append(rule_id)
+            for path, predicate in rule.members:
+                member_id = len(self.member_rules)
+                self.member_rules.append(rule_id)
+                if path not in indexes:
+                    indexes[path] = PathIndex(path)
+                indexes[path].add(member_id, predicate)
+
+        self.path_order: Optional[Tuple[str, ...]] = tuple(path_order) if path_order else None
+        # Chemins absents de l'ordre (nouvelles règles): à la suite, dans l'ordre du fichier
+        rank = {path: position for position, path in enumerate(path_order or ())}
+        self.path_indexes: Tuple[PathIndex, ...] = tuple(
+            sorted(indexes.values(), key=lambda index: rank.get(index.path.path, len(rank))))
+
+        # Pour chaque chemin, les règles dont c'est le premier chemin lu (elles entrent en lice)
+        first_position: Dict[int, int] = {}
+        for position, path_index in enumerate(self.path_indexes):
+            path_index.build_rule_masks(self.member_rules)
+            for member_id in path_index.predicates:
+                first_position.setdefault(self.member_rules[member_id], position)
+        entering = [0] * len(self.path_indexes)
+        for rule_id, position in first_position.items():
+            entering[position] |= 1 << rule_id
+        self.entering_masks: Tuple[int, ...] = tuple(entering)
+        # Au-delà de cette position, aucune règle n'entre: s'il n'en reste aucune en lice, on s'arrête
+        self.last_entering = max(first_position.values(), default=-1)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def resolve_paths(self, ceh_data: Dict[str, Any]) -> Tuple[Any, ...]:
+        """Values found at every path read by the rules, in the order of `path_indexes`."""
+        return tuple(path_index.path.resolve(ceh_data) for path_index in self.path_indexes)
+
+    def matching_rule_ids(self, ceh_data: Dict[str, Any], values: Optional[Tuple[Any, ...]] = None) -> List[int]:
+        """
+        Ids (positions in the file) of the rules whose conditions are all met, in file order.
+
+        Args:
+            ceh_data: the CEH payload.
+            values: the values already resolved by resolve_paths(ceh_data), if any.
+        """
+        # Règles en lice (bit n = règle n): entrées, et dont tous les membres lus jusqu'ici sont remplis
+        alive = 0
+        for position, path_index in enumerate(self.path_indexes):
+            entering = self.entering_masks[position]
+            if not entering and not alive & path_index.rules_mask:
+                if not alive and position > self.last_entering:
+                    break
+                continue  # Aucune règle en lice ne lit ce chemin: il n'est pas résolu
+
+            value = path_index.path.resolve(ceh_data) if values is None else values[position]
+            passed = path_index.passed_rules(value)
+            if alive:
+                alive = (alive & path_index.other_rules_mask) | (passed & (alive | entering))
+            else:
+                alive = passed & entering
+
+        rule_ids = list(self.always_matching)
+        while alive:
+            lowest = alive & -alive
+            rule_ids.append(lowest.bit_length() - 1)
+            alive ^= lowest
+        rule_ids.sort()
+        return rule_ids
+
+    def match(self, ceh_data: Dict[str, Any], current_date: Optional[date] = None,
+              values: Optional[Tuple[Any, ...]] = None) -> List[MatchedRule]:
+        """
+        Equivalent of apply_rules: every valid rule whose conditions are all met.
+        """
+        current_date = current_date or date.today()
+        matched = (self.rules[rule_id] for rule_id in self.matching_rule_ids(ceh_data, values))
+        return [rule.as_match() for rule in matched if not rule.is_expired(current_date)]
+
+    def evaluate(self, ceh_data: Dict[str, Any], current_date: Optional[date] = None) -> Optional[MatchedRule]:
+        """
+        Equivalent of select_highest_priority_rule(apply_rules(ceh_data, rules)).
+        """
+        matched = self.match(ceh_data, current_date)
+        selected = select_highest_priority_rule(matched)
+        record_decision(count_matches(matched), selected)
+        return selected
+
+
+def count_matches(matched: List[MatchedRule]) -> Dict[Tuple[str], int]:
+    """Matched rules per code, as label values of the RULE_MATCHES counter."""
+    counts: Dict[Tuple[str], int] = {}
+    for rule in matched:
+        key = (str(rule[5]),)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def record_decision(match_counts: Dict[Tuple[str], int], selected: Optional[MatchedRule]) -> None:
+    """Count the matched rules (from count_matches) and the selected one in the /metrics counters."""
+    RULE_MATCHES.merge(match_counts)
+    if selected is not None:
+        RULE_SELECTED.inc(code=selected[5])
+
+
+def compile_rule(rule: Dict[str, Any], transcoding: Dict[str, str]) -> CompiledRule:
+    """
+    Compile one rule of rules.yaml.
+
+    Args:
+        rule: the rule as loaded from the YAML file.
+        transcoding: mapping from business path names to data paths.
+
+    Returns:
+        CompiledRule: the compiled rule.
+    """
+    conditions = rule['conditions']
+    members = []
+    for key, value in (conditions.get('condition_members') or {}).items():
+        path = value.get('path')
+        if path in transcoding:
+            path = transcoding[path]
+        else:
+            logging.warning("No transcoding for path '%s' (condition '%s' of rule '%s')", path, key, conditions.get('code'))
+        members.append((compile_path(path), compile_condition(value.get('value'))))
+
+    return CompiledRule(
+        name=conditions.get('name'),
+        message=conditions.get('message'),
+        priority=conditions.get('priority'),
+        created_at=conditions.get('created_at'),
+        validity=conditions.get('validity'),
+        code=conditions.get('code'),
+        members=tuple(members),
+    )
+
+
+def compile_rules(rules: List[Dict[str, Any]], transcoding: Dict[str, str] = path_transcoding,
+                  current_date: Optional[date] = None, path_order: Optional[Sequence[str]] = None) -> CompiledRuleSet:
+    """
+    Compile the rules loaded from rules.yaml into a CompiledRuleSet.
+    Rules already expired at compile time are dropped.
+
+    Args:
+        rules: the list of rules as loaded from the YAML file.
+        transcoding: mapping from business path names to data paths.
+        current_date: reference date for validity, today by default.
+        path_order: data paths in evaluation order (see load_path_order), None for the file order.
+
+    Returns:
+        CompiledRuleSet: the compiled rules, in the order of the file.
+    """
+    current_date = current_date or date.today()
+    compiled = []
+    for rule in rules or []:
+        try:
+            compiled_rule = compile_rule(rule, transcoding)
+        except Exception as e:
+            logging.error("Invalid rule %s: %s", rule, e)
+            continue
+        if compiled_rule.is_expired(current_date):
+            continue  # Ignorer les règles expirées
+        compiled.append(compiled_rule)
+
+    return CompiledRuleSet(tuple(compiled), path_order, transcoding)
+
+
+def load_rule_set(filename: str, transcoding: Dict[str, str] = path_transcoding,
+                  current_date: Optional[date] = None, path_order: Optional[Sequence[str]] = None) -> CompiledRuleSet:
+    """
+    Load and compile the rules of a YAML file.
+    """
+    return compile_rules(load_rules_from_yaml(filename), transcoding, current_date, path_order)
+
+
+def load_path_order(filename: str) -> List[str]:
+    """
+    Read the evaluation order written by the profiler (python -m ceh_utils.profiler --order).
+
+    Returns:
+        list: the data paths, most selective first.
+    """
+    with open(filename, 'r') as f:
+        order = json.load(f).get('path_order')
+    if not isinstance(order, list) or not all(isinstance(path, str) for path in order):
+        raise ValueError(f"{filename}: 'path_order' must be a list of data paths")
+    return order
@@ -0,0 +1,124 @@
+# CORE
+from typing import Any, List, Tuple
+from functools import lru_cache
+import re
+
+
+PATH_CACHE_SIZE = 1024
+
+# Types d'étapes d'un chemin compilé
+KEY = 0       # clé de dictionnaire
+INDEX = 1     # indice de liste (ou clé numérique d'un dictionnaire)
+WILDCARD = 2  # [*]: tous les éléments d'une liste
+
+
+def split_path(data_path: str) -> Tuple[str, ...]:
+    """
+    Split a dotted data path such as "documents[0].content" into its parts.
+
+    Args:
+    - data_path: the path, with '.' between keys and '[n]' for list indexes.
+
+    Returns:
+    - A tuple of keys and indexes, as strings, usable by get_value_from_path.
+    """
+    # Utilisez une expression régulière pour séparer les indices de liste et les clés de dictionnaire
+    return tuple(re.split(r'\.|\[|\]', data_path.replace(']', '')))  # Découpe des '.' et '[]'
+
+
+class CompiledPath:
+    """
+    A data path such as "_embedded.documents[0].content.collectedData.location.isAtHome"
+    turned once into a tuple of typed steps, with the same semantics as get_value_from_path:
+    a missing key, an index out of bounds or a type mismatch gives None.
+
+    A "[*]" step matches every element of a list; for such paths resolve() returns the
+    list of all the values found.
+    """
+    __slots__ = ('path', 'steps', 'has_wildcard')
+
+    def __init__(self, path: str):
+        self.path = path
+        steps = []
+        for part in split_path(path):
+            if part == '*':
+                steps.append((WILDCARD, part, None))
+            elif part.isdecimal():
+                steps.append((INDEX, part, int(part)))
+            else:
+                steps.append((KEY, part, None))
+        self.steps: Tuple[Tuple[int, str, Any], ...] = tuple(steps)
+        self.has_wildcard = any(kind == WILDCARD for kind, _, _ in self.steps)
+
+    def __repr__(self) -> str:
+        return f"CompiledPath({self.path!r})"
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, CompiledPath) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path: str) -> None:
+        self.__init__(path)
+
+    def resolve(self, data: Any) -> Any:
+        """
+        Value found at this path in `data`, None if the path is invalid.
+        For a path with wildcards, the list of all the values found.
+        """
+        if self.has_wildcard:
+            return self.resolve_all(data)
+
+        current = data
+        for kind, key, index in self.steps:
+            if kind == INDEX and isinstance(current, list):
+                if index >= len(current):
+                    return None  # Index out of bounds
+                current = current[index]
+            elif isinstance(current, dict):
+                try:
+                    current = current[key]
+                except KeyError:
+                    return None
+            else:
+                return None  # Invalid path or type mismatch
+        return current
+
+    def resolve_all(self, data: Any) -> List[Any]:
+        """
+        All the values found at this path in `data` (at most one without wildcards).
+        """
+        current = [data]
+        for kind, key, index in self.steps:
+            found = []
+            for item in current:
+                if kind == WILDCARD:
+                    if isinstance(item, list):
+                        found.extend(item)
+                elif kind == INDEX and isinstance(item, list):
+                    if index < len(item):
+                        found.append(item[index])
+                elif isinstance(item, dict) and key in item:
+                    found.append(item[key])
+            current = found
+            if not current:
+                break
+        return current
+
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def compile_path(path: str) -> CompiledPath:
+    """
+    Compile a data path, with an LRU cache of the compiled paths.
+
+    Args:
+        path: the path, with '.' between keys, '[n]' for list indexes and '[*]' for every element.
+
+    Returns:
+        CompiledPath: the cached accessor.
+    """
+    return CompiledPath(path)
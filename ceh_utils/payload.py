@@ -0,0 +1,32 @@
+"""
+Décodage des documents CEH reçus par /ceh et /ceh/batch.
+
+Les documents du callbot pèsent plusieurs centaines de Ko (transcriptions, flux,
+contacts) dont les règles ne lisent qu'une dizaine de champs: ils sont décodés
+depuis le corps brut, avec orjson quand il est installé, sans la validation du
+corps par FastAPI. Un document refusé par orjson (NaN, entiers de plus de 64 bits)
+est décodé par json.loads, qui garde le dernier mot.
+"""
+# CORE
+from typing import Any, Union
+import json
+
+try:
+    import orjson
+except ImportError:  # Facultatif: json de la bibliothèque standard
+    orjson = None
+
+
+def parse_payload(raw: Union[bytes, str]) -> Any:
+    """
+    Decode a JSON document, with orjson when available.
+
+    Raises:
+        ValueError: the document is not valid JSON.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(raw)
@@ -0,0 +1,313 @@
+"""
+Rule coverage profile over recorded traffic: replays an NDJSON corpus of CEH payloads
+through the compiled rules and reports
+- per rule: match rate, selection rate, dead rules (never matched) and shadowed rules
+  (matched but always beaten by a higher-priority rule in select_highest_priority_rule),
+- per condition member: selectivity (share of payloads satisfying it),
+- per data path: unresolved rate (path absent from the payloads or from path_transcoding),
+- the evaluation cost, in file order and in the suggested order.
+
+The suggested order visits the most selective paths first; written with --order, it is
+used by the engine (RulesRegistry) to stop the evaluation as soon as no rule can match.
+
+Usage:
+    python -m ceh_utils.profiler payloads.ndjson [--rules rules.yaml] [--transcoding path_transcoding.py]
+                                 [--date 2024-01-01] [--json report.json] [--order path_order.json] [--top 20]
+"""
+# CORE
+from typing import Any, Dict, Iterable, List, Optional
+from collections import Counter
+from datetime import date, datetime
+import argparse
+import json
+import runpy
+import sys
+import time
+
+# OWN
+from ceh_utils.engine import CompiledRuleSet, compile_rules
+from ceh_utils.tools import select_highest_priority_rule
+from files_utils.tools import load_rules_from_yaml, read_ndjson
+
+
+def unmapped_paths(rules: List[Dict[str, Any]], transcoding: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    Business paths used by the rules but missing from path_transcoding (ex: "temps d'attente"):
+    they are read as raw data paths, which usually resolve to nothing.
+
+    Returns:
+        dict: business path -> codes of the rules using it.
+    """
+    missing: Dict[str, List[str]] = {}
+    for rule in rules or []:
+        conditions = rule.get('conditions') or {}
+        for member in (conditions.get('condition_members') or {}).values():
+            path = member.get('path')
+            if path not in transcoding:
+                missing.setdefault(path, []).append(conditions.get('code'))
+    return missing
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+class RuleProfiler:
+    """
+    Accumulates, payload by payload, the statistics of a compiled rule set.
+    The member ids are those of CompiledRuleSet (rules and members in file order).
+    """
+
+    def __init__(self, rule_set: CompiledRuleSet, transcoding: Dict[str, str], current_date: Optional[date] = None):
+        self.rule_set = rule_set
+        self.current_date = current_date or date.today()
+        self.business_names = {data_path: name for name, data_path in transcoding.items()}
+        self.members = [(rule_id, path, predicate)
+                        for rule_id, rule in enumerate(rule_set.rules) for path, predicate in rule.members]
+        self.payloads = 0
+        self.rule_matches = Counter()
+        self.rule_selected = Counter()
+        self.shadowed_by: Dict[int, Counter] = {}
+        self.member_passes = Counter()
+        self.path_unresolved = Counter()
+        self.path_seconds = Counter()
+
+    def add(self, ceh_data: Dict[str, Any]) -> None:
+        self.payloads += 1
+        for position, path_index in enumerate(self.rule_set.path_indexes):
+            start = time.perf_counter()
+            value = path_index.path.resolve(ceh_data)
+            satisfied = set(path_index.satisfied(value))
+            self.path_seconds[position] += time.perf_counter() - start
+            if value is None or value == []:
+                self.path_unresolved[position] += 1
+            self.member_passes.update(satisfied)
+
+        rule_ids = [rule_id for rule_id in self.rule_set.matching_rule_ids(ceh_data)
+                    if not self.rule_set.rules[rule_id].is_expired(self.current_date)]
+        matched = [self.rule_set.rules[rule_id].as_match() for rule_id in rule_ids]
+        selected = select_highest_priority_rule(matched)
+        if selected is None:
+            return
+        winner = rule_ids[matched.index(selected)]
+        self.rule_selected[winner] += 1
+        for rule_id in rule_ids:
+            self.rule_matches[rule_id] += 1
+            if rule_id != winner:
+                self.shadowed_by.setdefault(rule_id, Counter())[self.rule_set.rules[winner].code] += 1
+
+    def _rate(self, count: int) -> float:
+        return count / self.payloads if self.payloads else 0.0
+
+    def rules_report(self) -> List[Dict[str, Any]]:
+        report = []
+        for rule_id, rule in enumerate(self.rule_set.rules):
+            matches, selected = self.rule_matches[rule_id], self.rule_selected[rule_id]
+            if not matches:
+                status = "dead"
+            elif not selected:
+                status = "shadowed"
+            else:
+                status = "active"
+            report.append({
+                "code": rule.code, "name": rule.name, "priority": rule.priority, "members": len(rule.members),
+                "matches": matches, "match_rate": self._rate(matches),
+                "selected": selected, "selection_rate": self._rate(selected), "status": status,
+                "shadowed_by": dict(self.shadowed_by.get(rule_id, Counter()).most_common()),
+            })
+        return report
+
+    def conditions_report(self) -> List[Dict[str, Any]]:
+        report = []
+        for member_id, (rule_id, path, predicate) in enumerate(self.members):
+            report.append({
+                "rule": self.rule_set.rules[rule_id].code, "path": self.business_names.get(path.path, path.path),
+                "data_path": path.path, "condition": repr(predicate),
+                "pass_rate": self._rate(self.member_passes[member_id]),
+            })
+        return report
+
+    def paths_report(self) -> List[Dict[str, Any]]:
+        pass_rates: Dict[str, List[float]] = {}
+        for member_id, (_, path, _) in enumerate(self.members):
+            pass_rates.setdefault(path.path, []).append(self._rate(self.member_passes[member_id]))
+        report = []
+        for position, path_index in enumerate(self.rule_set.path_indexes):
+            rates = pass_rates.get(path_index.path.path, [])
+            report.append({
+                "data_path": path_index.path.path,
+                "path": self.business_names.get(path_index.path.path, path_index.path.path),
+                "members": len(rates),
+                "mean_pass_rate": sum(rates) / len(rates) if rates else 1.0,
+                "unresolved_rate": self._rate(self.path_unresolved[position]),
+                "cost_us": self.path_seconds[position] / self.payloads * 1e6 if self.payloads else 0.0,
+            })
+        return report
+
+    def suggest_path_order(self) -> List[str]:
+        """
+        Evaluation order for the engine's short-circuit, which stops once every rule has been
+        reached by one of its paths and ruled out. Greedy: next comes the path that rules out
+        the most rules not reached yet (sum of the failure rates of their members there);
+        once every rule is reached, the remaining paths by increasing mean pass rate.
+        """
+        paths = {p["data_path"]: p for p in self.paths_report()}
+        failures: Dict[str, Dict[int, float]] = {}
+        for member_id, (rule_id, path, _) in enumerate(self.members):
+            rule_failures = failures.setdefault(path.path, {})
+            rule_failures[rule_id] = rule_failures.get(rule_id, 0.0) + 1 - self._rate(self.member_passes[member_id])
+
+        order: List[str] = []
+        unreached = {rule_id for rule_id, _, _ in self.members}
+        candidates = set(paths)
+        while unreached and candidates:
+            best = max(sorted(candidates), key=lambda data_path: (
+                sum(failure for rule_id, failure in failures.get(data_path, {}).items() if rule_id in unreached),
+                -paths[data_path]["cost_us"]))
+            order.append(best)
+            candidates.discard(best)
+            unreached.difference_update(failures.get(best, {}))
+        order.extend(sorted(candidates, key=lambda data_path: (paths[data_path]["mean_pass_rate"],
+                                                               paths[data_path]["cost_us"])))
+        return order
+
+
+def measure_cost(payloads: Iterable[Dict[str, Any]], rule_sets: Dict[str, CompiledRuleSet]) -> Dict[str, Any]:
+    """
+    Time matching_rule_ids on every payload for each rule set, and count the payloads on
+    which they disagree (always 0: the order only changes the cost).
+
+    Returns:
+        dict: per rule set mean/p50/p95/p99 in microseconds, and 'mismatches'.
+    """
+    timings: Dict[str, List[float]] = {name: [] for name in rule_sets}
+    mismatches = 0
+    for ceh_data in payloads:
+        results = []
+        for name, rule_set in rule_sets.items():
+            start = time.perf_counter()
+            results.append(rule_set.matching_rule_ids(ceh_data))
+            timings[name].append((time.perf_counter() - start) * 1e6)
+        mismatches += any(result != results[0] for result in results)
+
+    cost: Dict[str, Any] = {"mismatches": mismatches}
+    for name, values in timings.items():
+        values.sort()
+        cost[name] = {"mean_us": sum(values) / len(values) if values else 0.0, "p50_us": _percentile(values, 50),
+                      "p95_us": _percentile(values, 95), "p99_us": _percentile(values, 99)}
+    return cost
+
+
+def profile_corpus(corpus_path: str, rules: List[Dict[str, Any]], transcoding: Dict[str, str],
+                   current_date: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Replay the corpus (twice: statistics, then cost of both orders) and build the report.
+    """
+    rule_set = compile_rules(rules, transcoding, current_date)
+    profiler = RuleProfiler(rule_set, transcoding, current_date)
+    for ceh_data in read_ndjson(corpus_path):
+        profiler.add(ceh_data)
+
+    order = profiler.suggest_path_order()
+    ordered = compile_rules(rules, transcoding, current_date, path_order=order)
+    cost = measure_cost(read_ndjson(corpus_path), {"file_order": rule_set, "suggested_order": ordered})
+
+    return {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "payloads": profiler.payloads,
+        "rules": len(rule_set),
+        "rules_dropped": len(rules or []) - len(rule_set),
+        "unmapped_paths": unmapped_paths(rules, transcoding),
+        "rule_stats": profiler.rules_report(),
+        "conditions": profiler.conditions_report(),
+        "paths": profiler.paths_report(),
+        "cost": cost,
+        "path_order": order,
+    }
+
+
+def print_report(report: Dict[str, Any], top: int) -> None:
+    rules = report["rule_stats"]
+    print(f"{report['payloads']} payloads, {report['rules']} rules "
+          f"({report['rules_dropped']} expired or invalid rules dropped)\n")
+
+    print("Rules (most matched first):")
+    print(f"  {'code':<30} {'prio':>4} {'match %':>8} {'select %':>9}  status")
+    for rule in sorted(rules, key=lambda r: -r["matches"])[:top]:
+        print(f"  {rule['code']:<30} {rule['priority']:>4} {rule['match_rate'] * 100:>8.2f} "
+              f"{rule['selection_rate'] * 100:>9.2f}  {rule['status']}")
+
+    dead = [rule["code"] for rule in rules if rule["status"] == "dead"]
+    print(f"\nDead rules (never matched): {len(dead)}")
+    for code in dead[:top]:
+        print(f"  {code}")
+    shadowed = [rule for rule in rules if rule["status"] == "shadowed"]
+    print(f"\nShadowed rules (matched, never selected): {len(shadowed)}")
+    for rule in shadowed[:top]:
+        winners = ", ".join(f"{code} x{count}" for code, count in list(rule["shadowed_by"].items())[:3])
+        print(f"  {rule['code']:<30} {rule['matches']:>6} matches, beaten by {winners}")
+
+    never = [c for c in report["conditions"] if c["pass_rate"] == 0]
+    print(f"\nConditions never met: {len(never)}")
+    for condition in never[:top]:
+        print(f"  {condition['rule']:<30} {condition['path']} {condition['condition']}")
+
+    print("\nPaths (suggested evaluation order):")
+    print(f"  {'path':<45} {'members':>7} {'pass %':>7} {'unresolved %':>13} {'cost us':>8}")
+    paths = {p["data_path"]: p for p in report["paths"]}
+    for data_path in report["path_order"]:
+        p = paths[data_path]
+        print(f"  {p['path'][:45]:<45} {p['members']:>7} {p['mean_pass_rate'] * 100:>7.2f} "
+              f"{p['unresolved_rate'] * 100:>13.2f} {p['cost_us']:>8.2f}")
+
+    if report["unmapped_paths"]:
+        print("\nPaths missing from path_transcoding:")
+        for path, codes in report["unmapped_paths"].items():
+            print(f"  {path!r} used by {', '.join(map(str, codes))}")
+
+    cost = report["cost"]
+    print("\nEvaluation cost per payload (matching_rule_ids):")
+    for name in ("file_order", "suggested_order"):
+        print(f"  {name:<16} mean {cost[name]['mean_us']:8.2f} us  p50 {cost[name]['p50_us']:8.2f}  "
+              f"p95 {cost[name]['p95_us']:8.2f}  p99 {cost[name]['p99_us']:8.2f}")
+    if cost["mismatches"]:
+        print(f"  WARNING: {cost['mismatches']} payloads evaluated differently")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile the CEH rules over an NDJSON file of recorded payloads.")
+    parser.add_argument('input', help="NDJSON file, one CEH payload per line")
+    parser.add_argument('--rules', default='./data/rules_data/rules.yaml')
+    parser.add_argument('--transcoding', default='./data/rules_data/path_transcoding.py')
+    parser.add_argument('--date', type=date.fromisoformat, default=None,
+                        help="reference date for rule validity (YYYY-MM-DD), today by default")
+    parser.add_argument('--json', help="write the full report to this JSON file")
+    parser.add_argument('--order', help="write the suggested path order to this file (read by the rules registry)")
+    parser.add_argument('--top', type=int, default=20, help="lines per section of the printed report")
+    args = parser.parse_args(argv)
+
+    rules = load_rules_from_yaml(args.rules)
+    transcoding = runpy.run_path(args.transcoding).get('path_transcoding')
+    report = profile_corpus(args.input, rules, transcoding, args.date)
+    if not report["payloads"]:
+        print(f"No payload in {args.input}", file=sys.stderr)
+        return 1
+    print_report(report, args.top)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+    if args.order:
+        cost = report["cost"]
+        if cost["suggested_order"]["mean_us"] >= cost["file_order"]["mean_us"]:
+            print("\nNote: the suggested order is not faster than the file order on this corpus")
+        with open(args.order, 'w') as f:
+            json.dump({"path_order": report["path_order"], "generated_at": report["generated_at"],
+                       "payloads": report["payloads"], "cost": cost}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# CORE
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from datetime import datetime
+import hashlib
+import io
+import logging
+import os
+import runpy
+import threading
+
+# THIRD PARTY
+import yaml
+
+# OWN
+from ceh_utils.engine import CompiledRuleSet, compile_rules, load_path_order
+from metrics_utils.tools import STAGE_LATENCY
+
+
+class RuleSetVersion(NamedTuple):
+    rule_set: CompiledRuleSet
+    version: str
+    loaded_at: datetime
+
+
+def validate_rules(rules: Any, transcoding: Any) -> None:
+    """
+    Check the structure of rules.yaml and path_transcoding before compiling them.
+
+    Raises:
+        ValueError: with every problem found.
+    """
+    errors: List[str] = []
+    if not isinstance(transcoding, dict) or not all(isinstance(v, str) for v in transcoding.values()):
+        errors.append("path_transcoding must be a dict of str paths")
+    if not isinstance(rules, list):
+        raise ValueError("rules must be a list, got %s" % type(rules).__name__)
+
+    for position, rule in enumerate(rules):
+        conditions = rule.get('conditions') if isinstance(rule, dict) else None
+        if not isinstance(conditions, dict):
+            errors.append(f"rule #{position}: missing 'conditions'")
+            continue
+        code = conditions.get('code', f"#{position}")
+        for field in ('code', 'name', 'priority', 'created_at'):
+            if conditions.get(field) is None:
+                errors.append(f"rule {code}: missing '{field}'")
+        members = conditions.get('condition_members') or {}
+        if not isinstance(members, dict):
+            errors.append(f"rule {code}: 'condition_members' must be a mapping")
+            continue
+        for key, member in members.items():
+            if not isinstance(member, dict) or not isinstance(member.get('path'), str):
+                errors.append(f"rule {code}: condition '{key}' has no 'path'")
+
+    if errors:
+        raise ValueError("; ".join(errors))
+
+
+class RulesRegistry:
+    """
+    Holds the current compiled rule set and reloads it when rules.yaml or
+    path_transcoding.py change on disk (mtime polling in a background thread).
+
+    A new version is validated and compiled off the request path, then swapped in
+    with a single reference assignment: a request that took `current` before the
+    swap finishes on the old version. An invalid file keeps the previous version.
+
+    The optional path order file (written by ceh_utils.profiler) is watched too;
+    when it exists the rules are evaluated in that order.
+    """
+
+    def __init__(self, rules_path: str, transcoding_path: str, poll_interval: float = 2.0,
+                 path_order_path: Optional[str] = None):
+        self.rules_path = rules_path
+        self.transcoding_path = transcoding_path
+        self.path_order_path = path_order_path
+        self.poll_interval = poll_interval
+        self._current: Optional[RuleSetVersion] = None
+        self._stamps: Optional[Tuple] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def current(self) -> RuleSetVersion:
+        if self._current is None:
+            raise RuntimeError("Rules are not loaded")
+        return self._current
+
+    def _file_stamps(self) -> Tuple:
+        stamps = []
+        for path in (self.rules_path, self.transcoding_path):
+            stat = os.stat(path)
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+        if self.path_order_path and os.path.exists(self.path_order_path):
+            stat = os.stat(self.path_order_path)
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stamps)
+
+    def _build(self) -> RuleSetVersion:
+        with open(self.rules_path, 'rb') as f:
+            rules_bytes = f.read()
+        with open(self.transcoding_path, 'rb') as f:
+            transcoding_bytes = f.read()
+
+        content = rules_bytes + b'\0' + transcoding_bytes
+        has_path_order = bool(self.path_order_path) and os.path.exists(self.path_order_path)
+        if has_path_order:
+            with open(self.path_order_path, 'rb') as f:
+                content += b'\0' + f.read()
+        version = hashlib.sha256(content).hexdigest()[:12]
+        if self._current is not None and self._current.version == version:
+            return self._current
+
+        with STAGE_LATENCY.time(stage="rules_load"):
+            rules = yaml.safe_load(io.BytesIO(rules_bytes))
+            transcoding: Dict[str, str] = runpy.run_path(self.transcoding_path).get('path_transcoding')
+            validate_rules(rules, transcoding)
+            path_order = load_path_order(self.path_order_path) if has_path_order else None
+        with STAGE_LATENCY.time(stage="rules_compile"):
+            rule_set = compile_rules(rules, transcoding, path_order=path_order)
+        return RuleSetVersion(rule_set, version, datetime.now())
+
+    def load(self) -> RuleSetVersion:
+        """
+        Load and compile the files, and swap the new version in.
+        Errors are raised to the caller and leave the current version untouched.
+        """
+        with self._lock:
+            stamps = self._file_stamps()
+            new_version = self._build()
+            if self._current is None or new_version.version != self._current.version:
+                logging.info("Rules version %s loaded (%d rules)", new_version.version, len(new_version.rule_set))
+            self._current = new_version
+            self._stamps = stamps
+            return new_version
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the rules if one of the files changed since the last load.
+
+        Returns:
+            bool: True if a new version was swapped in.
+        """
+        try:
+            stamps = self._file_stamps()
+        except OSError as e:
+            logging.error("Rules files unavailable: %s", e)
+            return False
+        if stamps == self._stamps:
+            return False
+
+        previous = self._current
+        try:
+            return self.load() is not previous
+        except Exception as e:
+            logging.error("Rules reload failed, keeping version %s: %s",
+                          previous.version if previous else None, e)
+            # Ne pas réessayer tant que les fichiers ne changent pas à nouveau
+            self._stamps = stamps
+            return False
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.reload_if_changed()
+
+    def start(self) -> None:
+        """Start watching the files in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="rules-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
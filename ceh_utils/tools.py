@@ -7,6 +7,7 @@ from datetime import date
 
 # OWN
 from data.rules_data.path_transcoding import path_transcoding
+from ceh_utils.paths import compile_path
 
 
 def parse_condition(condition: str) -> List[Tuple[Callable[[Any, Any], bool], Any]]:
@@ -43,6 +44,16 @@ def parse_condition(condition: str) -> List[Tuple[Callable[[Any, Any], bool], An
             conditions.append((op, value))
     
     return conditions
+
+
+def is_comparison(condition_value: Any) -> bool:
+    """
+    Indique si la valeur de condition doit être interprétée comme une comparaison
+    (ex: ">= 10 or < 3") plutôt que comme une égalité stricte.
+    """
+    return isinstance(condition_value, str) and any(op in condition_value for op in ['>', '<', '>=', '<=', 'or'])
+
+
 def check_condition(ceh_data: Dict[str, Any], key: str, value: Dict[str, Any]) -> bool:
     """
     Check if a given condition is met in the JSON data.
@@ -57,12 +68,9 @@ def check_condition(ceh_data: Dict[str, Any], key: str, value: Dict[str, Any]) -
     """
     data_path = value.get('path')
     condition_value = value.get('value')
-    # Utilisez une expression régulière pour séparer les indices de liste et les clés de dictionnaire
-    path_parts = re.split(r'\.|\[|\]', data_path.replace(']', ''))  # Découpe des '.' et '[]'
-
-    data = get_value_from_path(ceh_data, path_parts) 
+    data = compile_path(data_path).resolve(ceh_data)
 
-    if isinstance(condition_value, str) and any(op in condition_value for op in ['>', '<', '>=', '<=', 'or']):
+    if is_comparison(condition_value):
         parsed_condition = parse_condition(condition_value)
         return any(op(data, val) for op, val in parsed_condition)
     else:
@@ -84,8 +92,6 @@ def apply_rules(ceh_data: Dict[str, Any], rules: List[Dict[str, Any]]) -> List[T
     for rule in rules:
         try:
             condition_members: Dict[str, Any] = rule.get('conditions', {}).get('condition_members', {})
-            logging.warning('condition_members')
-            logging.warning(condition_members)
 
         except Exception as e:
             logging.error(e)
@@ -104,10 +110,11 @@ def apply_rules(ceh_data: Dict[str, Any], rules: List[Dict[str, Any]]) -> List[T
         
         try:
             condition_met: bool = all(check_condition(ceh_data, key, value) for key, value in condition_members.items())
-            print("CONDITION MET")
-            print(condition_met)
+            # Arguments formatés seulement si le niveau DEBUG est actif
+            logging.debug("rule=%s condition_met=%s", rule.get('conditions', {}).get('code'), condition_met)
         except Exception as e:
             logging.error(e)
+            condition_met = False  # Valeur absente ou non comparable: la règle n'est pas remplie
         try:
             if condition_met:
                 message: str = rule.get('conditions').get('message')
@@ -117,11 +124,9 @@ def apply_rules(ceh_data: Dict[str, Any], rules: List[Dict[str, Any]]) -> List[T
                 code: str = rule.get('conditions').get('code')
                 condition_members_len = len(condition_members)
                 matched_messages.append((name, message, priority, created_at, rule_validity, code, condition_members_len))
-
-                print("Matched message: ", matched_messages)
         except Exception as e:
             logging.error(e)
-    logging.warning("Matched messages: %s", matched_messages)
+    logging.debug("matched_rules=%s", [matched[5] for matched in matched_messages])
     return matched_messages
 
 def get_value_from_path(data, path_parts):
@@ -157,10 +162,14 @@ def format_matched_message(matched_message: List[tuple]) -> List[Dict[str, str]]
 
     Parameters:
     matched_messages (list): A list of tuples containing the matched messages with elements (name, message, priority, rule_validity, code).
-    
+
     Returns:
     list: A list of dictionaries containing formatted messages with fields 'name', 'message', 'priority', 'created_at', 'validity', and 'code'.
+          An empty list when no rule matched.
     """
+    if matched_message is None:
+        return []
+
     (name, message, priority, created_at, rule_validity, code, condition_members_len) = matched_message
     formatted_messages: List[Dict[str, str]] = [
         {
@@ -178,8 +187,7 @@ def apply_transcoding(condition, path_transcoding):
     if condition['path'] in path_transcoding:
         condition['path'] = path_transcoding[condition['path']]
     else:
-        print("APPLY TRANSCORDING 3")
-        print(condition['path'])
+        logging.debug("path=%r has no transcoding", condition['path'])
 
     return condition
 
@@ -202,16 +210,3 @@ def select_highest_priority_rule(rules):
     # On utilise max avec une clé qui prend en compte la priorité et la date de création inverse
     # pour que la règle la plus récente soit choisie en cas d'égalité de priorité.
     return max(rules, key=lambda rule: (-rule[2], rule[3].toordinal(), rule[6]))
-
-
-def get_meteo_for_location(ceh_data: Dict[str, Any]) -> str:
-    """
-    Get the weather for a given location for assistance vehicle
-
-    """
-    request_type = ceh_data.get('flow', {}).get('content', {}).get('collectedData', {}).get('request', {}).get('requestType', {})
-    
-    weather = ceh_data.get('flow', {}).get('content', {}).get('collectedData', {}).get('requestGeneralInformation', {}).get('weather', {})
-
-    waiting = ceh_data.get('flow', {}).get('content', {}).get('collectedData', {}).get('requestGeneralInformation', {}).get('waiting', {})
-    
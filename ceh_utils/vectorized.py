@@ -0,0 +1,159 @@
+"""
+Vectorized evaluation of the compiled rules over a collection of CEH payloads,
+for offline what-if analysis.
+
+The payloads are flattened once into a DataFrame with one column per data path
+used by the rules; each rule then becomes a boolean mask over the rows, and the
+winner of each row is found with array operations.
+
+Usage:
+    python -m ceh_utils.vectorized payloads.ndjson results.parquet [--rules rules.yaml] [--date 2024-01-01]
+"""
+# CORE
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import date
+import argparse
+import sys
+
+# THIRD PARTY
+import numpy as np
+import pandas as pd
+
+# OWN
+from ceh_utils.engine import CompiledRuleSet, Comparison, Equals, load_rule_set
+from files_utils.tools import read_ndjson
+
+
+def flatten_payloads(payloads: Iterable[Dict[str, Any]], rule_set: CompiledRuleSet) -> pd.DataFrame:
+    """
+    Flatten CEH payloads into a DataFrame with one column per data path used by the rules.
+
+    Args:
+        payloads: the CEH documents.
+        rule_set: the compiled rules, which give the paths to extract.
+
+    Returns:
+        pd.DataFrame: one row per payload, indexed by the document 'id'.
+    """
+    paths = [path_index.path for path_index in rule_set.path_indexes]
+    ids: List[Any] = []
+    rows: List[Tuple[Any, ...]] = []
+    for payload in payloads:
+        ids.append(payload.get('id') if isinstance(payload, dict) else None)
+        rows.append(tuple(path.resolve(payload) for path in paths))
+
+    # Les valeurs restent des objets Python (None n'est pas converti en NaN) pour garder la sémantique de ==
+    return pd.DataFrame(rows, columns=[path.path for path in paths],
+                        index=pd.Index(ids, name='id'), dtype=object)
+
+
+def _numeric(column: pd.Series) -> np.ndarray:
+    """Numeric view of a column: NaN wherever a Python comparison with a float would fail."""
+    return np.array([value if isinstance(value, (int, float)) else np.nan for value in column], dtype=float)
+
+
+def rule_masks(frame: pd.DataFrame, rule_set: CompiledRuleSet, current_date: Optional[date] = None) -> Dict[int, np.ndarray]:
+    """
+    Evaluate every valid rule as a boolean mask over the rows of a flattened frame.
+
+    Returns:
+        dict: rule id (position in the rule set) -> boolean array, for the rules not expired.
+    """
+    current_date = current_date or date.today()
+    numeric_columns: Dict[str, np.ndarray] = {}
+    masks: Dict[int, np.ndarray] = {}
+
+    for rule_id, rule in enumerate(rule_set.rules):
+        if rule.is_expired(current_date):
+            continue
+        mask = np.ones(len(frame), dtype=bool)
+        for path, predicate in rule.members:
+            name = path.path
+            column = frame[name]
+            if isinstance(predicate, Comparison):
+                if name not in numeric_columns:
+                    numeric_columns[name] = _numeric(column)
+                member_mask = np.zeros(len(frame), dtype=bool)
+                with np.errstate(invalid='ignore'):
+                    for op, val in predicate.clauses:
+                        member_mask |= op(numeric_columns[name], val)
+            elif isinstance(predicate, Equals) and predicate.value is None:
+                # `column == None` est faux partout dans pandas: chemin absent ou null
+                member_mask = column.isna().to_numpy(dtype=bool)
+            elif isinstance(predicate, Equals) and not isinstance(predicate.value, (list, dict)):
+                member_mask = (column == predicate.value).to_numpy(dtype=bool)
+            else:
+                member_mask = column.map(predicate).to_numpy(dtype=bool)
+            mask &= member_mask
+        masks[rule_id] = mask
+
+    return masks
+
+
+def match_frame(frame: pd.DataFrame, rule_set: CompiledRuleSet, current_date: Optional[date] = None) -> pd.DataFrame:
+    """
+    Which rules each row matches, ex: match_frame(frame, rule_set)['PANNE_HOME'].sum().
+
+    Returns:
+        pd.DataFrame: one boolean column per valid rule (named by its code), same index as `frame`.
+    """
+    masks = rule_masks(frame, rule_set, current_date)
+    return pd.DataFrame({rule_set.rules[rule_id].code: mask for rule_id, mask in masks.items()}, index=frame.index)
+
+
+def select_winners(frame: pd.DataFrame, rule_set: CompiledRuleSet, current_date: Optional[date] = None) -> pd.DataFrame:
+    """
+    Vectorized equivalent of select_highest_priority_rule on every row of a flattened frame.
+
+    Returns:
+        pd.DataFrame: columns 'id' and 'code' (None when no rule matched).
+    """
+    masks = rule_masks(frame, rule_set, current_date)
+    # Même clé que select_highest_priority_rule; le tri stable garde le premier en cas d'égalité
+    rule_ids = sorted(masks, key=lambda rule_id: (-rule_set.rules[rule_id].priority,
+                                                  rule_set.rules[rule_id].created_at.toordinal(),
+                                                  len(rule_set.rules[rule_id].members)), reverse=True)
+    codes = np.array([rule_set.rules[rule_id].code for rule_id in rule_ids] + [None], dtype=object)
+
+    matrix = np.column_stack([masks[rule_id] for rule_id in rule_ids] + [np.ones(len(frame), dtype=bool)])
+    # La dernière colonne (toujours vraie) désigne l'absence de règle
+    winners = matrix.argmax(axis=1)
+    return pd.DataFrame({'id': frame.index.to_numpy(), 'code': codes[winners]})
+
+
+def evaluate_payloads(payloads: Iterable[Dict[str, Any]], rule_set: CompiledRuleSet,
+                      current_date: Optional[date] = None) -> pd.DataFrame:
+    """
+    Flatten and evaluate a collection of CEH payloads.
+
+    Returns:
+        pd.DataFrame: (id, code) of the rule selected for each payload.
+    """
+    return select_winners(flatten_payloads(payloads, rule_set), rule_set, current_date)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Evaluate the CEH rules over an NDJSON file of payloads.")
+    parser.add_argument('input', help="NDJSON file, one CEH payload per line")
+    parser.add_argument('output', help="output file, .parquet or .csv")
+    parser.add_argument('--rules', default='./data/rules_data/rules.yaml')
+    parser.add_argument('--date', type=date.fromisoformat, default=None,
+                        help="reference date for rule validity (YYYY-MM-DD), today by default")
+    args = parser.parse_args(argv)
+
+    rule_set = load_rule_set(args.rules, current_date=args.date)
+    results = evaluate_payloads(read_ndjson(args.input), rule_set, args.date)
+
+    if args.output.endswith('.parquet'):
+        try:
+            results.to_parquet(args.output, index=False)
+        except ImportError as e:
+            print(f"Parquet output needs pyarrow or fastparquet: {e}", file=sys.stderr)
+            return 1
+    else:
+        results.to_csv(args.output, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
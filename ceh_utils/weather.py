@@ -0,0 +1,279 @@
+"""
+Enrichissement météo des documents CEH: la météo du lieu de l'assistance est ajoutée
+au document sous WEATHER_KEY avant l'évaluation, et les règles la lisent comme un
+autre chemin (`météo`, `température` dans path_transcoding).
+
+Un appel au fournisseur par requête /ceh ajouterait un aller-retour réseau au chemin
+critique, donc:
+- la météo est gardée WEATHER_CACHE_TTL secondes par lieu grossier (département, à
+  défaut ville, à défaut coordonnées arrondies);
+- les recherches simultanées d'un même lieu ne font qu'un appel (SingleFlight);
+- la requête n'attend pas plus de WEATHER_BUDGET_MS: au-delà, elle est évaluée sans
+  météo (les règles météo ne sont pas remplies) et la recherche continue en
+  arrière-plan pour remplir le cache;
+- un fournisseur en erreur n'est pas rappelé pour ce lieu pendant WEATHER_ERROR_TTL;
+- rien n'est cherché si aucune règle ne lit la météo.
+"""
+# CORE
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import asyncio
+import logging
+import os
+import unicodedata
+import zlib
+
+# OWN
+from data.rules_data.path_transcoding import path_transcoding
+from cache_utils.tools import LRUCache
+from cache_utils.singleflight import SingleFlight
+from ceh_utils.engine import CompiledRuleSet
+from ceh_utils.paths import compile_path
+from ceh_utils.payload import parse_payload
+from metrics_utils.tools import WEATHER_LOOKUPS
+
+
+# Fournisseur: "stub" (local, déterministe), "http" (WEATHER_API_URL), vide: pas d'enrichissement
+WEATHER_PROVIDER = os.environ.get("WEATHER_PROVIDER", "")
+WEATHER_API_URL = os.environ.get("WEATHER_API_URL", "")
+# Attente maximale d'une requête /ceh pour la météo, en millisecondes
+WEATHER_BUDGET_MS = float(os.environ.get("WEATHER_BUDGET_MS", 50))
+# Durée maximale d'un appel au fournisseur (poursuivi en arrière-plan après le budget), en secondes
+WEATHER_FETCH_TIMEOUT = float(os.environ.get("WEATHER_FETCH_TIMEOUT", 5))
+WEATHER_CACHE_TTL = float(os.environ.get("WEATHER_CACHE_TTL", 900))
+WEATHER_CACHE_SIZE = int(os.environ.get("WEATHER_CACHE_SIZE", 1024))
+# Durée pendant laquelle un lieu en erreur n'est pas redemandé au fournisseur, en secondes
+WEATHER_ERROR_TTL = float(os.environ.get("WEATHER_ERROR_TTL", 30))
+# Décimales gardées sur les coordonnées (1: environ 11 km)
+WEATHER_COORDINATE_PRECISION = int(os.environ.get("WEATHER_COORDINATE_PRECISION", 1))
+
+# Clef du document où la météo est ajoutée (chemins `_weather.condition`, `_weather.temperature`...)
+WEATHER_KEY = "_weather"
+
+# Lieu grossier: ("department", "59"), ("city", "lille") ou ("coordinates", 50.6, 3.1)
+Location = Tuple[Union[str, float], ...]
+
+
+def _resolve(ceh_data: Dict[str, Any], transcoding: Dict[str, str], name: str) -> Any:
+    # Chemin du transcodage courant (rechargé à chaud avec les règles), compilé une fois par compile_path
+    path = transcoding.get(name)
+    return compile_path(path).resolve(ceh_data) if path else None
+
+
+def _normalize(name: str) -> str:
+    """Minuscules, sans accents ni espaces superflus."""
+    name = unicodedata.normalize("NFKD", name.lower())
+    return " ".join("".join(char for char in name if not unicodedata.combining(char)).split())
+
+
+def coarse_location(ceh_data: Dict[str, Any], transcoding: Dict[str, str] = path_transcoding,
+                    precision: int = WEATHER_COORDINATE_PRECISION) -> Optional[Location]:
+    """
+    The location of the assistance, coarse enough to be shared by many payloads:
+    the department, else the city, else the rounded coordinates (None if none is known).
+    The paths are those of `transcoding` (the one of the rule set, see CompiledRuleSet.transcoding).
+    """
+    department = _resolve(ceh_data, transcoding, "departement")
+    if isinstance(department, (str, int)) and str(department).strip():
+        return ("department", str(department).strip().upper())
+
+    city = _resolve(ceh_data, transcoding, "ville")
+    if isinstance(city, str) and city.strip():
+        return ("city", _normalize(city))
+
+    try:
+        latitude = float(_resolve(ceh_data, transcoding, "latitude"))
+        longitude = float(_resolve(ceh_data, transcoding, "longitude"))
+    except (TypeError, ValueError):
+        return None
+    return ("coordinates", round(latitude, precision), round(longitude, precision))
+
+
+def reads_weather(rule_set: CompiledRuleSet) -> bool:
+    """Whether a rule of `rule_set` reads a path under WEATHER_KEY."""
+    prefix = WEATHER_KEY + "."
+    return any(path_index.path.path.startswith(prefix) for path_index in rule_set.path_indexes)
+
+
+class StubWeatherProvider:
+    """
+    Fournisseur local pour les tests et le développement: une météo fixe (`weather`)
+    ou, à défaut, une météo stable déduite du lieu. `latency` simule l'appel réseau.
+    """
+
+    CONDITIONS = ("dégagé", "nuageux", "pluie", "neige", "orage", "brouillard")
+
+    def __init__(self, weather: Optional[Dict[str, Any]] = None, latency: float = 0.0):
+        self.weather = weather
+        self.latency = latency
+        self.calls = 0
+
+    async def fetch(self, location: Location) -> Dict[str, Any]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.weather is not None:
+            return dict(self.weather)
+        seed = zlib.crc32(repr(location).encode())
+        return {"condition": self.CONDITIONS[seed % len(self.CONDITIONS)], "temperature": seed % 40 - 10}
+
+    async def close(self) -> None:
+        pass
+
+
+class HttpWeatherProvider:
+    """
+    Météo d'un service HTTP: GET `url` avec le lieu en paramètres (department, city ou
+    latitude et longitude), réponse JSON {"condition": ..., "temperature": ..., ...}.
+    """
+
+    def __init__(self, url: str, timeout: float = WEATHER_FETCH_TIMEOUT):
+        import httpx
+
+        self.url = url
+        self.http_client = httpx.AsyncClient(timeout=timeout)
+
+    async def fetch(self, location: Location) -> Dict[str, Any]:
+        kind, *values = location
+        params = dict(zip(("latitude", "longitude"), values)) if kind == "coordinates" else {kind: values[0]}
+        response = await self.http_client.get(self.url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def close(self) -> None:
+        await self.http_client.aclose()
+
+
+def _retrieve_exception(task: "asyncio.Task") -> None:
+    # Recherche terminée après le budget: son erreur est déjà journalisée
+    if not task.cancelled():
+        task.exception()
+
+
+class WeatherEnricher:
+    """
+    Adds the weather of their location to CEH payloads, within a latency budget.
+
+    The provider is any object with `async fetch(location) -> dict` and `async close()`
+    (StubWeatherProvider, HttpWeatherProvider).
+
+    Args:
+        provider: the weather source.
+        budget: seconds a request waits for the weather before being evaluated without it.
+        ttl: seconds the weather of a location is kept.
+        maxsize: number of locations kept.
+        error_ttl: seconds a location whose lookup failed is not asked again.
+        fetch_timeout: seconds given to a provider call.
+    """
+
+    def __init__(self, provider: Any, budget: float = WEATHER_BUDGET_MS / 1000, ttl: float = WEATHER_CACHE_TTL,
+                 maxsize: int = WEATHER_CACHE_SIZE, error_ttl: float = WEATHER_ERROR_TTL,
+                 fetch_timeout: float = WEATHER_FETCH_TIMEOUT):
+        self.provider = provider
+        self.budget = budget
+        self.fetch_timeout = fetch_timeout
+        self._weather: LRUCache[Dict[str, Any]] = LRUCache(maxsize, ttl or None)
+        self._failures: LRUCache[bool] = LRUCache(maxsize, error_ttl)
+        self._lookups: SingleFlight[Dict[str, Any]] = SingleFlight("weather_lookup")
+        self._background: set = set()
+
+    async def _fetch(self, location: Location) -> Dict[str, Any]:
+        try:
+            weather = await asyncio.wait_for(self.provider.fetch(location), self.fetch_timeout)
+        except Exception as e:
+            logging.warning("Weather lookup failed for %s: %r", location, e)
+            self._failures.set(location, True)
+            WEATHER_LOOKUPS.inc(outcome="error")
+            raise
+        self._weather.set(location, weather)
+        WEATHER_LOOKUPS.inc(outcome="fetched")
+        return weather
+
+    async def lookup(self, location: Location) -> Optional[Dict[str, Any]]:
+        """
+        The weather of `location`, or None when it is not known within the budget
+        (the lookup then goes on in the background) or the provider failed.
+        """
+        weather = self._weather.get(location)
+        if weather is not None:
+            WEATHER_LOOKUPS.inc(outcome="hit")
+            return weather
+        if location in self._failures:
+            WEATHER_LOOKUPS.inc(outcome="failed_recently")
+            return None
+
+        # La recherche est une tâche à part: le budget dépassé, la requête cesse d'attendre, pas la recherche
+        task = asyncio.ensure_future(self._lookups.do(location, self._fetch, location))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        task.add_done_callback(_retrieve_exception)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.budget)
+        except asyncio.TimeoutError:
+            WEATHER_LOOKUPS.inc(outcome="over_budget")
+        except Exception:
+            pass  # Déjà journalisée et comptée par _fetch
+        return None
+
+    async def enrich_all(self, rule_set: CompiledRuleSet, documents: Iterable[Any]) -> None:
+        """
+        Set WEATHER_KEY on every payload of `documents` (None when its weather is unknown),
+        with one lookup per distinct location, all within the same budget. Nothing is done
+        if no rule of `rule_set` reads the weather.
+        """
+        if not reads_weather(rule_set):
+            return
+        documents = [document for document in documents if isinstance(document, dict)]
+        locations = [coarse_location(document, rule_set.transcoding) for document in documents]
+        distinct = list(dict.fromkeys(location for location in locations if location is not None))
+        found = dict(zip(distinct, await asyncio.gather(*(self.lookup(location) for location in distinct))))
+        for document, location in zip(documents, locations):
+            if location is None:
+                WEATHER_LOOKUPS.inc(outcome="no_location")
+            # Remplacée même si le client l'a envoyée: les règles ne lisent que la météo du fournisseur
+            document[WEATHER_KEY] = found.get(location)
+
+    async def enrich(self, rule_set: CompiledRuleSet, ceh_data: Dict[str, Any]) -> None:
+        """enrich_all for a single payload."""
+        await self.enrich_all(rule_set, (ceh_data,))
+
+    async def enrich_chunk(self, rule_set: CompiledRuleSet, items: List[Tuple[int, Any]]) -> List[Tuple[int, Any]]:
+        """
+        enrich_all for a chunk of /ceh/batch items: the raw NDJSON lines are decoded here
+        (an invalid line is left as is, its error is reported by the evaluation).
+        """
+        if not reads_weather(rule_set):
+            return items
+        decoded = []
+        for index, payload in items:
+            if isinstance(payload, (bytes, str)):
+                try:
+                    payload = parse_payload(payload)
+                except ValueError:
+                    pass
+            decoded.append((index, payload))
+        await self.enrich_all(rule_set, (payload for _, payload in decoded))
+        return decoded
+
+    def stats(self) -> Dict[str, Any]:
+        return self._weather.stats()
+
+    async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        await self.provider.close()
+
+
+def create_weather_enricher(provider_name: str = WEATHER_PROVIDER) -> Optional[WeatherEnricher]:
+    """The WeatherEnricher of WEATHER_PROVIDER, or None when weather enrichment is disabled."""
+    if not provider_name:
+        return None
+    if provider_name == "stub":
+        provider = StubWeatherProvider()
+    elif provider_name == "http":
+        if not WEATHER_API_URL:
+            raise ValueError("WEATHER_PROVIDER=http requires WEATHER_API_URL")
+        provider = HttpWeatherProvider(WEATHER_API_URL)
+    else:
+        raise ValueError(f"Unknown WEATHER_PROVIDER {provider_name!r} (expected stub or http)")
+    logging.info("Weather enrichment: %s provider, %.0f ms budget", provider_name, WEATHER_BUDGET_MS)
+    return WeatherEnricher(provider)
@@ -11,5 +11,10 @@ path_transcoding = {
     "departement": "_embedded.documents[0].content.collectedData.requestGeneralInformation.address.department",
     "type de demande": "_embedded.documents[0].content.collectedData.request.requestType",
     "is abuser": "_embedded.documents[0].content.collectedData.requestGeneralInformation.isAbuser",
-    "intent":"_embedded.documents[0].content.callbotPathData.conversation.mainIntent"
+    "intent":"_embedded.documents[0].content.callbotPathData.conversation.mainIntent",
+    "latitude": "_embedded.documents[0].content.collectedData.location.latitude",
+    "longitude": "_embedded.documents[0].content.collectedData.location.longitude",
+    # Ajoutés par ceh_utils.weather avant l'évaluation
+    "météo": "_weather.condition",
+    "température": "_weather.temperature"
 }
\ No newline at end of file
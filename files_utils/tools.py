@@ -1,10 +1,9 @@
 import yaml
 import json
+import hashlib
 import logging
 import os
 
-import pandas as pd
-
 def load_rules_from_yaml(filename: str) -> dict:
     """
     Load rules from a YAML file.
@@ -24,7 +23,27 @@ def load_rules_from_yaml(filename: str) -> dict:
 
     return rules
 
+def read_ndjson(file_path):
+    """Lit un fichier NDJSON (un document JSON par ligne); les lignes invalides sont journalisées et ignorées.
+
+    Args:
+        file_path (str): Le chemin du fichier.
+
+    Yields:
+        Les documents décodés, dans l'ordre du fichier.
+    """
+    with open(file_path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                logging.error("%s:%d: %s", file_path, line_number, e)
+
 def load_csv(file_path):
+    # pandas n'est importé qu'ici: son coût de chargement n'est pas payé au démarrage
+    import pandas as pd
     return pd.read_csv(file_path, delimiter=';')
 
 def get_file_list(folder_path):
@@ -40,4 +59,20 @@ def get_file_list(folder_path):
     elements = os.listdir(folder_path)
     # Filtre pour ne garder que les fichiers (ignore les dossiers)
     files = [f for f in elements if os.path.isfile(os.path.join(folder_path, f))]
-    return files
\ No newline at end of file
+    return files
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Calcule l'empreinte SHA-256 du contenu d'un fichier, par blocs.
+
+    Args:
+        file_path (str): Le chemin du fichier.
+        chunk_size (int): La taille des blocs lus.
+
+    Returns:
+        str: L'empreinte hexadécimale.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
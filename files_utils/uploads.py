@@ -0,0 +1,67 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, NamedTuple
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploaded_files")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class StoredUpload(NamedTuple):
+    content_hash: str
+    path: str
+    size: int
+    is_new: bool
+
+
+def _hash_stream(stream: BinaryIO, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """Calcule le SHA-256 et la taille d'un flux, par blocs, puis le rembobine."""
+    digest = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+def store_stream(stream: BinaryIO, directory: str = UPLOAD_DIR, suffix: str = ".pdf") -> StoredUpload:
+    """Range un fichier sous le nom de son empreinte SHA-256 (stockage adressé par le contenu).
+
+    Le flux est d'abord lu par blocs pour calculer l'empreinte: si le même contenu
+    est déjà stocké, rien n'est écrit. Sinon il est copié dans un fichier temporaire
+    puis renommé, pour qu'un fichier incomplet ne soit jamais visible.
+
+    Args:
+        stream (BinaryIO): Le contenu à stocker.
+        directory (str): Le dossier de stockage.
+        suffix (str): L'extension des fichiers stockés.
+
+    Returns:
+        StoredUpload: L'empreinte, le chemin, la taille et si le contenu était nouveau.
+    """
+    content_hash, size = _hash_stream(stream)
+    path = os.path.join(directory, content_hash + suffix)
+    if os.path.exists(path):
+        return StoredUpload(content_hash, path, size, False)
+
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".part", delete=False) as tmp:
+        shutil.copyfileobj(stream, tmp, UPLOAD_CHUNK_SIZE)
+    os.replace(tmp.name, path)
+    return StoredUpload(content_hash, path, size, True)
+
+
+async def store_upload(file: UploadFile, directory: str = UPLOAD_DIR) -> StoredUpload:
+    """Range un fichier reçu (UploadFile) dans le stockage adressé par le contenu.
+
+    Le fichier n'est jamais chargé entièrement en mémoire: il est lu par blocs depuis
+    le fichier temporaire de la requête, hors de la boucle d'évènements.
+    """
+    return await run_in_threadpool(store_stream, file.file, directory)
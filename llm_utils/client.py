@@ -0,0 +1,189 @@
+# CORE
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Collection, Optional, Tuple, TypeVar
+import asyncio
+import logging
+import os
+import random
+
+# OWN
+from metrics_utils.tools import STAGE_LATENCY, record_usage
+
+
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 16))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 64))
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 60))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", 3))
+OPENAI_BACKOFF_BASE = float(os.environ.get("OPENAI_BACKOFF_BASE", 0.5))
+OPENAI_BACKOFF_MAX = float(os.environ.get("OPENAI_BACKOFF_MAX", 8))
+# Intervalle (secondes) entre deux lectures du statut d'une opération longue (run, lot de fichiers)
+OPENAI_POLL_INTERVAL = float(os.environ.get("OPENAI_POLL_INTERVAL", 1))
+
+if TYPE_CHECKING:
+    import httpx
+
+T = TypeVar("T")
+
+
+def import_sdk() -> Any:
+    """
+    Import the OpenAI SDK (and httpx), a few hundred milliseconds: on first use, or
+    in preload_state() so that the workers of server.py inherit it already imported.
+    """
+    import openai
+    return openai
+
+
+def retryable_errors(idempotent: bool = True) -> Tuple[type, ...]:
+    """
+    Transient errors for which a new attempt makes sense. For a call that creates
+    something (file, vector store, assistant, thread, run), only the rate limit
+    errors: after a timeout or a 5xx the request may have been processed, and a new
+    attempt could create the resource twice.
+    """
+    openai = import_sdk()
+    if not idempotent:
+        return (openai.RateLimitError,)
+    return (
+        openai.APIConnectionError,  # inclut APITimeoutError
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+
+
+class LLMClient:
+    """
+    Async OpenAI client shared by every LLM endpoint: one HTTP connection pool,
+    a limit on the number of concurrent calls, a timeout and retries with
+    exponential backoff on transient errors. The calls that create a remote resource
+    are marked `idempotent=False` and only retried on rate limits.
+
+    Usage:
+        llm = get_llm_client()
+        completion = await llm.call(llm.client.chat.completions.create, model=..., messages=...)
+        run = await llm.call(llm.client.beta.threads.runs.create, idempotent=False, thread_id=..., assistant_id=...)
+        run = await llm.poll(llm.client.beta.threads.runs.retrieve, RUN_PENDING, run.id, thread_id=...)
+        async for chunk in llm.stream(llm.client.chat.completions.create, model=..., messages=...):
+            ...
+    """
+
+    def __init__(self, api_key: Optional[str] = None, max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+                 max_connections: int = OPENAI_MAX_CONNECTIONS, timeout: float = OPENAI_TIMEOUT,
+                 max_retries: int = OPENAI_MAX_RETRIES, http_client: Optional["httpx.AsyncClient"] = None):
+        import httpx
+        from openai import AsyncOpenAI
+
+        self.max_retries = max_retries
+        self.retryable_errors = retryable_errors()
+        self.rate_limit_errors = retryable_errors(idempotent=False)
+        self.http_client = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+        )
+        # Les nouveaux essais sont faits ici, avec la limite de concurrence, pas par le SDK
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.environ.get("OPENAI_API_KEY"),
+            base_url=os.environ.get("OPENAI_BASE_URL"),
+            timeout=timeout,
+            max_retries=0,
+            http_client=self.http_client,
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def call(self, function: Callable[..., Awaitable[T]], *args: Any, idempotent: bool = True,
+                   **kwargs: Any) -> T:
+        """
+        Await `function(*args, **kwargs)` within the concurrency limit, retrying transient
+        errors (only rate limits if the call is not `idempotent`).
+        """
+        retryable = self.retryable_errors if idempotent else self.rate_limit_errors
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                try:
+                    with STAGE_LATENCY.time(stage="openai_call"):
+                        result = await function(*args, **kwargs)
+                    record_usage(getattr(result, "usage", None), kwargs.get("model"))
+                    return result
+                except retryable as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    error = e
+            # L'attente se fait hors du sémaphore pour ne pas bloquer les autres appels
+            attempt += 1
+            await self._backoff(attempt, error)
+
+    async def poll(self, retrieve: Callable[..., Awaitable[T]], pending: Collection[str], *args: Any,
+                   interval: float = OPENAI_POLL_INTERVAL, **kwargs: Any) -> T:
+        """
+        Read the status of a long operation with `retrieve(*args, **kwargs)` until it
+        leaves the `pending` statuses. Each read takes a slot of the concurrency limit,
+        the waits between them do not.
+        """
+        while True:
+            result = await self.call(retrieve, *args, **kwargs)
+            if getattr(result, "status", None) not in pending:
+                return result
+            await asyncio.sleep(interval)
+
+    async def stream(self, function: Callable[..., Awaitable[Any]], *args: Any, idempotent: bool = True,
+                     **kwargs: Any) -> AsyncIterator[Any]:
+        """
+        Iterate over a streamed response (`function(..., stream=True)`), holding one
+        slot of the concurrency limit until the stream ends. Only opening the stream
+        is retried (on rate limits only if not `idempotent`): once chunks have been
+        forwarded, an error is raised to the caller.
+        """
+        retryable = self.retryable_errors if idempotent else self.rate_limit_errors
+        attempt = 0
+        while True:
+            await self.semaphore.acquire()
+            try:
+                response = await function(*args, stream=True, **kwargs)
+                break
+            except retryable as e:
+                self.semaphore.release()
+                if attempt >= self.max_retries:
+                    raise
+                error = e
+            except BaseException:
+                self.semaphore.release()
+                raise
+            attempt += 1
+            await self._backoff(attempt, error)
+
+        try:
+            with STAGE_LATENCY.time(stage="openai_stream"):
+                async with response:
+                    async for chunk in response:
+                        # Présent sur le dernier fragment si stream_options={"include_usage": True}
+                        record_usage(getattr(chunk, "usage", None), kwargs.get("model"))
+                        yield chunk
+        finally:
+            self.semaphore.release()
+
+    async def _backoff(self, attempt: int, error: Exception) -> None:
+        delay = min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+        logging.warning("OpenAI call failed (%s), retry %d/%d in %.1fs", error, attempt, self.max_retries, delay)
+        await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+
+_llm_client: Optional[LLMClient] = None
+
+
+def get_llm_client() -> LLMClient:
+    """The process-wide LLMClient, created on first use."""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
+
+
+async def close_llm_client() -> None:
+    """Close the shared client and its connection pool (at application shutdown)."""
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.aclose()
+        _llm_client = None
@@ -0,0 +1,41 @@
+# CORE
+from typing import Any, AsyncIterator, Tuple
+import json
+import logging
+
+# THIRD PARTY
+from fastapi.responses import StreamingResponse
+
+
+# Évènements envoyés au client
+TOKEN_EVENT = "token"    # {"text": fragment de la réponse}
+RESULT_EVENT = "result"  # la réponse finale complète (dernier évènement)
+ERROR_EVENT = "error"    # {"error": message} (dernier évènement)
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Un évènement Server-Sent Events dont les données sont sérialisées en JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _encode(events: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[str]:
+    try:
+        async for event, data in events:
+            yield format_sse(event, data)
+    except Exception as e:
+        # Les en-têtes sont déjà partis: l'erreur est signalée dans le flux
+        logging.error(e)
+        yield format_sse(ERROR_EVENT, {"error": str(e)})
+
+
+def sse_response(events: AsyncIterator[Tuple[str, Any]]) -> StreamingResponse:
+    """
+    Stream (event, data) pairs as Server-Sent Events. Tokens are sent as they are
+    produced; an exception ends the stream with an `error` event.
+    """
+    return StreamingResponse(
+        _encode(events),
+        media_type="text/event-stream",
+        # Pas de mise en tampon par un proxy (nginx) pour garder le premier octet rapide
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
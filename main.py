@@ -1,27 +1,87 @@
 # CORE
-from typing import Dict
-import logging
+from contextlib import asynccontextmanager
+from types import ModuleType
+from typing import Any, List
+import asyncio
+import importlib
+import os
 
 # FASTAPI
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 
 # OWN UTILS
-from rh_utils.tools import ask_question, get_question_by_id, evaluate_user_answer, check_if_authorized
-from files_utils.tools import load_rules_from_yaml, load_csv
-from ceh_utils.tools import apply_rules, format_matched_message, select_highest_priority_rule, get_meteo_for_location
-from files_utils.tools import get_file_list
-from breakdown_spec_utils.tools import load_questions_from_yaml, load_prompts, convert_problems_to_dict
-## METHOD
-from methodes_utils.tools import create_file_batch, create_thread, run_thread, updated_assistant, create_assistant
+## LLM
+from llm_utils.client import close_llm_client
+## METRICS
+from metrics_utils.tools import CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from metrics_utils.multiprocess import METRICS_DIR, flush_periodically, render_workers
+
+# Domaines servis par ce processus, chacun dans routers/<nom>.py (ex: ENABLED_ROUTERS=ceh pour
+# un déploiement CEH seul, qui n'importe ni openai ni pandas)
+ROUTERS = ("ceh", "rh", "breakdown", "methode")
+ENABLED_ROUTERS = [name.strip() for name in (os.environ.get("ENABLED_ROUTERS") or ",".join(ROUTERS)).split(",")
+                   if name.strip()]
+
+
+def load_routers(names: List[str]) -> List[ModuleType]:
+    """
+    Import the modules of the enabled domains. Each module of routers/ exposes `router`
+    (its APIRouter), `preload(state)` for what is loaded once and shared by the workers,
+    and `start(state)` / `stop(state)` for what belongs to each process.
+
+    Raises:
+        ValueError: for an unknown domain.
+    """
+    unknown = [name for name in names if name not in ROUTERS]
+    if unknown:
+        raise ValueError(f"Unknown routers {unknown} in ENABLED_ROUTERS, expected some of {list(ROUTERS)}")
+    return [importlib.import_module(f"routers.{name}") for name in names]
+
+
+domains = load_routers(ENABLED_ROUTERS)
+
+
+def preload_state(state: Any) -> None:
+    """
+    Charge et compile ce qui ne dépend pas du processus: règles CEH (et transcodage),
+    questionnaires RH et parcours de panne, selon les domaines activés. server.py
+    l'appelle une fois avant de créer les workers, qui partagent ces objets en copie
+    sur écriture.
+    """
+    for domain in domains:
+        domain.preload(state)
+    state.preloaded = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    state = app.state
+    if not getattr(state, "preloaded", False):
+        preload_state(state)
+
+    # Propre à chaque processus: threads, pools, connexions et tâches asyncio
+    for domain in domains:
+        await domain.start(state)
+    # Sous server.py, le registre du worker est écrit dans METRICS_DIR pour /metrics
+    worker = getattr(state, "worker", None)
+    flush = asyncio.create_task(flush_periodically(REGISTRY, METRICS_DIR, worker)) if METRICS_DIR and worker else None
+    state.ready = True
+    try:
+        yield
+    finally:
+        state.ready = False
+        if flush is not None:
+            flush.cancel()
+            await asyncio.gather(flush, return_exceptions=True)
+        for domain in reversed(domains):
+            await domain.stop(state)
+        await close_llm_client()
 
-# MODELS
-from rh_utils.model import Survey
-from breakdown_spec_utils.model import UserAnswer
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS
 origins = [
@@ -40,94 +100,44 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 if __name__ == "__main__":
+    import uvicorn
+
+    # Développement; en production: python server.py (plusieurs workers)
     uvicorn.run("main:app", host='0.0.0.0', port=8000, reload=True)
 
-# TODO mettre le load du yaml dans le context
-@app.post("/ceh")
-async def get_ceh_info(ceh_data: Dict):
-    try:
-        rules = load_rules_from_yaml("./rules_data/rules.yaml")
-    except Exception as e:
-        logging.error(e)
-    
-    try:
-        matched_messages = apply_rules(ceh_data, rules)
-    except Exception as e:
-        logging.error(e)
 
-    selected_message = select_highest_priority_rule(matched_messages)
-    formatted_message = format_matched_message(selected_message)
+for domain in domains:
+    app.include_router(domain.router)
 
-    return formatted_message
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
 
-
-@app.get("/rh/get_surveys")
-async def get_rh_questionnaire():
-    files = get_file_list('./data/rh_data')
-    return {"surveys": files}
-
-
-@app.post("/rh/get_question")
-def rh_get_question(survey: Survey):
-    try:
-        survey = load_csv('./data/rh_data/' + survey.survey_name)
-        question, question_id = ask_question(survey)
-
-        return {"question": question, "id": int(question_id)}
-    except Exception as e:
-        logging.error(e)
-        return {"error": str(e)}
-    
-
-@app.post("/rh/get_evaluation")
-def rh_get_evaluation(survey: Survey):
-    try:
-        survey_data = load_csv('./data/rh_data/' + survey.survey_name)
-        question, verified_answer = get_question_by_id(survey_data, int(survey.question_id))
-        is_user_authorized = check_if_authorized(survey.client_secret)
-        
-        if not is_user_authorized:
-            return {"error": "Unauthorized"}
-        
-        evaluation = evaluate_user_answer(question, verified_answer, survey.user_answer)
-
-        return {"evaluation": evaluation}
-    except Exception as e:
-        logging.error(e)
-        return {"error": str(e)}
-
-
-@app.post("/breakdown/get_classif")
-def breakdown_get_classif(user_answer: UserAnswer):
-    data = load_questions_from_yaml('./data/breakdown_data/parcours.yml') 
-    problems_dict = convert_problems_to_dict(data)
-    prompts = load_prompts('./data/breakdown_data/prompts/prompts_list.json')
-
-    print(prompts)
-    print(problems_dict)
-
-
-@app.post("/methode/redacteur")
-async def upload_pdf(user_question, file: UploadFile = File(...)):
-
-    if file.content_type != "application/pdf":
-        return JSONResponse(content={"error": "Le fichier doit être au format PDF"}, status_code=400)
-
-    file_location = f"uploaded_files/{file.filename}"
-    with open(file_location, "wb") as f:
-        f.write(await file.read())
-
-    _file_batch = create_file_batch(file_location)
-    assistant = create_assistant()
-    assistant = updated_assistant(assistant)
-    thread = create_thread(user_question)
-    message = run_thread(thread, assistant)
-
-    return JSONResponse(content={"answer": message.value}, status_code=200)
\ No newline at end of file
+@app.get("/ready")
+async def readiness_check():
+    """
+    Prêt à recevoir du trafic: état chargé et démarrage terminé (contrairement à /health,
+    qui indique seulement que le processus répond). 503 pendant le démarrage et l'arrêt.
+    """
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(content={"status": "not ready"}, status_code=503)
+    rules_registry = getattr(app.state, "rules_registry", None)
+    return {"status": "ready", "rules_version": rules_registry.current.version if rules_registry else None,
+            "pid": os.getpid(), "routers": ENABLED_ROUTERS}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Métriques Prometheus; sous server.py, additionnées sur tous les workers."""
+    # Rendu hors de la boucle: les jauges lisent la file de travaux (SQLite) et les fichiers des workers
+    worker = getattr(app.state, "worker", None)
+    if METRICS_DIR and worker:
+        content = await run_in_threadpool(render_workers, REGISTRY, METRICS_DIR, worker)
+    else:
+        content = await run_in_threadpool(REGISTRY.render)
+    return PlainTextResponse(content, media_type=CONTENT_TYPE)
@@ -0,0 +1,282 @@
+"""
+File de travaux pour /methode/redacteur: la requête HTTP ne fait que stocker le
+PDF et enregistrer le travail; l'indexation et la question au modèle sont faites
+par un nombre borné de tâches asyncio. Les travaux sont conservés dans SQLite, un
+redémarrage reprend ceux qui n'étaient pas terminés.
+
+Chaque travail non terminé appartient au processus qui l'a en file (colonne owner, son
+pid): sous server.py, les travaux d'un worker mort sont rendus (owner NULL) et repris
+par le worker qui le remplace.
+"""
+# CORE
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# THIRD PARTY
+from fastapi.concurrency import run_in_threadpool
+
+# OWN
+from files_utils.uploads import UPLOAD_DIR
+from methodes_utils.manager import get_assistant_manager
+from methodes_utils.retrieval import get_local_retriever
+
+
+METHODE_JOBS_PATH = os.environ.get("METHODE_JOBS_PATH", os.path.join(UPLOAD_DIR, "jobs.sqlite3"))
+METHODE_JOB_WORKERS = int(os.environ.get("METHODE_JOB_WORKERS", 4))
+# Au-delà, les nouveaux travaux sont refusés (503) plutôt que d'attendre indéfiniment
+METHODE_JOB_MAX_PENDING = int(os.environ.get("METHODE_JOB_MAX_PENDING", 200))
+# Durée de conservation (secondes) des travaux terminés
+METHODE_JOB_RETENTION = float(os.environ.get("METHODE_JOB_RETENTION", 24 * 3600))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+def _add_owner_column(connection: sqlite3.Connection) -> None:
+    # Bases créées avant la colonne owner
+    columns = [row["name"] for row in connection.execute("PRAGMA table_info(jobs)")]
+    if columns and "owner" not in columns:
+        connection.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+
+
+class QueueFull(Exception):
+    """Trop de travaux en attente."""
+
+
+class JobQueue:
+    """
+    Jobs stored in SQLite and run by `workers` asyncio tasks.
+
+    Each job has a kind, mapped to an async handler with register(); the handler
+    receives the JSON payload given to submit() and its return value (JSON) becomes
+    the result of the job. Jobs left running by a stopped process are queued again
+    on start(), and the queued jobs that no process owns are taken.
+
+    The database is read and written in the threadpool, except at start() and stop().
+    """
+
+    def __init__(self, path: str = METHODE_JOBS_PATH, workers: int = METHODE_JOB_WORKERS,
+                 max_pending: int = METHODE_JOB_MAX_PENDING, retention: float = METHODE_JOB_RETENTION):
+        self.path = path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.handlers: Dict[str, Handler] = {}
+        self.completed = 0
+        self.failed = 0
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL,"
+            " result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        _add_owner_column(self._connection)
+        self.owner = os.getpid()
+
+    def _execute(self, query: str, parameters: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self.handlers[kind] = handler
+
+    async def start(self, requeue_running: bool = True, resume_queued: bool = True) -> None:
+        """
+        Queue the unfinished jobs again and start the workers.
+
+        Args:
+            requeue_running: queue again the jobs left running by a stopped process. With
+                several processes on the same database, only the supervisor does it, before
+                starting them or for a dead worker (see requeue_interrupted_jobs).
+            resume_queued: take the queued jobs that no process owns. Each job is taken by
+                one process only, even when several start together.
+        """
+        if requeue_running:
+            self._execute("UPDATE jobs SET status = ?, started_at = NULL, owner = NULL WHERE status IN (?, ?)",
+                          (QUEUED, QUEUED, RUNNING))
+        if resume_queued:
+            with self._lock:
+                # Une seule requête: deux processus ne peuvent pas prendre le même travail
+                self._connection.execute("UPDATE jobs SET owner = ? WHERE status = ? AND owner IS NULL",
+                                         (self.owner, QUEUED))
+                rows = self._connection.execute("SELECT id FROM jobs WHERE status = ? AND owner = ? ORDER BY created_at",
+                                                (QUEUED, self.owner)).fetchall()
+            for row in rows:
+                self._queue.put_nowait(row["id"])
+        if self._queue.qsize():
+            logging.info("%d pending jobs resumed", self._queue.qsize())
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stop the workers; the unfinished jobs are released, to be resumed by the next start()."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        with self._lock:
+            self._connection.execute("UPDATE jobs SET status = ?, started_at = NULL, owner = NULL"
+                                     " WHERE owner = ? AND status IN (?, ?)", (QUEUED, self.owner, QUEUED, RUNNING))
+            self._connection.close()
+
+    def _insert(self, job_id: str, kind: str, payload: Dict[str, Any]) -> bool:
+        with self._lock:
+            # Compte et insertion en une requête: la limite vaut pour tous les workers ensemble
+            inserted = self._connection.execute(
+                "INSERT INTO jobs (id, kind, payload, status, created_at, owner) SELECT ?, ?, ?, ?, ?, ?"
+                " WHERE (SELECT COUNT(*) FROM jobs WHERE status = ?) < ?",
+                (job_id, kind, json.dumps(payload), QUEUED, time.time(), self.owner, QUEUED, self.max_pending)).rowcount
+        if inserted:
+            self._purge()
+        return bool(inserted)
+
+    async def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        """
+        Record a job and return its id.
+
+        Raises:
+            KeyError: if no handler is registered for `kind`.
+            QueueFull: if `max_pending` jobs are already waiting, in all the processes
+                sharing the database.
+        """
+        if kind not in self.handlers:
+            raise KeyError(f"No handler for job kind {kind!r}")
+        job_id = uuid.uuid4().hex
+        if not await run_in_threadpool(self._insert, job_id, kind, payload):
+            raise QueueFull(f"{self.max_pending} jobs already pending")
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._execute("SELECT id, status, result, error, created_at, started_at, finished_at"
+                             " FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The status of a job (and its result or error once finished), None if unknown."""
+        return await run_in_threadpool(self._get, job_id)
+
+    def _purge(self) -> None:
+        self._execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                      (DONE, FAILED, time.time() - self.retention))
+
+    def _claim(self, job_id: str) -> Optional[sqlite3.Row]:
+        # Le travail (kind, payload) s'il est toujours en file pour ce processus, passé en cours
+        with self._lock:
+            claimed = self._connection.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ? AND owner = ?",
+                (RUNNING, time.time(), job_id, QUEUED, self.owner)).rowcount
+            if not claimed:
+                return None
+            return self._connection.execute("SELECT kind, payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            row = await run_in_threadpool(self._claim, job_id)
+            if row is None:
+                continue
+            try:
+                result = await self.handlers[row["kind"]](json.loads(row["payload"]))
+                await run_in_threadpool(self._execute,
+                                        "UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+                                        (DONE, json.dumps(result, default=str), time.time(), job_id))
+                self.completed += 1
+            except asyncio.CancelledError:
+                # Arrêt de l'application: le travail sera repris au prochain démarrage
+                raise
+            except Exception as e:
+                logging.error("Job %s failed: %s", job_id, e)
+                await run_in_threadpool(self._execute,
+                                        "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                                        (FAILED, str(e), time.time(), job_id))
+                self.failed += 1
+
+    async def stats(self) -> Dict[str, Any]:
+        """
+        Queue depth and throughput, to size the number of workers. The depth (queued and
+        running) is read from the database, for all the processes; completed and failed
+        count this process's jobs.
+        """
+        return await run_in_threadpool(self.snapshot)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """stats(), read in the calling thread (the metrics gauges, rendered in the threadpool)."""
+        row = self._execute("SELECT SUM(status = ?) AS queued, SUM(status = ?) AS running,"
+                            " MIN(CASE WHEN status = ? THEN created_at END) AS oldest"
+                            " FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING, QUEUED, QUEUED, RUNNING))[0]
+        oldest = row["oldest"]
+        return {
+            "workers": self.workers,
+            "running": row["running"] or 0,
+            "queued": row["queued"] or 0,
+            "max_pending": self.max_pending,
+            "oldest_queued_seconds": time.time() - oldest if oldest else 0.0,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+def requeue_interrupted_jobs(path: str = METHODE_JOBS_PATH, owner: Optional[int] = None) -> int:
+    """
+    Release the unfinished jobs of stopped processes, to be taken by the next JobQueue.start():
+    all of them before starting the server, or those of the dead worker `owner`.
+
+    Returns:
+        int: the number of jobs released.
+    """
+    if not os.path.exists(path):
+        return 0
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    query = "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL WHERE status IN (?, ?)"
+    parameters: tuple = (QUEUED, QUEUED, RUNNING)
+    if owner is not None:
+        query, parameters = query + " AND owner = ?", parameters + (owner,)
+    try:
+        _add_owner_column(connection)
+        return connection.execute(query, parameters).rowcount
+    except sqlite3.OperationalError:
+        return 0  # Base pas encore initialisée
+    finally:
+        connection.close()
+
+
+REDACTEUR_JOB = "redacteur"
+
+
+async def run_redacteur_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Answer a question about a stored PDF, with the assistant or the local index."""
+    if payload.get("mode") == "local":
+        return await get_local_retriever().answer(payload["question"], payload["path"], payload["content_hash"])
+    message = await get_assistant_manager().answer(payload["question"], payload["path"], payload["content_hash"])
+    return {"answer": message.value}
+
+
+def create_job_queue() -> JobQueue:
+    """The /methode job queue with its handlers registered."""
+    queue = JobQueue()
+    queue.register(REDACTEUR_JOB, run_redacteur_job)
+    return queue
@@ -0,0 +1,226 @@
+# CORE
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+# THIRD PARTY
+from fastapi.concurrency import run_in_threadpool
+
+# OWN
+from cache_utils.singleflight import SingleFlight
+from files_utils.tools import file_sha256
+from files_utils.uploads import UPLOAD_DIR
+from llm_utils.client import import_sdk
+from llm_utils.sse import RESULT_EVENT, TOKEN_EVENT
+from methodes_utils.tools import (ASSISTANT_INSTRUCTIONS, ASSISTANT_MODEL, ASSISTANT_NAME, create_assistant,
+                                  create_file_batch, create_thread, create_vector_store, delete_vector_store,
+                                  find_assistant, run_thread, stream_thread)
+from methodes_utils.vector_stores import IndexedDocument, VectorStoreIndex
+
+
+METHODE_MAX_VECTOR_STORES = int(os.environ.get("METHODE_MAX_VECTOR_STORES", 32))
+# Durée sans utilisation (secondes) après laquelle un vector store est supprimé
+METHODE_VECTOR_STORE_TTL = float(os.environ.get("METHODE_VECTOR_STORE_TTL", 24 * 3600))
+# Filet de sécurité côté OpenAI si le processus s'arrête sans faire le ménage
+METHODE_VECTOR_STORE_EXPIRES_DAYS = int(os.environ.get("METHODE_VECTOR_STORE_EXPIRES_DAYS", 7))
+# Correspondance empreinte du document -> vector store / fichier OpenAI (SQLite), partagée par les
+# workers et conservée entre deux démarrages
+METHODE_INDEX_PATH = os.environ.get("METHODE_INDEX_PATH", os.path.join(UPLOAD_DIR, "vector_stores.sqlite3"))
+# Durées maximales (secondes) d'une indexation et d'une réponse partagées par des demandes identiques
+METHODE_INDEX_TIMEOUT = float(os.environ.get("METHODE_INDEX_TIMEOUT", 600))
+METHODE_RUN_TIMEOUT = float(os.environ.get("METHODE_RUN_TIMEOUT", 300))
+# Intervalle (secondes) entre deux recherches des vector stores inutilisés depuis METHODE_VECTOR_STORE_TTL
+PURGE_INTERVAL = 60.0
+
+
+async def _prepend(first: Any, rest: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    yield first
+    async for item in rest:
+        yield item
+
+
+class AssistantManager:
+    """
+    Reuses the OpenAI resources of /methode/redacteur across requests:
+    - one assistant per configuration (name, instructions, model), found again
+      after a restart through its metadata,
+    - one vector store per document content (SHA-256), so uploading the same PDF
+      again skips the upload and the indexing,
+    - vector stores are deleted (with their file) when evicted from the index, bounded
+      in size, or when unused for `vector_store_ttl` seconds.
+
+    The content hash -> remote ids mapping is the VectorStoreIndex of `index_path`
+    (SQLite), shared by the server workers, so that neither another worker nor a
+    restart indexes the same documents again.
+    """
+
+    def __init__(self, max_vector_stores: int = METHODE_MAX_VECTOR_STORES,
+                 vector_store_ttl: float = METHODE_VECTOR_STORE_TTL, index_path: Optional[str] = METHODE_INDEX_PATH):
+        self._assistants: Dict[str, Any] = {}
+        self._vector_stores = VectorStoreIndex(index_path, max_vector_stores, vector_store_ttl)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Un même contrat reçu plusieurs fois en même temps n'est indexé qu'une fois, une même
+        # question sur un même contrat ne fait qu'un run
+        self._indexing: SingleFlight[IndexedDocument] = SingleFlight("vector_store_indexing", METHODE_INDEX_TIMEOUT)
+        self._runs: SingleFlight[Any] = SingleFlight("assistant_run", METHODE_RUN_TIMEOUT)
+        self._deletions: Set[asyncio.Task] = set()
+        self._next_purge = 0.0
+        self.index_path = index_path
+
+    def _lock_for(self, key: str) -> asyncio.Lock:
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+        return self._locks[key]
+
+    @staticmethod
+    def config_hash(name: str, instructions: str, model: str) -> str:
+        return hashlib.sha256("\0".join((name, instructions, model)).encode()).hexdigest()[:16]
+
+    async def get_assistant(self, name: str = ASSISTANT_NAME, instructions: str = ASSISTANT_INSTRUCTIONS,
+                            model: str = ASSISTANT_MODEL) -> Any:
+        """The assistant for this configuration, created on first use only."""
+        key = self.config_hash(name, instructions, model)
+        async with self._lock_for("assistant:" + key):
+            if key not in self._assistants:
+                metadata = {"config_hash": key}
+                assistant = await find_assistant(metadata)
+                if assistant is None:
+                    assistant = await create_assistant(name, instructions, model, metadata)
+                    logging.info("Assistant %s created for configuration %s", assistant.id, key)
+                self._assistants[key] = assistant
+        return self._assistants[key]
+
+    async def get_vector_store(self, file_path: str, content_hash: Optional[str] = None) -> IndexedDocument:
+        """
+        The vector store indexing this document, created and filled on first use only.
+
+        Args:
+            file_path: the local copy of the document.
+            content_hash: the SHA-256 of the document, computed from the file if not given.
+        """
+        content_hash = content_hash or file_sha256(file_path)
+        document = await run_in_threadpool(self._vector_stores.get, content_hash)
+        if document is None:
+            document = await self._indexing.do(content_hash, self._index, file_path, content_hash)
+        if time.monotonic() >= self._next_purge:
+            self._next_purge = time.monotonic() + PURGE_INTERVAL
+            self._release(await run_in_threadpool(self._vector_stores.purge))
+        return document
+
+    async def _index(self, file_path: str, content_hash: str) -> IndexedDocument:
+        vector_store = await create_vector_store(f"Contrat methode {content_hash[:12]}",
+                                                 METHODE_VECTOR_STORE_EXPIRES_DAYS)
+        uploaded_file, _file_batch = await create_file_batch(file_path, vector_store.id)
+        # Un autre worker a pu indexer le même document entre-temps: le premier enregistré est gardé
+        document, evicted = await run_in_threadpool(
+            self._vector_stores.add, IndexedDocument(content_hash, vector_store.id, uploaded_file.id))
+        self._release(evicted)
+        return document
+
+    async def forget(self, document: IndexedDocument) -> None:
+        """Drop a document whose vector store no longer exists remotely."""
+        await run_in_threadpool(self._vector_stores.remove, document)
+
+    async def ask(self, question: str, document: IndexedDocument) -> Any:
+        """
+        Ask a question about an indexed document; returns the text of the answer.
+        The same question asked on the same document meanwhile shares the run.
+        """
+        return await self._runs.do((document.vector_store_id, question), self._ask, question, document)
+
+    async def _ask(self, question: str, document: IndexedDocument) -> Any:
+        assistant = await self.get_assistant()
+        thread = await create_thread(question, document.vector_store_id)
+        return await run_thread(thread, assistant)
+
+    async def answer(self, question: str, file_path: str, content_hash: Optional[str] = None) -> Any:
+        """
+        Index the document if needed and ask the question. A vector store expired on
+        the OpenAI side is forgotten and the document indexed again, once.
+        """
+        document = await self.get_vector_store(file_path, content_hash)
+        try:
+            return await self.ask(question, document)
+        except import_sdk().NotFoundError:
+            logging.warning("Vector store %s not found, indexing document %s again",
+                            document.vector_store_id, document.content_hash[:12])
+            await self.forget(document)
+            document = await self.get_vector_store(file_path, document.content_hash)
+            return await self.ask(question, document)
+
+    async def _start_run(self, question: str, document: IndexedDocument) -> Tuple[Any, AsyncIterator[Any]]:
+        assistant = await self.get_assistant()
+        thread = await create_thread(question, document.vector_store_id)
+        events = stream_thread(thread, assistant)
+        # Le premier évènement ouvre le flux: un vector store expiré échoue ici, avant tout envoi au client
+        return await events.__anext__(), events
+
+    async def stream_answer(self, question: str, file_path: str,
+                            content_hash: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Same as answer(), streamed: yields ("token", {"text": ...}) for each fragment
+        of the answer as the run produces it, then ("result", {"answer", "sources"})
+        where sources are the ids of the cited files.
+        """
+        document = await self.get_vector_store(file_path, content_hash)
+        try:
+            first_event, events = await self._start_run(question, document)
+        except import_sdk().NotFoundError:
+            logging.warning("Vector store %s not found, indexing document %s again",
+                            document.vector_store_id, document.content_hash[:12])
+            await self.forget(document)
+            document = await self.get_vector_store(file_path, document.content_hash)
+            first_event, events = await self._start_run(question, document)
+
+        async for event in _prepend(first_event, events):
+            if event.event == "thread.message.delta":
+                for content in event.data.delta.content or []:
+                    if content.type == "text" and content.text and content.text.value:
+                        yield TOKEN_EVENT, {"text": content.text.value}
+            elif event.event == "thread.message.completed":
+                text = event.data.content[0].text
+                sources = [annotation.file_citation.file_id for annotation in text.annotations
+                           if annotation.type == "file_citation"]
+                yield RESULT_EVENT, {"answer": text.value, "sources": list(dict.fromkeys(sources))}
+            elif event.event in ("thread.run.failed", "thread.run.cancelled", "thread.run.expired"):
+                error = event.data.last_error
+                raise RuntimeError(f"Run {event.data.id} {event.data.status}: {error.message if error else ''}")
+            elif event.event == "error":
+                raise RuntimeError(event.data.message)
+
+    def _release(self, evicted: List[IndexedDocument]) -> None:
+        # Documents déjà retirés de l'index partagé, par ce processus seulement
+        for document in evicted:
+            task = asyncio.create_task(self._delete(document))
+            self._deletions.add(task)
+            task.add_done_callback(self._deletions.discard)
+
+    async def _delete(self, document: IndexedDocument) -> None:
+        try:
+            await delete_vector_store(document.vector_store_id, [document.file_id])
+            logging.info("Vector store %s of document %s deleted", document.vector_store_id, document.content_hash[:12])
+        except Exception as e:
+            logging.error("Vector store %s not deleted: %s", document.vector_store_id, e)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits and misses of the vector store cache."""
+        return self._vector_stores.stats()
+
+    async def close(self) -> None:
+        """Wait for the pending deletions (at application shutdown)."""
+        if self._deletions:
+            await asyncio.gather(*self._deletions, return_exceptions=True)
+
+
+_assistant_manager: Optional[AssistantManager] = None
+
+
+def get_assistant_manager() -> AssistantManager:
+    """The process-wide AssistantManager, created on first use."""
+    global _assistant_manager
+    if _assistant_manager is None:
+        _assistant_manager = AssistantManager()
+    return _assistant_manager
@@ -0,0 +1,268 @@
+"""
+Local retrieval over the uploaded contracts, an alternative to the OpenAI vector
+stores: the PDF text is extracted and chunked once, indexed with BM25 in an on-disk
+index keyed by the file hash (postings in memory-mapped NumPy arrays), and only
+the top-k passages are sent to a single chat completion.
+"""
+# CORE
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+import unicodedata
+
+# THIRD PARTY
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+# OWN
+from cache_utils.tools import LRUCache
+from files_utils.uploads import UPLOAD_DIR
+from llm_utils.client import get_llm_client
+from llm_utils.sse import RESULT_EVENT, TOKEN_EVENT
+from methodes_utils.tools import ASSISTANT_INSTRUCTIONS, ASSISTANT_MODEL
+
+
+INDEX_DIR = os.environ.get("METHODE_INDEX_DIR", os.path.join(UPLOAD_DIR, "index"))
+# "stub" pour répondre sans appel au modèle (hors ligne)
+METHODE_LOCAL_LLM = os.environ.get("METHODE_LOCAL_LLM", "openai")
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 200
+TOP_K = 5
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+au aux avec ce ces cet cette dans de des du elle en et eux il je la le les leur lui ma mais me meme mes moi mon
+ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une vos votre vous
+est sont ete etre ai as avons avez ont dont si
+""".split())
+
+
+class Passage(NamedTuple):
+    page: int
+    text: str
+    score: float
+
+
+def tokenize(text: str) -> List[str]:
+    """Mots en minuscules, sans accents ni mots vides."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [token for token in re.findall(r"\w+", text) if len(token) > 1 and token not in STOPWORDS]
+
+
+def extract_pdf_pages(file_path: str) -> List[str]:
+    """
+    Extract the text of each page of a PDF.
+
+    Raises:
+        RuntimeError: if pypdf is not installed.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise RuntimeError("Local retrieval needs pypdf (pip install pypdf)") from e
+    return [page.extract_text() or "" for page in PdfReader(file_path).pages]
+
+
+def chunk_pages(pages: List[str], size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """Découpe le texte de chaque page en passages de `size` caractères qui se chevauchent."""
+    chunks = []
+    for page_number, text in enumerate(pages, 1):
+        text = re.sub(r"\s+", " ", text).strip()
+        start = 0
+        while start < len(text):
+            chunks.append({"page": page_number, "text": text[start:start + size]})
+            if start + size >= len(text):
+                break
+            start += size - overlap
+    return chunks
+
+
+def build_index(file_path: str, directory: str) -> None:
+    """
+    Build the BM25 index of a PDF in `directory`:
+    - chunks.json: the passages and their page,
+    - vocabulary.json: term -> term id,
+    - indptr.npy, doc_ids.npy, term_freqs.npy: postings by term (CSC layout),
+    - doc_lengths.npy: number of tokens of each passage.
+    The index is written in a temporary directory then renamed into place.
+    """
+    chunks = chunk_pages(extract_pdf_pages(file_path))
+    postings: Dict[str, Dict[int, int]] = {}
+    doc_lengths = []
+    for doc_id, chunk in enumerate(chunks):
+        tokens = tokenize(chunk["text"])
+        doc_lengths.append(len(tokens))
+        for token in tokens:
+            term_postings = postings.setdefault(token, {})
+            term_postings[doc_id] = term_postings.get(doc_id, 0) + 1
+
+    vocabulary = {term: term_id for term_id, term in enumerate(sorted(postings))}
+    indptr = [0]
+    doc_ids: List[int] = []
+    term_freqs: List[int] = []
+    for term in sorted(postings):
+        for doc_id, term_freq in sorted(postings[term].items()):
+            doc_ids.append(doc_id)
+            term_freqs.append(term_freq)
+        indptr.append(len(doc_ids))
+
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    tmp_directory = tempfile.mkdtemp(dir=parent, suffix=".part")
+    try:
+        with open(os.path.join(tmp_directory, "chunks.json"), "w") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        with open(os.path.join(tmp_directory, "vocabulary.json"), "w") as f:
+            json.dump(vocabulary, f, ensure_ascii=False)
+        np.save(os.path.join(tmp_directory, "indptr.npy"), np.array(indptr, dtype=np.int64))
+        np.save(os.path.join(tmp_directory, "doc_ids.npy"), np.array(doc_ids, dtype=np.int32))
+        np.save(os.path.join(tmp_directory, "term_freqs.npy"), np.array(term_freqs, dtype=np.float32))
+        np.save(os.path.join(tmp_directory, "doc_lengths.npy"), np.array(doc_lengths, dtype=np.float32))
+        os.rename(tmp_directory, directory)
+    except OSError:
+        # Index construit en parallèle par une autre requête
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        if not os.path.isdir(directory):
+            raise
+
+
+class LocalIndex:
+    """BM25 index of one document, with its postings memory-mapped from disk."""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "chunks.json")) as f:
+            self.chunks: List[Dict[str, Any]] = json.load(f)
+        with open(os.path.join(directory, "vocabulary.json")) as f:
+            self.vocabulary: Dict[str, int] = json.load(f)
+        self.indptr = np.load(os.path.join(directory, "indptr.npy"), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(directory, "doc_ids.npy"), mmap_mode="r")
+        self.term_freqs = np.load(os.path.join(directory, "term_freqs.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(directory, "doc_lengths.npy"), mmap_mode="r")
+        self.average_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+
+    def search(self, question: str, k: int = TOP_K) -> List[Passage]:
+        """The `k` passages with the best BM25 score for the question."""
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        if not len(scores):
+            return []
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(self.doc_lengths) / max(self.average_length, 1.0))
+        for term in set(tokenize(question)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.indptr[term_id]), int(self.indptr[term_id + 1])
+            docs = np.asarray(self.doc_ids[start:end])
+            term_freqs = np.asarray(self.term_freqs[start:end])
+            idf = math.log(1 + (len(scores) - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * term_freqs * (BM25_K1 + 1) / (term_freqs + length_norm[docs])
+
+        best = np.argsort(-scores, kind="stable")[:k]
+        return [Passage(self.chunks[i]["page"], self.chunks[i]["text"], float(scores[i])) for i in best if scores[i] > 0]
+
+
+def build_messages(question: str, passages: List[Passage]) -> List[Dict[str, str]]:
+    context = "\n\n".join(f"[page {passage.page}] {passage.text}" for passage in passages)
+    return [
+        {"role": "system", "content": ASSISTANT_INSTRUCTIONS},
+        {"role": "user", "content": f"Extraits du document:\n{context or 'Aucun extrait trouvé.'}\n\nQuestion: {question}"},
+    ]
+
+
+async def openai_complete(messages: List[Dict[str, str]]) -> str:
+    llm = get_llm_client()
+    completion = await llm.call(llm.client.chat.completions.create, model=ASSISTANT_MODEL, messages=messages)
+    return completion.choices[0].message.content
+
+
+async def openai_stream(messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+    llm = get_llm_client()
+    async for chunk in llm.stream(llm.client.chat.completions.create, model=ASSISTANT_MODEL, messages=messages):
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def stub_complete(messages: List[Dict[str, str]]) -> str:
+    """Réponse sans modèle: renvoie les extraits retenus (tests, mode hors ligne)."""
+    return messages[-1]["content"]
+
+
+async def stub_stream(messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+    for line in messages[-1]["content"].splitlines(keepends=True):
+        yield line
+
+
+class LocalRetriever:
+    """
+    Answers questions on uploaded documents with the local index: built once per
+    document hash, kept on disk, and the last used indexes kept loaded in memory.
+    """
+
+    def __init__(self, index_dir: str = INDEX_DIR, complete: Optional[Callable] = None, max_loaded: int = 16,
+                 stream_complete: Optional[Callable] = None):
+        self.index_dir = index_dir
+        self.complete = complete or (stub_complete if METHODE_LOCAL_LLM == "stub" else openai_complete)
+        self.stream_complete = stream_complete or (stub_stream if METHODE_LOCAL_LLM == "stub" else openai_stream)
+        self._indexes: LRUCache[LocalIndex] = LRUCache(max_loaded)
+
+    def _load(self, file_path: str, content_hash: str) -> LocalIndex:
+        index = self._indexes.get(content_hash)
+        if index is None:
+            directory = os.path.join(self.index_dir, content_hash)
+            if not os.path.isdir(directory):
+                logging.info("Building local index of document %s", content_hash[:12])
+                build_index(file_path, directory)
+            index = LocalIndex(directory)
+            self._indexes.set(content_hash, index)
+        return index
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits and misses of the loaded indexes cache."""
+        return self._indexes.stats()
+
+    async def get_index(self, file_path: str, content_hash: str) -> LocalIndex:
+        # Extraction et indexation sont du travail CPU: hors de la boucle d'évènements
+        return await run_in_threadpool(self._load, file_path, content_hash)
+
+    async def answer(self, question: str, file_path: str, content_hash: str, k: int = TOP_K) -> Dict[str, Any]:
+        """
+        Answer the question from the `k` best passages of the document.
+
+        Returns:
+            dict: {"answer": text, "sources": [pages of the passages]}.
+        """
+        index = await self.get_index(file_path, content_hash)
+        passages = index.search(question, k)
+        answer = await self.complete(build_messages(question, passages))
+        return {"answer": answer, "sources": sorted({passage.page for passage in passages})}
+
+    async def stream_answer(self, question: str, file_path: str, content_hash: str,
+                            k: int = TOP_K) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Same as answer(), streamed: yields ("token", {"text": ...}) as the model
+        writes, then ("result", {"answer", "sources"}).
+        """
+        index = await self.get_index(file_path, content_hash)
+        passages = index.search(question, k)
+        parts = []
+        async for text in self.stream_complete(build_messages(question, passages)):
+            parts.append(text)
+            yield TOKEN_EVENT, {"text": text}
+        yield RESULT_EVENT, {"answer": "".join(parts), "sources": sorted({passage.page for passage in passages})}
+
+
+_local_retriever: Optional[LocalRetriever] = None
+
+
+def get_local_retriever() -> LocalRetriever:
+    """The process-wide LocalRetriever, created on first use."""
+    global _local_retriever
+    if _local_retriever is None:
+        _local_retriever = LocalRetriever()
+    return _local_retriever
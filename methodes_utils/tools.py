@@ -1,58 +1,14 @@
-import os
-from openai import OpenAI
+from llm_utils.client import get_llm_client, import_sdk
+from metrics_utils.tools import STAGE_LATENCY
 
-class SingletonMeta(type):
-    _instances = {}
 
-    def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(SingletonMeta, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
+# Statuts d'un run et d'un lot de fichiers encore en cours (les autres sont terminaux)
+RUN_PENDING = ("queued", "in_progress", "cancelling")
+FILE_BATCH_PENDING = ("in_progress",)
 
-
-class OpenAIClient(metaclass=SingletonMeta):
-    def __init__(self):
-        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-
-    def get_client(self):
-        return self.client
-
-class VectorStore(metaclass=SingletonMeta):
-    def __init__(self, client):
-        self.client = client
-        self.vector_store = self.create_vector_store()
-
-    def create_vector_store(self):
-        # Create a vector store 
-        vector_store = self.client.beta.vector_stores.create(name="Contrat methode")
-        return vector_store
-
-
-    def get_vector_store(self):
-        return self.vector_store
-
-
-def create_file_batch(file_path):
-    client_instance = OpenAIClient().get_client()
-    vector_store_instance = VectorStore(client_instance).get_vector_store()
-    
-    # Ready the files for upload to OpenAI
-    file_paths = [file_path]
-    file_streams = [open(path, "rb") for path in file_paths]
-    
-    # Use the upload and poll SDK helper to upload the files, add them to the vector store,
-    # and poll the status of the file batch for completion.
-    file_batch = client_instance.beta.vector_stores.file_batches.upload_and_poll(
-        vector_store_id=vector_store_instance.id, files=file_streams
-    )
-    return file_batch
-
-
-def create_assistant():
-    client_instance = OpenAIClient().get_client()
-    assistant = client_instance.beta.assistants.create(
-        name="Assistant methods writer",
-        instructions="""You are a nice chatbot named Ael_helpeur and you're having a conversation with a human insurance terms and conditions expert.
+ASSISTANT_NAME = "Assistant methods writer"
+ASSISTANT_MODEL = "gpt-4o"
+ASSISTANT_INSTRUCTIONS = """You are a nice chatbot named Ael_helpeur and you're having a conversation with a human insurance terms and conditions expert.
         Your response language is french.
         Your aim is only to answer the user about insurance terms and conditions and give him advise about how to solve a situation.
         You are allowed to reply a joke if the user asks to.
@@ -68,44 +24,101 @@ def create_assistant():
         If no documents are given in context, please answer the user that no documents were retrieved.
         If the user asks for his message history, give it to him.
         Please do not provide a fake answer if you're unsure. It's okay to respond with 'I don't know' or
-        'I'm not sure' instead.""",
-        model="gpt-4o",
+        'I'm not sure' instead."""
+
+
+async def create_vector_store(name, expires_after_days=None):
+    # Create a vector store; OpenAI deletes it after `expires_after_days` days without use
+    llm = get_llm_client()
+    expires_after = {"anchor": "last_active_at", "days": expires_after_days} if expires_after_days else import_sdk().NOT_GIVEN
+    vector_store = await llm.call(llm.client.beta.vector_stores.create, idempotent=False, name=name,
+                                  expires_after=expires_after)
+    return vector_store
+
+
+async def create_file_batch(file_path, vector_store_id):
+    llm = get_llm_client()
+
+    # Upload the file, add it to the vector store and poll the status of the file batch for completion.
+    # Créations sans nouvel essai après un timeout (doublons); l'attente du lot se fait hors de la limite de concurrence
+    with STAGE_LATENCY.time(stage="vector_store_upload"), open(file_path, "rb") as file_stream:
+        uploaded_file = await llm.call(llm.client.files.create, idempotent=False, file=file_stream, purpose="assistants")
+    with STAGE_LATENCY.time(stage="vector_store_poll"):
+        file_batch = await llm.call(
+            llm.client.beta.vector_stores.file_batches.create, idempotent=False,
+            vector_store_id=vector_store_id, file_ids=[uploaded_file.id]
+        )
+        file_batch = await llm.poll(llm.client.beta.vector_stores.file_batches.retrieve, FILE_BATCH_PENDING,
+                                    file_batch.id, vector_store_id=vector_store_id)
+    return uploaded_file, file_batch
+
+
+async def delete_vector_store(vector_store_id, file_ids=()):
+    llm = get_llm_client()
+    await llm.call(llm.client.beta.vector_stores.delete, vector_store_id=vector_store_id)
+    for file_id in file_ids:
+        await llm.call(llm.client.files.delete, file_id=file_id)
+
+
+async def create_assistant(name=ASSISTANT_NAME, instructions=ASSISTANT_INSTRUCTIONS, model=ASSISTANT_MODEL, metadata=None):
+    llm = get_llm_client()
+    assistant = await llm.call(
+        llm.client.beta.assistants.create,
+        idempotent=False,
+        name=name,
+        instructions=instructions,
+        model=model,
         tools=[{"type": "file_search"}],
+        metadata=import_sdk().NOT_GIVEN if metadata is None else metadata,
     )
     return assistant
 
 
-def updated_assistant(assistant):
-    client_instance = OpenAIClient().get_client()
-    vector_store_instance = VectorStore(client_instance).get_vector_store()
-    
-    assistant = client_instance.beta.assistants.update(
-        assistant_id=assistant.id,
-        tool_resources={"file_search": {"vector_store_ids": [vector_store_instance.id]}},
-    )
-    return assistant
+async def find_assistant(metadata):
+    # Cherche un assistant existant créé avec les mêmes métadonnées
+    llm = get_llm_client()
+    assistants = await llm.call(llm.client.beta.assistants.list, limit=100)
+    for assistant in assistants.data:
+        if assistant.metadata and all(assistant.metadata.get(key) == value for key, value in metadata.items()):
+            return assistant
+    return None
 
 
-def create_thread(question):
-    # Create a thread
-    client_instance = OpenAIClient().get_client()
-    thread = client_instance.beta.threads.create(
+async def create_thread(question, vector_store_id=None):
+    # Create a thread; the vector store is attached to the thread, not to the shared assistant
+    llm = get_llm_client()
+    tool_resources = {"file_search": {"vector_store_ids": [vector_store_id]}} if vector_store_id else import_sdk().NOT_GIVEN
+    thread = await llm.call(
+    llm.client.beta.threads.create,
+    idempotent=False,
     messages=[
         {
         "role": "user",
         "content": question,
         }
-    ]
+    ],
+    tool_resources=tool_resources,
     )
     return thread
 
 
-def run_thread(thread, assistant):
+async def run_thread(thread, assistant):
     # Run a thread
-    client_instance = OpenAIClient().get_client()
-    run = client_instance.beta.threads.runs.create_and_poll(
-    thread_id=thread.id, assistant_id=assistant.id)
+    llm = get_llm_client()
+    with STAGE_LATENCY.time(stage="assistant_run"):
+        run = await llm.call(
+        llm.client.beta.threads.runs.create, idempotent=False,
+        thread_id=thread.id, assistant_id=assistant.id)
+        run = await llm.poll(llm.client.beta.threads.runs.retrieve, RUN_PENDING, run.id, thread_id=thread.id)
+
+    messages = await llm.call(llm.client.beta.threads.messages.list, thread_id=thread.id, run_id=run.id)
+
+    return messages.data[0].content[0].text
+
 
-    messages = list(client_instance.beta.threads.messages.list(thread_id=thread.id, run_id=run.id))
-    
-    return messages[0].content[0].text
+async def stream_thread(thread, assistant):
+    # Run a thread and yield the run events (message deltas, completed message...) as they arrive
+    llm = get_llm_client()
+    async for event in llm.stream(llm.client.beta.threads.runs.create, idempotent=False, thread_id=thread.id,
+                                  assistant_id=assistant.id):
+        yield event
@@ -0,0 +1,157 @@
+"""
+Index partagé des vector stores OpenAI de /methode/redacteur: empreinte du document ->
+vector store et fichier distants. Sous server.py, tous les workers lisent et écrivent
+le même fichier SQLite (METHODE_INDEX_PATH):
+- un document indexé par un worker est réutilisé par les autres;
+- si deux workers indexent le même document en même temps, le premier enregistré est
+  gardé et l'autre supprime le sien;
+- l'éviction (nombre, inactivité) est décidée dans l'index, en une transaction: un
+  vector store n'est supprimé que par le worker qui a retiré sa ligne, et jamais tant
+  qu'il est dans l'index.
+"""
+# CORE
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import os
+import sqlite3
+import threading
+import time
+
+
+class IndexedDocument(NamedTuple):
+    content_hash: str
+    vector_store_id: str
+    file_id: str
+
+
+class VectorStoreIndex:
+    """
+    Content hash -> IndexedDocument, in SQLite, bounded in size (least recently used
+    evicted first) and in idle time. The methods block: call them from the threadpool.
+
+    Args:
+        path: the SQLite file shared by the processes (None: in memory, this process only).
+        maxsize: number of documents kept.
+        ttl: seconds after which an unused document is evicted (None: never).
+    """
+
+    def __init__(self, path: Optional[str], maxsize: int, ttl: Optional[float]):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Une connexion par processus: un index créé avant le fork n'est pas partagé avec les workers
+        if self._connection is None or self._pid != os.getpid():
+            if self.path and os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path or ":memory:", check_same_thread=False,
+                                         isolation_level=None, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS vector_stores ("
+                " content_hash TEXT PRIMARY KEY, vector_store_id TEXT NOT NULL, file_id TEXT NOT NULL,"
+                " used_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS vector_stores_used_at ON vector_stores (used_at)")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _oldest_valid(self) -> float:
+        return time.time() - self.ttl if self.ttl else float("-inf")
+
+    def get(self, content_hash: str) -> Optional[IndexedDocument]:
+        """The document indexed for this content, marked as used; None if unknown or expired."""
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT content_hash, vector_store_id, file_id FROM vector_stores"
+                " WHERE content_hash = ? AND used_at >= ?", (content_hash, self._oldest_valid())).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute("UPDATE vector_stores SET used_at = ? WHERE content_hash = ?",
+                               (time.time(), content_hash))
+            self.hits += 1
+            return IndexedDocument(*row)
+
+    def add(self, document: IndexedDocument) -> Tuple[IndexedDocument, List[IndexedDocument]]:
+        """
+        Record a new document, unless another process recorded one for the same content
+        meanwhile (that one is kept).
+
+        Returns:
+            tuple: the document in the index, and the documents evicted to make room (or
+            `document` itself when it lost), whose remote resources the caller deletes.
+        """
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = connection.execute(
+                    "SELECT content_hash, vector_store_id, file_id, used_at FROM vector_stores WHERE content_hash = ?",
+                    (document.content_hash,)).fetchone()
+                replaced = []
+                if row is not None and row[1] != document.vector_store_id:
+                    if row[3] >= self._oldest_valid():
+                        connection.execute("UPDATE vector_stores SET used_at = ? WHERE content_hash = ?",
+                                           (now, document.content_hash))
+                        connection.execute("COMMIT")
+                        return IndexedDocument(*row[:3]), [document]
+                    replaced.append(IndexedDocument(*row[:3]))  # Expiré, pas encore purgé
+                connection.execute("INSERT OR REPLACE INTO vector_stores VALUES (?, ?, ?, ?)", (*document, now))
+                evicted = replaced + self._evict(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return document, evicted
+
+    def _evict(self, connection: sqlite3.Connection) -> List[IndexedDocument]:
+        # Dans la transaction de l'appelant: chaque ligne retirée l'est par un seul processus
+        rows = connection.execute(
+            "SELECT content_hash, vector_store_id, file_id FROM vector_stores WHERE used_at < ?"
+            " UNION SELECT * FROM (SELECT content_hash, vector_store_id, file_id FROM vector_stores"
+            " ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (self._oldest_valid(), self.maxsize)).fetchall()
+        connection.executemany("DELETE FROM vector_stores WHERE content_hash = ?", [(row[0],) for row in rows])
+        return [IndexedDocument(*row) for row in rows]
+
+    def purge(self) -> List[IndexedDocument]:
+        """Remove and return the documents unused for `ttl` seconds (or beyond `maxsize`)."""
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                evicted = self._evict(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return evicted
+
+    def remove(self, document: IndexedDocument) -> None:
+        """Forget `document` (its vector store no longer exists), not a newer one for the same content."""
+        with self._lock:
+            self._connect().execute("DELETE FROM vector_stores WHERE content_hash = ? AND vector_store_id = ?",
+                                    (document.content_hash, document.vector_store_id))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM vector_stores WHERE used_at >= ?",
+                                           (self._oldest_valid(),)).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Same keys as LRUCache.stats(); hits and misses are those of this process."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,91 @@
+"""
+/metrics sous server.py: chaque worker a ses propres compteurs, et /metrics est servi
+par le worker qui accepte la connexion. Pour que les séries ne dépendent pas du worker
+interrogé, chaque worker écrit un instantané de son registre dans METRICS_DIR (toutes
+les METRICS_FLUSH_INTERVAL secondes, et au moment de répondre à /metrics), et /metrics
+additionne les instantanés de tous les workers.
+
+Les instantanés des workers morts sont gardés: les compteurs restent croissants quand
+un worker est redémarré. Les jauges (caches) ne sont prises que du dernier worker de
+chaque rang, avec un label `worker`.
+"""
+# CORE
+from typing import Any, Dict, List, Tuple
+import asyncio
+import glob
+import json
+import logging
+import os
+
+# OWN
+from metrics_utils.tools import Registry
+
+
+# Dossier partagé par les workers (créé par server.py; vide: /metrics du seul processus courant)
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+
+
+def snapshot_path(directory: str, worker: str, pid: int) -> str:
+    return os.path.join(directory, f"worker-{worker}-{pid}.json")
+
+
+def write_snapshot(registry: Registry, directory: str, worker: str) -> None:
+    """Write the registry of this process, atomically (a reader never sees a partial file)."""
+    path = snapshot_path(directory, worker, os.getpid())
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump({"worker": worker, "pid": os.getpid(), "metrics": registry.snapshot()}, f)
+    os.replace(temporary, path)
+
+
+def read_snapshots(directory: str) -> List[Tuple[float, Dict[str, Any]]]:
+    """The (modification time, snapshot) of every worker, dead ones included."""
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, "worker-*.json")):
+        try:
+            modified = os.path.getmtime(path)
+            with open(path) as f:
+                snapshots.append((modified, json.load(f)))
+        except (OSError, ValueError) as e:
+            logging.warning("Metrics snapshot %s skipped: %s", path, e)
+    return snapshots
+
+
+def render_workers(registry: Registry, directory: str, worker: str) -> str:
+    """/metrics for all the workers: this process's snapshot is refreshed first."""
+    write_snapshot(registry, directory, worker)
+    snapshots = read_snapshots(directory)
+    # Jauges: seulement l'instantané le plus récent de chaque rang (le worker en vie)
+    latest: Dict[str, Tuple[float, int]] = {}
+    for modified, snapshot in snapshots:
+        if modified >= latest.get(snapshot["worker"], (-1.0, 0))[0]:
+            latest[snapshot["worker"]] = (modified, snapshot["pid"])
+
+    pairs = []
+    for _, snapshot in snapshots:
+        metrics = snapshot["metrics"]
+        if latest[snapshot["worker"]][1] != snapshot["pid"]:
+            metrics = {name: samples for name, samples in metrics.items() if not registry.is_gauge(name)}
+        pairs.append((snapshot["worker"], metrics))
+    return registry.aggregate(pairs).render()
+
+
+def clear_snapshots(directory: str) -> None:
+    """Remove the snapshots of a previous run (the counters start again from zero)."""
+    for path in glob.glob(os.path.join(directory, "worker-*.json*")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+async def flush_periodically(registry: Registry, directory: str, worker: str,
+                             interval: float = METRICS_FLUSH_INTERVAL) -> None:
+    """Write the snapshot of this worker every `interval` seconds, and a last time when cancelled."""
+    try:
+        while True:
+            write_snapshot(registry, directory, worker)
+            await asyncio.sleep(interval)
+    finally:
+        write_snapshot(registry, directory, worker)
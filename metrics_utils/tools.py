@@ -0,0 +1,370 @@
+"""
+Métriques au format texte Prometheus (exposition 0.0.4), sans dépendance:
+compteurs, histogrammes et valeurs calculées au moment de la lecture (caches).
+"""
+# CORE
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import bisect
+import math
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+    def empty(self) -> "Metric":
+        """A metric of the same kind with no samples, to aggregate the snapshots of several processes."""
+        return type(self)(self.name, self.documentation, self.labelnames)
+
+    def snapshot(self) -> List[Any]:
+        """The samples as JSON-serialisable lists."""
+        raise NotImplementedError
+
+    def aggregate(self, samples: List[Any], worker: str) -> None:
+        """Add the samples of a snapshot taken in the process `worker`."""
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        pass
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def drain(self) -> Dict[LabelValues, float]:
+        """Return and reset the counts (to ship them from a worker process to the parent)."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: Dict[LabelValues, float]) -> None:
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+    def snapshot(self) -> List[Any]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def aggregate(self, samples: List[Any], worker: str) -> None:
+        self.merge({tuple(key): value for key, value in samples})
+
+    def reset(self) -> None:
+        self.drain()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Par jeu de labels: [compte par seau (non cumulé) + seau +Inf, somme]
+        self._values: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][position] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the `with` block, in seconds (errors included)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: Any) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+    def empty(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, self.labelnames, self.buckets)
+
+    def snapshot(self) -> List[Any]:
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+
+    def aggregate(self, samples: List[Any], worker: str) -> None:
+        with self._lock:
+            for key, counts, total in samples:
+                entry = self._values.get(tuple(key))
+                if entry is None:
+                    entry = self._values[tuple(key)] = [[0] * (len(self.buckets) + 1), 0.0]
+                entry[0] = [current + count for current, count in zip(entry[0], counts)]
+                entry[1] += total
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+
+class CallbackGauge(Metric):
+    """A gauge whose values are read from callbacks when /metrics is scraped."""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._callbacks: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set_function(self, function: Callable[[], float], **labels: Any) -> None:
+        with self._lock:
+            self._callbacks[self._key(labels)] = function
+
+    def render(self) -> List[str]:
+        with self._lock:
+            callbacks = sorted(self._callbacks.items())
+        lines = []
+        for key, function in callbacks:
+            try:
+                value = function()
+            except Exception:
+                continue
+            if value is not None:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def empty(self) -> "CallbackGauge":
+        # Une valeur par worker: un ratio ou une taille de cache ne s'additionnent pas
+        return CallbackGauge(self.name, self.documentation, self.labelnames + ("worker",))
+
+    def snapshot(self) -> List[Any]:
+        with self._lock:
+            callbacks = list(self._callbacks.items())
+        samples = []
+        for key, function in callbacks:
+            try:
+                value = function()
+            except Exception:
+                continue
+            if value is not None:
+                samples.append([list(key), value])
+        return samples
+
+    def aggregate(self, samples: List[Any], worker: str) -> None:
+        for key, value in samples:
+            labels = dict(zip(self.labelnames, list(key) + [worker]))
+            self.set_function(lambda value=value: value, **labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Dict[str, List[Any]]:
+        """The samples of every metric, to be aggregated by another process (see metrics_utils.multiprocess)."""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def aggregate(self, snapshots: List[Tuple[str, Dict[str, List[Any]]]]) -> "Registry":
+        """
+        A registry summing the counters and histograms of (worker, snapshot) pairs;
+        gauges keep one value per worker, with a `worker` label.
+        """
+        aggregated = Registry()
+        for metric in self._metrics.values():
+            aggregated.register(metric.empty())
+        for worker, snapshot in snapshots:
+            for name, samples in snapshot.items():
+                metric = aggregated._metrics.get(name)
+                if metric is not None:
+                    metric.aggregate(samples, worker)
+        return aggregated
+
+    def is_gauge(self, name: str) -> bool:
+        return isinstance(self._metrics.get(name), CallbackGauge)
+
+    def reset(self) -> None:
+        """Drop the counted samples (a forked worker starts from zero)."""
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            samples = metric.render()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route, until the last byte of the response.",
+    ("method", "route", "status")))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "stage_duration_seconds", "Duration of the internal processing stages.", ("stage",)))
+RULE_MATCHES = REGISTRY.register(Counter(
+    "ceh_rule_matches_total", "CEH rules whose conditions matched, by rule code.", ("code",)))
+RULE_SELECTED = REGISTRY.register(Counter(
+    "ceh_rule_selected_total", "CEH rules selected as the answer (highest priority), by rule code.", ("code",)))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Tokens used by the OpenAI calls, by model and kind (prompt, completion).", ("model", "kind")))
+COALESCED_CALLS = REGISTRY.register(Counter(
+    "coalesced_calls_total", "Calls to single-flight operations, by operation and role (executed, shared).",
+    ("operation", "role")))
+WEATHER_LOOKUPS = REGISTRY.register(Counter(
+    "ceh_weather_lookups_total", "Weather lookups of the CEH enrichment, by outcome.", ("outcome",)))
+JOBS_QUEUED = REGISTRY.register(CallbackGauge("methode_jobs_queued", "Jobs waiting in the /methode job queue."))
+JOBS_RUNNING = REGISTRY.register(CallbackGauge("methode_jobs_running", "Jobs being run by the /methode job workers."))
+JOBS_MAX_PENDING = REGISTRY.register(CallbackGauge(
+    "methode_jobs_max_pending", "Queued jobs beyond which /methode/redacteur answers 503."))
+JOBS_OLDEST_QUEUED = REGISTRY.register(CallbackGauge(
+    "methode_jobs_oldest_queued_seconds", "Age of the oldest queued /methode job."))
+CACHE_HITS = REGISTRY.register(CallbackGauge("cache_hits", "Cache hits since startup.", ("cache",)))
+CACHE_MISSES = REGISTRY.register(CallbackGauge("cache_misses", "Cache misses since startup.", ("cache",)))
+CACHE_HIT_RATIO = REGISTRY.register(CallbackGauge("cache_hit_ratio", "Cache hits / lookups since startup.", ("cache",)))
+
+
+def register_cache(name: str, stats: Callable[[], Tuple[int, int]]) -> None:
+    """Expose a cache through a callback returning (hits, misses)."""
+    def ratio() -> float:
+        hits, misses = stats()
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    CACHE_HITS.set_function(lambda: stats()[0], cache=name)
+    CACHE_MISSES.set_function(lambda: stats()[1], cache=name)
+    CACHE_HIT_RATIO.set_function(ratio, cache=name)
+
+
+def lru_stats(get_stats: Callable[[], Dict[str, Any]]) -> Callable[[], Tuple[int, int]]:
+    """register_cache callback for a cache whose stats() is LRUCache.stats()."""
+    return lambda: (get_stats()["hits"], get_stats()["misses"])
+
+
+def record_usage(usage: Any, model: Optional[str]) -> None:
+    """Count the tokens of an OpenAI response `usage` (ignored when absent)."""
+    if usage is None:
+        return
+    model = model or "unknown"
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request until its response is fully sent,
+    labelled with the route template (ex: /methode/jobs/{job_id}) rather than the
+    raw path, so that path parameters do not multiply the series.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+        self._routes: Dict[Any, str] = {}
+
+    def _route(self, scope: Dict[str, Any]) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        route = self._routes.get(endpoint)
+        if route is None:
+            router = scope.get("router")
+            for candidate in getattr(router, "routes", ()):
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    route = candidate.path
+                    break
+            route = self._routes[endpoint] = route or "unmatched"
+        return route
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_LATENCY.observe(time.perf_counter() - start, method=scope["method"],
+                                    route=self._route(scope), status=status[0])
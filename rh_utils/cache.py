@@ -0,0 +1,238 @@
+"""
+Cache des évaluations RH: beaucoup d'apprenants envoient des réponses quasi
+identiques aux mêmes questions, l'évaluation du modèle est donc réutilisée.
+
+La clef est (questionnaire, id de question, réponse normalisée). Une réponse
+identique après normalisation est servie directement; si un seuil de similarité
+est configuré, la réponse la plus proche déjà évaluée pour la même question
+peut aussi être servie.
+"""
+# CORE
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# OWN
+from cache_utils.tools import LRUCache
+
+
+RH_EVAL_CACHE_SIZE = int(os.environ.get("RH_EVAL_CACHE_SIZE", 2048))
+# Durée de vie d'une évaluation en secondes (0: pas d'expiration)
+RH_EVAL_CACHE_TTL = float(os.environ.get("RH_EVAL_CACHE_TTL", 7 * 24 * 3600))
+# Ratio minimal (0 à 1) pour servir l'évaluation d'une réponse proche (0: désactivé)
+RH_EVAL_CACHE_SIMILARITY = float(os.environ.get("RH_EVAL_CACHE_SIMILARITY", 0))
+# Fichier SQLite pour conserver les évaluations entre deux démarrages (vide: en mémoire)
+RH_EVAL_CACHE_PATH = os.environ.get("RH_EVAL_CACHE_PATH", "")
+# Nombre maximal de réponses comparées par question pour la recherche par similarité
+MAX_SIMILARITY_CANDIDATES = 256
+
+Scope = Tuple[str, int, str]
+
+
+def normalize_answer(answer: str) -> str:
+    """Minuscules, sans accents, ponctuation ni espaces superflus."""
+    answer = unicodedata.normalize("NFKD", (answer or "").lower())
+    answer = "".join(char for char in answer if not unicodedata.combining(char))
+    return " ".join(re.findall(r"\w+", answer))
+
+
+def question_scope(survey_name: str, question_id: int, question: str, verified_answer: str) -> Scope:
+    """
+    La question évaluée; l'empreinte du texte invalide les évaluations quand la
+    question ou la réponse attendue change dans le CSV.
+    """
+    digest = hashlib.sha256("\0".join((question, verified_answer)).encode()).hexdigest()[:12]
+    return (survey_name, int(question_id), digest)
+
+
+class MemoryBackend:
+    """Évaluations en mémoire, bornées en nombre (LRU) et en âge (TTL)."""
+
+    def __init__(self, maxsize: int = RH_EVAL_CACHE_SIZE, ttl: Optional[float] = RH_EVAL_CACHE_TTL):
+        self._entries: LRUCache[str] = LRUCache(maxsize, ttl or None)
+        # Réponses connues par question, pour la recherche par similarité
+        self._answers: Dict[Scope, Dict[str, None]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope: Scope, answer: str) -> Optional[str]:
+        return self._entries.get((scope, answer), count=False)
+
+    def set(self, scope: Scope, answer: str, evaluation: str) -> None:
+        evicted = self._entries.set((scope, answer), evaluation)
+        with self._lock:
+            self._answers.setdefault(scope, {})[answer] = None
+            for (old_scope, old_answer), _ in evicted:
+                self._forget(old_scope, old_answer)
+
+    def _forget(self, scope: Scope, answer: str) -> None:
+        answers = self._answers.get(scope)
+        if answers is not None:
+            answers.pop(answer, None)
+            if not answers:
+                del self._answers[scope]
+
+    def candidates(self, scope: Scope, limit: int = MAX_SIMILARITY_CANDIDATES) -> List[Tuple[str, str]]:
+        with self._lock:
+            # Les plus récentes d'abord
+            answers = list(self._answers.get(scope, {}))[-limit:][::-1]
+        candidates = []
+        for answer in answers:
+            evaluation = self._entries.get((scope, answer), count=False)
+            if evaluation is None:
+                with self._lock:
+                    self._forget(scope, answer)
+            else:
+                candidates.append((answer, evaluation))
+        return candidates
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Évaluations conservées dans un fichier SQLite, bornées en nombre et en âge."""
+
+    def __init__(self, path: str, maxsize: int = RH_EVAL_CACHE_SIZE, ttl: Optional[float] = RH_EVAL_CACHE_TTL):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS evaluations ("
+            " scope TEXT NOT NULL, answer TEXT NOT NULL, evaluation TEXT NOT NULL,"
+            " stored_at REAL NOT NULL, used_at REAL NOT NULL, PRIMARY KEY (scope, answer))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS evaluations_used_at ON evaluations (used_at)")
+
+    @staticmethod
+    def _scope_key(scope: Scope) -> str:
+        return "\0".join(map(str, scope))
+
+    def _oldest_valid(self) -> float:
+        return time.time() - self.ttl if self.ttl else float("-inf")
+
+    def get(self, scope: Scope, answer: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT evaluation FROM evaluations WHERE scope = ? AND answer = ? AND stored_at >= ?",
+                (self._scope_key(scope), answer, self._oldest_valid()),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE evaluations SET used_at = ? WHERE scope = ? AND answer = ?",
+                                     (time.time(), self._scope_key(scope), answer))
+            return row[0]
+
+    def set(self, scope: Scope, answer: str, evaluation: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?, ?)",
+                                     (self._scope_key(scope), answer, evaluation, now, now))
+            self._connection.execute("DELETE FROM evaluations WHERE stored_at < ?", (self._oldest_valid(),))
+            self._connection.execute(
+                "DELETE FROM evaluations WHERE rowid IN ("
+                " SELECT rowid FROM evaluations ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def candidates(self, scope: Scope, limit: int = MAX_SIMILARITY_CANDIDATES) -> List[Tuple[str, str]]:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT answer, evaluation FROM evaluations WHERE scope = ? AND stored_at >= ?"
+                " ORDER BY used_at DESC LIMIT ?",
+                (self._scope_key(scope), self._oldest_valid(), limit),
+            ).fetchall()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class EvaluationCache:
+    """
+    Évaluations déjà produites par le modèle, réutilisées pour les réponses
+    identiques (après normalisation) puis, si `similarity` > 0, pour les réponses
+    dont le ratio difflib avec une réponse déjà évaluée atteint le seuil.
+
+    Le stockage est interchangeable: MemoryBackend ou SQLiteBackend (même interface
+    get / set / candidates). get et set sont bloquants (SQLite, difflib): les routes
+    les appellent dans le threadpool.
+    """
+
+    def __init__(self, backend=None, similarity: float = RH_EVAL_CACHE_SIMILARITY):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.similarity = similarity
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def get(self, scope: Scope, answer: str) -> Optional[str]:
+        """L'évaluation à réutiliser pour cette réponse, ou None."""
+        normalized = normalize_answer(answer)
+        evaluation = self.backend.get(scope, normalized)
+        if evaluation is not None:
+            self.exact_hits += 1
+            return evaluation
+        if self.similarity > 0:
+            evaluation = self._most_similar(scope, normalized)
+            if evaluation is not None:
+                self.similar_hits += 1
+                return evaluation
+        self.misses += 1
+        return None
+
+    def _most_similar(self, scope: Scope, normalized: str) -> Optional[str]:
+        best_ratio, best_evaluation = self.similarity, None
+        matcher = SequenceMatcher(autojunk=False)
+        matcher.set_seq2(normalized)
+        for answer, evaluation in self.backend.candidates(scope):
+            matcher.set_seq1(answer)
+            # Bornes supérieures rapides avant le calcul complet
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best_ratio, best_evaluation = ratio, evaluation
+        return best_evaluation
+
+    def set(self, scope: Scope, answer: str, evaluation: str) -> None:
+        self.backend.set(scope, normalize_answer(answer), evaluation)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.exact_hits + self.similar_hits
+        total = hits + self.misses
+        return {
+            "size": len(self.backend),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / total if total else 0.0,
+        }
+
+
+_evaluation_cache: Optional[EvaluationCache] = None
+
+
+def get_evaluation_cache() -> EvaluationCache:
+    """The process-wide EvaluationCache, created on first use (SQLite if RH_EVAL_CACHE_PATH is set)."""
+    global _evaluation_cache
+    if _evaluation_cache is None:
+        backend = SQLiteBackend(RH_EVAL_CACHE_PATH) if RH_EVAL_CACHE_PATH else MemoryBackend()
+        logging.info("RH evaluation cache: %s backend", type(backend).__name__)
+        _evaluation_cache = EvaluationCache(backend)
+    return _evaluation_cache
@@ -0,0 +1,95 @@
+import csv
+import os
+import random
+import threading
+from typing import Dict, List, NamedTuple, Tuple
+
+from metrics_utils.tools import STAGE_LATENCY
+
+
+class SurveyData(NamedTuple):
+    # (id, question, verified_answer) dans l'ordre du fichier, pour le tirage au sort
+    questions: Tuple[Tuple[int, str, str], ...]
+    by_id: Dict[int, Tuple[int, str, str]]
+    mtime_ns: int
+
+
+def load_survey(file_path, delimiter=';'):
+    """Charge un questionnaire CSV (colonnes id, question, verified_answer) sans pandas.
+
+    Args:
+        file_path (str): Le chemin du fichier CSV.
+        delimiter (str): Le séparateur de colonnes.
+
+    Returns:
+        SurveyData: Les questions, indexées par id.
+    """
+    mtime_ns = os.stat(file_path).st_mtime_ns
+    with STAGE_LATENCY.time(stage="csv_load"), open(file_path, newline='', encoding='utf-8') as f:
+        questions = tuple(
+            (int(row['id']), row['question'], row['verified_answer'])
+            for row in csv.DictReader(f, delimiter=delimiter)
+        )
+    return SurveyData(questions, {question[0]: question for question in questions}, mtime_ns)
+
+
+class SurveyRepository:
+    """Questionnaires RH chargés une fois en mémoire.
+
+    Chaque fichier est rechargé quand sa date de modification change; les
+    requêtes ne font plus qu'un os.stat et une lecture de dictionnaire.
+    """
+
+    def __init__(self, folder_path, delimiter=';'):
+        self.folder_path = folder_path
+        self.delimiter = delimiter
+        self._surveys: Dict[str, SurveyData] = {}
+        self._lock = threading.Lock()
+
+    def list_surveys(self) -> List[str]:
+        """Liste les fichiers de questionnaires du dossier."""
+        return [f for f in os.listdir(self.folder_path) if os.path.isfile(os.path.join(self.folder_path, f))]
+
+    def load_all(self) -> None:
+        """Charge tous les questionnaires du dossier (au démarrage)."""
+        for survey_name in self.list_surveys():
+            self.get(survey_name)
+
+    def get(self, survey_name) -> SurveyData:
+        """Le questionnaire `survey_name`, rechargé si le fichier a changé.
+
+        Raises:
+            KeyError: si le questionnaire n'existe pas dans le dossier.
+        """
+        # Seuls les fichiers du dossier sont servis (pas de chemin relatif)
+        if not survey_name or os.path.basename(survey_name) != survey_name:
+            raise KeyError(f"Unknown survey: {survey_name}")
+        file_path = os.path.join(self.folder_path, survey_name)
+        try:
+            mtime_ns = os.stat(file_path).st_mtime_ns
+        except FileNotFoundError:
+            self._surveys.pop(survey_name, None)
+            raise KeyError(f"Unknown survey: {survey_name}")
+
+        survey = self._surveys.get(survey_name)
+        if survey is None or survey.mtime_ns != mtime_ns:
+            with self._lock:
+                survey = self._surveys.get(survey_name)
+                if survey is None or survey.mtime_ns != mtime_ns:
+                    survey = load_survey(file_path, self.delimiter)
+                    self._surveys[survey_name] = survey
+        return survey
+
+    def random_question(self, survey_name) -> Tuple[str, int]:
+        """Tire une question au hasard: (question, id)."""
+        question_id, question, _verified_answer = random.choice(self.get(survey_name).questions)
+        return question, question_id
+
+    def get_question(self, survey_name, question_id) -> Tuple[str, str]:
+        """La question et la réponse attendue pour un id: (question, verified_answer).
+
+        Raises:
+            KeyError: si l'id n'existe pas dans le questionnaire.
+        """
+        _question_id, question, verified_answer = self.get(survey_name).by_id[question_id]
+        return question, verified_answer
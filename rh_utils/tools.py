@@ -1,5 +1,11 @@
+import json
 import os
-from openai import OpenAI
+
+from fastapi.concurrency import run_in_threadpool
+
+from cache_utils.singleflight import SingleFlight
+from llm_utils.client import get_llm_client
+from llm_utils.sse import RESULT_EVENT, TOKEN_EVENT
 
 
 def check_if_authorized(client_secret):
@@ -10,30 +16,15 @@ def check_if_authorized(client_secret):
         return False
 
 
-def ask_question(dataframe):
-    # Choisis une ligne au hasard pour la question
-    question_sample = dataframe.sample()
-    question = question_sample['question'].iloc[0]
-    id_answer = question_sample['id'].iloc[0]
-    
-    return question, id_answer
+EVALUATION_MODEL = "gpt-4-turbo"
+# Durée maximale (secondes) d'une évaluation partagée par des requêtes identiques
+RH_EVAL_TIMEOUT = float(os.environ.get("RH_EVAL_TIMEOUT", 120))
 
+_evaluations = SingleFlight("rh_evaluation", RH_EVAL_TIMEOUT)
 
-def get_question_by_id(dataframe, id_answer):
-    question_sample = dataframe[dataframe['id'] == id_answer]
-    question = question_sample['question'].iloc[0]
-    verified_answer = question_sample['verified_answer'].iloc[0]
-    
-    return question, verified_answer
 
-def evaluate_user_answer(question, verified_answer, user_response):
-    # Envoi à l'API OpenAI pour évaluation
-    client = OpenAI(
-        api_key=os.environ.get("OPENAI_API_KEY"),
-    )
-    completion = client.chat.completions.create(
-    model="gpt-4-turbo",
-    messages=[
+def build_evaluation_messages(question, verified_answer, user_response):
+    return [
         {"role": "system", "content": """Tu es un formateur E-learning motivé et empathique. Tu as posé une question à un apprenant. Tu as la question, la réponse attendue et la réponse de l'utilisateur. Tu dois juger de la qualité de la réponse de l'apprenant. Si la réponse est correcte tu dois le faire savoir à ton apprenant, si elle est incompléte tu dois la compléter et féliciter l'apprenant sur ce qu'il a compris et retenu et si elle est fausse tu dois faire preuve de pédagogie et donner la réponse correcte en restant le plus positif possible.
         A la fin de ta réponse je veux une estimation en pourcentage de la validité de la réponse de ton apprenant.
         IMPORTANT:
@@ -44,8 +35,60 @@ def evaluate_user_answer(question, verified_answer, user_response):
         - Ta réponse devra prendre la forme d'un json avec un clef response et une clef score (le score est un integer entre 0 et 100)
          """},
         {"role": "user", "content": f"Question: {question}\nRéponse vérifiée: {verified_answer}\nRéponse utilisateur: {user_response}\nÉvaluer la réponse."}
-    ], 
+    ]
+
+
+async def evaluate_user_answer(question, verified_answer, user_response):
+    # Les évaluations identiques déjà en cours (début de session de formation) partagent un seul appel
+    return await _evaluations.do((question, verified_answer, user_response),
+                                 _evaluate_user_answer, question, verified_answer, user_response)
+
+
+async def _evaluate_user_answer(question, verified_answer, user_response):
+    # Envoi à l'API OpenAI pour évaluation
+    llm = get_llm_client()
+    completion = await llm.call(
+    llm.client.chat.completions.create,
+    model=EVALUATION_MODEL,
+    messages=build_evaluation_messages(question, verified_answer, user_response),
     response_format={"type": "json_object"}
 
     )
-    return completion.choices[0].message.content
\ No newline at end of file
+    return completion.choices[0].message.content
+
+
+async def stream_user_answer_evaluation(question, verified_answer, user_response):
+    # Même évaluation, les fragments du json sont renvoyés au fur et à mesure
+    llm = get_llm_client()
+    async for chunk in llm.stream(
+        llm.client.chat.completions.create,
+        model=EVALUATION_MODEL,
+        messages=build_evaluation_messages(question, verified_answer, user_response),
+        response_format={"type": "json_object"},
+    ):
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def parse_evaluation(evaluation):
+    # Le modèle répond en json {"response": ..., "score": ...}
+    try:
+        return json.loads(evaluation)
+    except ValueError:
+        return {"response": evaluation, "score": None}
+
+
+async def stream_evaluation_events(question, verified_answer, user_response, evaluation_cache=None, scope=None):
+    # Évènements ("token", {"text"}) puis ("result", {"response", "score"}); une évaluation en cache part d'un bloc
+    evaluation = None
+    if evaluation_cache is not None:
+        evaluation = await run_in_threadpool(evaluation_cache.get, scope, user_response)
+    if evaluation is None:
+        parts = []
+        async for text in stream_user_answer_evaluation(question, verified_answer, user_response):
+            parts.append(text)
+            yield TOKEN_EVENT, {"text": text}
+        evaluation = "".join(parts)
+        if evaluation_cache is not None:
+            await run_in_threadpool(evaluation_cache.set, scope, user_response, evaluation)
+    yield RESULT_EVENT, parse_evaluation(evaluation)
@@ -0,0 +1,60 @@
+# CORE
+from typing import Any
+import logging
+
+# FASTAPI
+from fastapi import APIRouter, Request
+
+# OWN UTILS
+from rh_utils.tools import check_if_authorized
+from breakdown_spec_utils.engine import BreakdownEngine, load_graph
+from llm_utils.client import get_llm_client, import_sdk
+
+# MODELS
+from breakdown_spec_utils.model import UserAnswer
+
+PARCOURS_PATH = './data/breakdown_data/parcours.yml'
+PROMPTS_PATH = './data/breakdown_data/prompts/prompts_list.json'
+
+router = APIRouter(tags=["breakdown"])
+
+
+def preload(state: Any) -> None:
+    # Parcours compilés et vérifiés une fois: un fichier invalide empêche le démarrage
+    state.breakdown = BreakdownEngine(load_graph(PARCOURS_PATH, PROMPTS_PATH))
+    import_sdk()
+
+
+async def start(state: Any) -> None:
+    get_llm_client()
+
+
+async def stop(state: Any) -> None:
+    pass
+
+
+@router.post("/breakdown/get_classif")
+async def breakdown_get_classif(user_answer: UserAnswer, request: Request):
+    """
+    Un pas du parcours de qualification de panne: sans conversation en cours, ouvre
+    le parcours de `problem` (ou de tous les problèmes candidats s'il n'est pas indiqué)
+    et renvoie la ou les premières questions (celles auxquelles le premier message ne
+    répond pas déjà); sinon classe la réponse et renvoie les
+    suivantes, ou le résultat (les problèmes classés) en fin de parcours.
+    """
+    if not check_if_authorized(user_answer.client_secret):
+        return {"error": "Unauthorized"}
+
+    engine = request.app.state.breakdown
+    try:
+        if user_answer.conversation_id and await engine.has_session(user_answer.conversation_id):
+            return await engine.answer(user_answer.conversation_id, user_answer.user_answer)
+        if user_answer.problem:
+            return await engine.start(user_answer.problem, user_answer.conversation_id, user_answer.user_answer)
+        if user_answer.conversation_id:
+            return {"error": "Conversation inconnue ou expirée", "problems": list(engine.graphs)}
+        # Sans problème indiqué, tous les parcours sont suivis ensemble et classés
+        return await engine.start_all(opening=user_answer.user_answer)
+    except Exception as e:
+        logging.error(e)
+        return {"error": str(e)}
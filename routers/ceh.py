@@ -0,0 +1,154 @@
+# CORE
+from typing import Any, AsyncIterator
+from functools import partial
+import logging
+import os
+
+# THIRD PARTY
+import anyio
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+
+# FASTAPI
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# OWN UTILS
+from ceh_utils.tools import format_matched_message
+from ceh_utils.registry import RulesRegistry
+from ceh_utils.batch import BatchEvaluator
+from ceh_utils.cache import DecisionCache
+from ceh_utils.payload import parse_payload
+from ceh_utils.paths import compile_path
+from ceh_utils.weather import create_weather_enricher
+from metrics_utils.tools import STAGE_LATENCY, lru_stats, register_cache
+
+
+RULES_PATH = './data/rules_data/rules.yaml'
+TRANSCODING_PATH = './data/rules_data/path_transcoding.py'
+# Ordre d'évaluation des chemins écrit par `python -m ceh_utils.profiler --order` (facultatif)
+PATH_ORDER_PATH = os.environ.get("RULES_PATH_ORDER", './data/rules_data/path_order.json')
+RULES_POLL_INTERVAL = float(os.environ.get("RULES_POLL_INTERVAL", 2))
+CEH_BATCH_WORKERS = int(os.environ.get("CEH_BATCH_WORKERS", 0))
+CEH_BATCH_CHUNK_SIZE = int(os.environ.get("CEH_BATCH_CHUNK_SIZE", 256))
+# Octets gardés au plus en mémoire pour un lot: un corps en tableau JSON, ou une ligne NDJSON
+CEH_BATCH_MAX_BUFFER = int(os.environ.get("CEH_BATCH_MAX_BUFFER", 64 * 1024 * 1024))
+
+# Le corps de /ceh est décodé par parse_payload et non validé par FastAPI: documenté ici pour /docs
+CEH_REQUEST_BODY = {"requestBody": {"required": True, "content": {"application/json": {"schema": {"type": "object"}}}}}
+
+router = APIRouter(tags=["ceh"])
+
+
+def preload(state: Any) -> None:
+    # Les règles sont compilées au démarrage puis rechargées en arrière-plan si les fichiers changent
+    state.rules_registry = RulesRegistry(RULES_PATH, TRANSCODING_PATH, RULES_POLL_INTERVAL, PATH_ORDER_PATH)
+    state.rules_registry.load()
+    # Premier passage dans le moteur de règles (chemins, index) hors requête
+    state.rules_registry.current.rule_set.evaluate({})
+
+
+async def start(state: Any) -> None:
+    state.rules_registry.start()
+    state.batch_evaluator = BatchEvaluator(CEH_BATCH_WORKERS, CEH_BATCH_CHUNK_SIZE, CEH_BATCH_MAX_BUFFER)
+    state.ceh_decisions = DecisionCache()
+    register_cache("ceh_decisions", lru_stats(state.ceh_decisions.stats))
+    # None si WEATHER_PROVIDER n'est pas configuré: les documents sont évalués sans météo
+    state.weather = create_weather_enricher()
+    if state.weather is not None:
+        register_cache("weather", lru_stats(state.weather.stats))
+    register_cache("compiled_paths", lambda: compile_path.cache_info()[:2])
+
+
+async def stop(state: Any) -> None:
+    state.rules_registry.stop()
+    state.batch_evaluator.shutdown()
+    if state.weather is not None:
+        await state.weather.close()
+
+
+@router.post("/ceh", openapi_extra=CEH_REQUEST_BODY)
+async def get_ceh_info(request: Request, response: Response):
+    try:
+        with STAGE_LATENCY.time(stage="payload_parsing"):
+            ceh_data = parse_payload(await request.body())
+    except ValueError as e:
+        return JSONResponse(content={"error": f"JSON invalide: {e}"}, status_code=422)
+    if not isinstance(ceh_data, dict):
+        return JSONResponse(content={"error": "Le document CEH doit être un objet JSON"}, status_code=422)
+
+    state = request.app.state
+    rules = state.rules_registry.current
+    response.headers["X-Rules-Version"] = rules.version
+    if state.weather is not None:
+        with STAGE_LATENCY.time(stage="weather_enrichment"):
+            await state.weather.enrich(rules.rule_set, ceh_data)
+    try:
+        with STAGE_LATENCY.time(stage="rule_evaluation"):
+            selected_message = state.ceh_decisions.evaluate(rules.rule_set, rules.version, ceh_data)
+    except Exception as e:
+        logging.error(e)
+        selected_message = None
+
+    formatted_message = format_matched_message(selected_message)
+
+    return formatted_message
+
+
+class BatchStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose content is computed while the request body is read.
+
+    StreamingResponse listens for the client disconnect on the channel that also brings
+    the body, and would swallow its chunks: here the body goes to the content iterator,
+    and the disconnect is listened for once `body_read` is set (a disconnect during the
+    upload ends the body iterator with ClientDisconnect).
+    """
+
+    def __init__(self, content: AsyncIterator[str], body_read: anyio.Event, **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.body_read = body_read
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async with anyio.create_task_group() as task_group:
+
+            async def wrap(func) -> None:
+                await func()
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(wrap, partial(self.stream_response, send))
+            await self.body_read.wait()
+            await wrap(partial(self.listen_for_disconnect, receive))
+
+    async def stream_response(self, send: Send) -> None:
+        try:
+            await super().stream_response(send)
+        except ClientDisconnect:
+            logging.info("Client disconnected during the batch upload")
+
+
+async def _read_body(request: Request, body_read: anyio.Event) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in request.stream():
+            yield chunk
+    finally:
+        body_read.set()
+
+
+@router.post("/ceh/batch")
+async def get_ceh_info_batch(request: Request):
+    """
+    Évalue un lot de documents CEH (tableau JSON ou NDJSON) et renvoie un résultat
+    NDJSON par document, dans l'ordre d'entrée.
+
+    Les documents NDJSON sont évalués au fil de la réception: la mémoire ne dépend pas de
+    la taille du lot. Un tableau JSON est lu en entier avant l'évaluation, dans la limite
+    de CEH_BATCH_MAX_BUFFER octets (au-delà, une ligne d'erreur; envoyer du NDJSON).
+    """
+    state = request.app.state
+    rules = state.rules_registry.current
+    body_read = anyio.Event()
+    results = state.batch_evaluator.stream(_read_body(request, body_read), rules.rule_set, rules.version,
+                                           state.weather)
+    return BatchStreamingResponse(results, body_read, media_type="application/x-ndjson",
+                                  headers={"X-Rules-Version": rules.version})
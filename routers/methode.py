@@ -0,0 +1,101 @@
+# CORE
+from typing import Any, Literal
+import logging
+
+# FASTAPI
+from fastapi import APIRouter, File, Request, UploadFile
+from fastapi.responses import JSONResponse
+
+# OWN UTILS
+from files_utils.uploads import store_upload
+from methodes_utils.manager import get_assistant_manager
+from methodes_utils.retrieval import get_local_retriever
+from methodes_utils.jobs import REDACTEUR_JOB, QueueFull, create_job_queue
+from llm_utils.client import get_llm_client, import_sdk
+from llm_utils.sse import sse_response
+from metrics_utils.tools import (JOBS_MAX_PENDING, JOBS_OLDEST_QUEUED, JOBS_QUEUED, JOBS_RUNNING, lru_stats,
+                                 register_cache)
+
+router = APIRouter(tags=["methode"])
+
+
+def preload(state: Any) -> None:
+    import_sdk()
+
+
+async def start(state: Any) -> None:
+    register_cache("vector_stores", lru_stats(lambda: get_assistant_manager().stats()))
+    register_cache("local_indexes", lru_stats(lambda: get_local_retriever().stats()))
+    state.jobs = create_job_queue()
+    JOBS_QUEUED.set_function(lambda: state.jobs.snapshot()["queued"])
+    JOBS_RUNNING.set_function(lambda: state.jobs.snapshot()["running"])
+    JOBS_MAX_PENDING.set_function(lambda: state.jobs.max_pending)
+    JOBS_OLDEST_QUEUED.set_function(lambda: state.jobs.snapshot()["oldest_queued_seconds"])
+    # Sous server.py, les travaux interrompus sont rendus par le superviseur, chacun repris par un seul worker
+    await state.jobs.start(requeue_running=getattr(state, "requeue_jobs", True),
+                           resume_queued=getattr(state, "resume_jobs", True))
+    get_llm_client()
+
+
+async def stop(state: Any) -> None:
+    # Les travaux en cours sont interrompus avant la fermeture du client; ils reprendront au démarrage
+    await state.jobs.stop()
+    await get_assistant_manager().close()
+
+
+@router.post("/methode/redacteur", status_code=202)
+async def upload_pdf(user_question, request: Request, file: UploadFile = File(...),
+                     mode: Literal["assistant", "local"] = "assistant"):
+    """
+    Enregistre la question sur le PDF et renvoie aussitôt l'id du travail;
+    la réponse est à suivre sur /methode/jobs/{job_id}.
+    """
+    if file.content_type != "application/pdf":
+        return JSONResponse(content={"error": "Le fichier doit être au format PDF"}, status_code=400)
+
+    # Stockage adressé par le contenu: un contrat déjà reçu n'est ni réécrit ni réindexé
+    stored = await store_upload(file)
+
+    # Indexation et réponse du modèle (local: recherche dans le document puis un seul appel)
+    # sont faites par les workers de la file, hors de la requête
+    payload = {"question": user_question, "path": stored.path, "content_hash": stored.content_hash, "mode": mode}
+    try:
+        job_id = await request.app.state.jobs.submit(REDACTEUR_JOB, payload)
+    except QueueFull as e:
+        logging.error(e)
+        return JSONResponse(content={"error": "Trop de demandes en attente, réessayez plus tard"}, status_code=503,
+                            headers={"Retry-After": "30"})
+
+    return JSONResponse(content={"job_id": job_id, "status": "queued"}, status_code=202,
+                        headers={"Location": f"/methode/jobs/{job_id}"})
+
+
+@router.get("/methode/jobs")
+async def methode_jobs_stats(request: Request):
+    return await request.app.state.jobs.stats()
+
+
+@router.get("/methode/jobs/{job_id}")
+async def methode_job(job_id: str, request: Request):
+    job = await request.app.state.jobs.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Travail inconnu"}, status_code=404)
+    return job
+
+
+@router.post("/methode/redacteur/stream")
+async def upload_pdf_stream(user_question, file: UploadFile = File(...),
+                            mode: Literal["assistant", "local"] = "assistant"):
+    """
+    Même réponse en Server-Sent Events: des évènements `token` au fil de la
+    génération puis un évènement `result` ({"answer", "sources"}).
+    """
+    if file.content_type != "application/pdf":
+        return JSONResponse(content={"error": "Le fichier doit être au format PDF"}, status_code=400)
+
+    stored = await store_upload(file)
+
+    if mode == "local":
+        return sse_response(get_local_retriever().stream_answer(user_question, stored.path, stored.content_hash))
+
+    return sse_response(get_assistant_manager().stream_answer(user_question, stored.path, stored.content_hash))
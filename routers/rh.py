@@ -0,0 +1,105 @@
+# CORE
+from typing import Any
+import logging
+
+# FASTAPI
+from fastapi import APIRouter, Request
+from fastapi.concurrency import run_in_threadpool
+
+# OWN UTILS
+from rh_utils.tools import evaluate_user_answer, check_if_authorized, stream_evaluation_events
+from rh_utils.store import SurveyRepository
+from rh_utils.cache import get_evaluation_cache, question_scope
+from llm_utils.client import get_llm_client, import_sdk
+from llm_utils.sse import sse_response
+from metrics_utils.tools import register_cache
+
+# MODELS
+from rh_utils.model import Survey
+
+RH_DATA_PATH = './data/rh_data'
+
+router = APIRouter(tags=["rh"])
+
+
+def preload(state: Any) -> None:
+    # Questionnaires RH lus une fois au démarrage, rechargés quand un fichier change
+    state.surveys = SurveyRepository(RH_DATA_PATH)
+    state.surveys.load_all()
+    import_sdk()
+
+
+async def start(state: Any) -> None:
+    def evaluation_cache_stats():
+        stats = get_evaluation_cache().stats()
+        return stats["exact_hits"] + stats["similar_hits"], stats["misses"]
+
+    register_cache("rh_evaluations", evaluation_cache_stats)
+    # Clients créés avant la première requête
+    get_llm_client()
+    get_evaluation_cache()
+
+
+async def stop(state: Any) -> None:
+    pass
+
+
+@router.get("/rh/get_surveys")
+async def get_rh_questionnaire(request: Request):
+    files = request.app.state.surveys.list_surveys()
+    return {"surveys": files}
+
+
+@router.post("/rh/get_question")
+async def rh_get_question(survey: Survey, request: Request):
+    try:
+        question, question_id = request.app.state.surveys.random_question(survey.survey_name)
+
+        return {"question": question, "id": question_id}
+    except Exception as e:
+        logging.error(e)
+        return {"error": str(e)}
+
+
+@router.post("/rh/get_evaluation")
+async def rh_get_evaluation(survey: Survey, request: Request):
+    try:
+        question, verified_answer = request.app.state.surveys.get_question(survey.survey_name, int(survey.question_id))
+        is_user_authorized = check_if_authorized(survey.client_secret)
+
+        if not is_user_authorized:
+            return {"error": "Unauthorized"}
+
+        # Une réponse déjà évaluée (ou assez proche) ne repart pas au modèle; la lecture (SQLite,
+        # comparaison difflib) et l'écriture du cache sont faites hors de la boucle
+        evaluation_cache = get_evaluation_cache()
+        scope = question_scope(survey.survey_name, survey.question_id, question, verified_answer)
+        evaluation = await run_in_threadpool(evaluation_cache.get, scope, survey.user_answer)
+        if evaluation is None:
+            evaluation = await evaluate_user_answer(question, verified_answer, survey.user_answer)
+            await run_in_threadpool(evaluation_cache.set, scope, survey.user_answer, evaluation)
+
+        return {"evaluation": evaluation}
+    except Exception as e:
+        logging.error(e)
+        return {"error": str(e)}
+
+
+@router.post("/rh/get_evaluation/stream")
+async def rh_get_evaluation_stream(survey: Survey, request: Request):
+    """
+    Même évaluation en Server-Sent Events: des évènements `token` au fil de la
+    génération puis un évènement `result` avec le json final (response, score).
+    """
+    try:
+        question, verified_answer = request.app.state.surveys.get_question(survey.survey_name, int(survey.question_id))
+    except Exception as e:
+        logging.error(e)
+        return {"error": str(e)}
+
+    if not check_if_authorized(survey.client_secret):
+        return {"error": "Unauthorized"}
+
+    scope = question_scope(survey.survey_name, survey.question_id, question, verified_answer)
+    return sse_response(stream_evaluation_events(question, verified_answer, survey.user_answer,
+                                                 get_evaluation_cache(), scope))
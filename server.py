@@ -0,0 +1,247 @@
+"""
+Production entry point: loads and compiles the shared state once (rules and path
+transcoding, RH surveys, breakdown graph), then forks N uvicorn workers that accept
+on the same listening socket and share that state copy-on-write.
+
+The supervisor restarts a worker that dies, and stops them all gracefully on SIGTERM
+or SIGINT. Each worker runs the application lifespan (per-process clients, threads and
+job workers) and answers /ready once started.
+
+Usage:
+    python server.py [--workers N] [--host 0.0.0.0] [--port 8000]
+
+Environment:
+    WEB_CONCURRENCY: number of workers, by default the CPUs available to the container.
+    SERVER_GRACEFUL_TIMEOUT: seconds given to the workers to finish their requests on stop.
+    ENABLED_ROUTERS: domains served (ceh, rh, breakdown, methode), all by default.
+    METRICS_DIR: directory where the workers write their metrics, summed by /metrics
+        whichever worker answers (a temporary directory by default).
+    BREAKDOWN_SESSIONS_PATH: SQLite file of the breakdown conversations, shared by the
+        workers (UPLOAD_DIR/breakdown_sessions.sqlite3 by default with several workers).
+"""
+# CORE
+from typing import Callable, Dict, Optional
+import argparse
+import gc
+import logging
+import math
+import os
+import signal
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+# THIRD PARTY
+import uvicorn
+
+# OWN
+from metrics_utils.tools import REGISTRY
+
+
+SERVER_GRACEFUL_TIMEOUT = float(os.environ.get("SERVER_GRACEFUL_TIMEOUT", 30))
+# Un worker qui meurt plus vite que ça au démarrage, plusieurs fois de suite, arrête le serveur
+MIN_WORKER_LIFETIME = 5.0
+MAX_FAST_FAILURES = 5
+
+
+def available_cpus() -> int:
+    """CPUs usable by this process: affinity, capped by the cgroup CPU quota (containers)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """The listening socket, created before forking and shared by every worker."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """
+    Forks and watches the uvicorn workers.
+
+    Args:
+        app: the ASGI application, already preloaded.
+        sock: the listening socket.
+        workers: number of worker processes.
+        on_worker_exit: called with the pid of every worker that exits (ex: release its jobs).
+    """
+
+    def __init__(self, app, sock: socket.socket, workers: int, log_level: str = "info",
+                 on_worker_exit: Optional[Callable[[int], None]] = None):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.on_worker_exit = on_worker_exit
+        self.children: Dict[int, int] = {}  # pid -> index du worker
+        self.started_at: Dict[int, float] = {}
+        self.stopping = False
+        self.fast_failures = 0
+
+    def spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            self.started_at[pid] = time.monotonic()
+            return
+
+        # Fils: les gestionnaires de signaux du superviseur ne s'appliquent pas, uvicorn installe les siens
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        status = 1
+        try:
+            # Les travaux interrompus sont rendus par le superviseur; chaque travail rendu est pris par un seul worker
+            self.app.state.requeue_jobs = False
+            self.app.state.resume_jobs = True
+            # Métriques propres au worker (voir metrics_utils.multiprocess), sans les comptes du superviseur
+            self.app.state.worker = str(index)
+            REGISTRY.reset()
+            config = uvicorn.Config(self.app, lifespan="on", log_level=self.log_level,
+                                    timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT)
+            uvicorn.Server(config).run(sockets=[self.sock])
+            status = 0
+        except BaseException:
+            logging.exception("Worker %d crashed", index)
+        finally:
+            os._exit(status)
+
+    def _handle_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            index = self.children.pop(pid, None)
+            lifetime = time.monotonic() - self.started_at.pop(pid, time.monotonic())
+            if index is not None and self.on_worker_exit is not None:
+                try:
+                    self.on_worker_exit(pid)
+                except Exception:
+                    logging.exception("Cleanup of worker pid %d failed", pid)
+            if index is None or self.stopping:
+                continue
+            logging.error("Worker %d (pid %d) exited with status %d after %.1fs, restarting",
+                          index, pid, os.waitstatus_to_exitcode(status), lifetime)
+            self.fast_failures = self.fast_failures + 1 if lifetime < MIN_WORKER_LIFETIME else 0
+            if self.fast_failures >= MAX_FAST_FAILURES:
+                logging.critical("Workers keep failing at startup, stopping the server")
+                self.stopping = True
+                return
+            self.spawn(index)
+
+    def stop_children(self) -> None:
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + SERVER_GRACEFUL_TIMEOUT + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            logging.warning("Worker pid %d did not stop in time, killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.children.clear()
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        for index in range(self.workers):
+            self.spawn(index)
+        logging.info("Started %d workers on %s (supervisor pid %d)", self.workers, self.sock.getsockname(), os.getpid())
+
+        failed = False
+        while not self.stopping:
+            self._reap()
+            failed = self.fast_failures >= MAX_FAST_FAILURES
+            time.sleep(0.2)
+
+        logging.info("Stopping %d workers", len(self.children))
+        self.stop_children()
+        self.sock.close()
+        return 1 if failed else 0
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the API with several preloaded worker processes.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 0)) or available_cpus())
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(process)d %(levelname)s %(message)s")
+
+    # Avant l'import de main: les workers y écrivent leurs métriques
+    metrics_dir = os.environ.get("METRICS_DIR")
+    created_metrics_dir = not metrics_dir
+    if created_metrics_dir:
+        metrics_dir = os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+    from metrics_utils.multiprocess import clear_snapshots
+
+    clear_snapshots(metrics_dir)
+    if args.workers > 1 and not os.environ.get("BREAKDOWN_SESSIONS_PATH"):
+        # Le tour suivant d'une conversation peut arriver sur un autre worker
+        from files_utils.uploads import UPLOAD_DIR
+
+        os.environ["BREAKDOWN_SESSIONS_PATH"] = os.path.join(UPLOAD_DIR, "breakdown_sessions.sqlite3")
+
+    # Import et chargement dans le superviseur: les workers héritent de l'état déjà compilé
+    import main as application
+
+    application.preload_state(application.app.state)
+    release_jobs = None
+    if "methode" in application.ENABLED_ROUTERS:
+        from methodes_utils.jobs import requeue_interrupted_jobs
+
+        requeued = requeue_interrupted_jobs()
+        if requeued:
+            logging.info("%d interrupted jobs queued again", requeued)
+
+        def release_jobs(pid: int) -> None:
+            # Travaux en file ou en cours dans un worker mort: repris par son remplaçant
+            released = requeue_interrupted_jobs(owner=pid)
+            if released:
+                logging.warning("%d jobs of worker pid %d queued again", released, pid)
+    sock = bind_socket(args.host, args.port)
+
+    # Les objets chargés ne sont plus parcourus par le ramasse-miettes: leurs pages restent partagées
+    gc.collect()
+    gc.freeze()
+    try:
+        return Supervisor(application.app, sock, args.workers, args.log_level, release_jobs).run()
+    finally:
+        if created_metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
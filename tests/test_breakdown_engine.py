@@ -0,0 +1,192 @@
+# CORE
+import asyncio
+
+# THIRD PARTY
+import pytest
+
+# OWN
+import breakdown_spec_utils.engine as engine
+from breakdown_spec_utils.engine import NOT_ADDRESSED, BreakdownEngine, decode_session, encode_session, load_graph
+from breakdown_spec_utils.sessions import SQLiteSessionStore
+
+PARCOURS_PATH = './data/breakdown_data/parcours.yml'
+PROMPTS_PATH = './data/breakdown_data/prompts/prompts_list.json'
+
+
+class StubModel:
+    """ask_model remplacé: réponse fixée par question, NOT_ADDRESSED pour les autres."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    async def __call__(self, node, answer, asked=()):
+        self.calls.append((node.id, answer, asked))
+        return self.answers.get((node.id, answer), NOT_ADDRESSED if asked else "True")
+
+
+@pytest.fixture
+def breakdown():
+    return BreakdownEngine(load_graph(PARCOURS_PATH, PROMPTS_PATH))
+
+
+def test_multi_problem_answer_only_settles_addressed_questions(breakdown, monkeypatch):
+    model = StubModel({("is_driving_car_when_event_occurs", "en roulant sur l autoroute"): "True"})
+    monkeypatch.setattr(engine, "ask_model", model)
+    conversation_id = asyncio.run(breakdown.start_all())["conversation_id"]
+
+    response = asyncio.run(breakdown.answer(conversation_id, "en roulant sur l autoroute"))
+
+    assert [step["question_id"] for step in response["resolved"]] == ["is_driving_car_when_event_occurs"]
+    pending = [question["id"] for question in response["questions"]]
+    assert "is_car_open_with_spare_key" in pending
+    # Sans mot-clef, toutes les questions posées sont données au modèle
+    assert len(model.calls) == 2 and all(asked for _, _, asked in model.calls)
+    assert breakdown.local_resolutions == 0
+
+
+def test_multi_problem_plain_yes_is_resolved_locally(breakdown, monkeypatch):
+    model = StubModel({})
+    monkeypatch.setattr(engine, "ask_model", model)
+    conversation_id = asyncio.run(breakdown.start_all())["conversation_id"]
+
+    response = asyncio.run(breakdown.answer(conversation_id, "oui"))
+
+    assert {step["question_id"]: step["resolved_by"] for step in response["resolved"]} == {
+        "is_driving_car_when_event_occurs": "local", "is_car_open_with_spare_key": "local"}
+    assert model.calls == []
+
+
+def test_opening_message_answers_the_first_question(breakdown, monkeypatch):
+    opening = "la voiture s est arretee en roulant"
+    model = StubModel({("is_driving_car_when_event_occurs", opening): "True"})
+    monkeypatch.setattr(engine, "ask_model", model)
+
+    response = asyncio.run(breakdown.start("suspicion_panne_moteur", opening=opening))
+
+    assert response["step"]["question_id"] == "is_driving_car_when_event_occurs"
+    assert response["step"]["resolved_by"] == "model"
+    assert response["question"]["id"] != "is_driving_car_when_event_occurs"
+    assert model.calls == [("is_driving_car_when_event_occurs", opening, ("La panne est-elle arrivée en roulant?",))]
+
+
+def test_opening_message_leaves_unaddressed_questions_pending(breakdown, monkeypatch):
+    # "non" dans la description ne répond à aucune question: pas de résolution par mots-clefs
+    opening = "non la voiture s est arretee en roulant"
+    model = StubModel({("is_driving_car_when_event_occurs", opening): "True"})
+    monkeypatch.setattr(engine, "ask_model", model)
+
+    async def run():
+        response = await breakdown.start_all(opening=opening)
+        assert await breakdown.has_session(response["conversation_id"])
+        return response
+
+    response = asyncio.run(run())
+
+    assert [step["question_id"] for step in response["resolved"]] == ["is_driving_car_when_event_occurs"]
+    assert "is_car_open_with_spare_key" in [question["id"] for question in response["questions"]]
+    assert breakdown.local_resolutions == 0
+    single = asyncio.run(breakdown.start("suspicion_panne_clef", opening=opening))
+    assert single["question"]["id"] == "is_car_open_with_spare_key" and "step" not in single
+
+
+def test_single_pending_question_is_resolved_locally(breakdown, monkeypatch):
+    model = StubModel({})
+    monkeypatch.setattr(engine, "ask_model", model)
+    conversation_id = asyncio.run(breakdown.start("suspicion_panne_moteur"))["conversation_id"]
+
+    response = asyncio.run(breakdown.answer(conversation_id, "oui"))
+
+    assert response["step"]["answer"] == "yes"
+    assert response["step"]["resolved_by"] == "local"
+    assert model.calls == []
+
+
+def test_parse_model_label_not_addressed(breakdown):
+    node = breakdown.graphs["suspicion_panne_clef"].nodes["is_car_open_with_spare_key"]
+    assert engine.parse_model_label(node, NOT_ADDRESSED) is None
+    assert engine.parse_model_label(node, "True") == "yes"
+    assert engine.parse_model_label(node, "False") == "no"
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("oui", True),
+    ("Oui, tout à fait", True),
+    ("si", True),
+    ("non", False),
+    ("Non merci", False),
+    ("pas du tout", False),
+    ("absolument pas", False),
+    ("certainement pas", False),
+    ("je ne sais pas", None),
+    ("j'en sais rien", None),
+    ("pas sûr", None),
+    ("aucune idée", None),
+    ("peut-être", None),
+    ("oui peut-être", None),
+    ("non je sais pas", None),
+    ("non, j en sais rien", None),
+    ("pas tout à fait", None),
+    ("il n'y a rien", None),
+    ("jamais", None),
+    ("la voiture fait un bruit bizarre", None),
+])
+def test_match_yes_no(answer, expected):
+    assert engine.match_yes_no(answer) is expected
+
+
+def test_uncertain_answer_is_sent_to_the_model(breakdown, monkeypatch):
+    model = StubModel({("is_driving_car_when_event_occurs", "je ne sais pas"): "False"})
+    monkeypatch.setattr(engine, "ask_model", model)
+    conversation_id = asyncio.run(breakdown.start("suspicion_panne_moteur"))["conversation_id"]
+
+    response = asyncio.run(breakdown.answer(conversation_id, "je ne sais pas"))
+
+    assert response["step"]["resolved_by"] == "model"
+    assert len(model.calls) == 1
+
+
+def test_conversation_continues_on_another_worker(tmp_path, monkeypatch):
+    model = StubModel({("is_driving_car_when_event_occurs", "en roulant"): "True"})
+    monkeypatch.setattr(engine, "ask_model", model)
+    graphs = load_graph(PARCOURS_PATH, PROMPTS_PATH)
+    path = str(tmp_path / "sessions.sqlite3")
+    # Deux workers: chacun son moteur, le même fichier de conversations
+    first, second = (BreakdownEngine(graphs, sessions=SQLiteSessionStore(path, 100, 60)) for _ in range(2))
+
+    async def run():
+        conversation_id = (await first.start_all())["conversation_id"]
+        response = await second.answer(conversation_id, "en roulant")
+        assert response["resolved"]
+        response = await first.answer(conversation_id, "non, j ai perdu la clef")
+        return conversation_id, response
+
+    conversation_id, response = asyncio.run(run())
+    assert "is_car_open_with_spare_key" in [step["question_id"] for step in response["resolved"]]
+    assert len(first.sessions) == (0 if response["done"] else 1)
+
+
+def test_expired_conversation_is_unknown(tmp_path):
+    breakdown = BreakdownEngine(load_graph(PARCOURS_PATH, PROMPTS_PATH),
+                                sessions=SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), 100, 0.05))
+
+    async def run():
+        conversation_id = (await breakdown.start("suspicion_panne_moteur"))["conversation_id"]
+        assert await breakdown.has_session(conversation_id)
+        await asyncio.sleep(0.1)
+        return await breakdown.has_session(conversation_id)
+
+    assert not asyncio.run(run())
+
+
+def test_session_encoding_round_trip(breakdown, monkeypatch):
+    monkeypatch.setattr(engine, "ask_model", StubModel({("is_driving_car_when_event_occurs", "oui, en roulant"): "True"}))
+
+    async def run():
+        conversation_id = (await breakdown.start_all())["conversation_id"]
+        await breakdown.answer(conversation_id, "oui, en roulant")
+        return decode_session(await breakdown.sessions.get(conversation_id))
+
+    session = asyncio.run(run())
+    assert decode_session(encode_session(session)) == session
+    assert any(candidate.steps for candidate in session.candidates)
@@ -0,0 +1,204 @@
+# CORE
+from types import SimpleNamespace
+import asyncio
+import json
+import os
+
+# THIRD PARTY
+from fastapi import FastAPI
+import pytest
+
+# OWN
+import ceh_utils.batch as batch
+from ceh_utils.batch import BatchEvaluator
+from routers.ceh import router as ceh_router
+from ceh_utils.engine import compile_rules
+from files_utils.tools import load_rules_from_yaml
+from tests.test_ceh_engine import PAYLOAD_PATH, RULES_PATH, TODAY
+
+
+def _crash(items):
+    os._exit(1)
+
+
+async def _body(payloads):
+    for payload in payloads:
+        yield json.dumps(payload).encode() + b"\n"
+
+
+def _stream(evaluator, rule_set, payloads):
+    async def run():
+        return [json.loads(line) for lines in [lines async for lines in evaluator.stream(_body(payloads), rule_set, "v1")]
+                for line in lines.splitlines()]
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(scope="module")
+def rule_set():
+    return compile_rules(load_rules_from_yaml(RULES_PATH), current_date=TODAY)
+
+
+def _payloads(count):
+    with open(PAYLOAD_PATH) as f:
+        base = json.load(f)
+    return [dict(base, id=f"doc-{n}") for n in range(count)]
+
+
+async def _chunked(body, size=97):
+    for start in range(0, len(body), size):
+        await asyncio.sleep(0)
+        yield body[start:start + size]
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+@pytest.mark.parametrize("array", [False, True])
+def test_results_keep_the_input_order(rule_set, workers, array):
+    payloads = _payloads(25)
+    body = json.dumps(payloads).encode() if array else b"\n".join(json.dumps(p).encode() for p in payloads) + b"\n"
+    evaluator = BatchEvaluator(workers=workers, chunk_size=4)
+
+    async def run():
+        return [json.loads(line) async for lines in evaluator.stream(_chunked(body), rule_set, "v1")
+                for line in lines.splitlines()]
+
+    try:
+        lines = asyncio.run(run())
+    finally:
+        evaluator.shutdown()
+    assert [line["index"] for line in lines] == list(range(25))
+    assert [line["id"] for line in lines] == [payload["id"] for payload in payloads]
+    assert all("result" in line for line in lines)
+
+
+@pytest.mark.parametrize("array", [False, True])
+def test_body_larger_than_the_buffer_limit_yields_an_error_line(rule_set, array):
+    payloads = _payloads(10)
+    body = json.dumps(payloads).encode() if array else b"\n".join(json.dumps(p).encode() for p in payloads) + b"\n"
+    evaluator = BatchEvaluator(chunk_size=4, max_buffer=2 * len(json.dumps(payloads[0])))
+
+    async def run():
+        return [json.loads(line) async for lines in evaluator.stream(_chunked(body), rule_set, "v1")
+                for line in lines.splitlines()]
+
+    lines = asyncio.run(run())
+    if array:
+        assert len(lines) == 1 and "JSON array body larger than" in lines[0]["error"]
+    else:
+        # Chaque ligne NDJSON tient dans la limite: le lot entier est évalué
+        assert [line["index"] for line in lines] == list(range(10))
+
+
+def _batch_app(rule_set, evaluator):
+    app = FastAPI()
+    app.include_router(ceh_router)
+    app.state.rules_registry = SimpleNamespace(current=SimpleNamespace(rule_set=rule_set, version="v1"))
+    app.state.batch_evaluator = evaluator
+    app.state.weather = None
+    return app
+
+
+def _post_batch(app, chunks, disconnect_after=None):
+    """POST /ceh/batch over ASGI: the last body chunk is only sent once a result came back."""
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": "/ceh/batch", "raw_path": b"/ceh/batch", "root_path": "",
+             "query_string": b"", "headers": [(b"content-type", b"application/x-ndjson")],
+             "client": ("test", 1), "server": ("test", 80)}
+    sent = []
+
+    async def run():
+        result_sent = asyncio.Event()
+        pending = list(chunks)
+
+        async def receive():
+            if disconnect_after is not None and len(pending) == len(chunks) - disconnect_after:
+                return {"type": "http.disconnect"}
+            if len(pending) == 1:
+                await result_sent.wait()
+            if not pending:
+                await asyncio.Event().wait()
+            chunk = pending.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+
+        async def send(message):
+            sent.append(message)
+            if message.get("body"):
+                result_sent.set()
+
+        await asyncio.wait_for(app(scope, receive, send), timeout=10)
+
+    asyncio.run(run())
+    return sent
+
+
+def test_batch_results_are_sent_while_the_body_is_received(rule_set):
+    payloads = _payloads(6)
+    app = _batch_app(rule_set, BatchEvaluator(chunk_size=2))
+
+    sent = _post_batch(app, [json.dumps(payload).encode() + b"\n" for payload in payloads])
+    assert sent[0]["status"] == 200
+    lines = b"".join(message.get("body", b"") for message in sent[1:]).splitlines()
+    assert [json.loads(line)["index"] for line in lines] == list(range(6))
+
+
+def test_batch_client_disconnect_during_the_upload_ends_the_response(rule_set):
+    payloads = _payloads(6)
+    app = _batch_app(rule_set, BatchEvaluator(chunk_size=2))
+
+    sent = _post_batch(app, [json.dumps(payload).encode() + b"\n" for payload in payloads], disconnect_after=3)
+    # Seul le premier lot de chunk_size documents, reçu avant la déconnexion, est évalué
+    lines = b"".join(message.get("body", b"") for message in sent[1:]).splitlines()
+    assert [json.loads(line)["index"] for line in lines] == [0, 1]
+
+
+def test_version_change_keeps_the_old_pool_until_its_streams_end(rule_set):
+    payloads = _payloads(12)
+    evaluator = BatchEvaluator(workers=1, chunk_size=2)
+    resume = None
+
+    async def slow_body():
+        for number, payload in enumerate(payloads):
+            if number == 6:
+                await resume.wait()
+            yield json.dumps(payload).encode() + b"\n"
+
+    async def run():
+        nonlocal resume
+        resume = asyncio.Event()
+        old_stream = evaluator.stream(slow_body(), rule_set, "v1")
+        old_lines = [await old_stream.__anext__()]
+        old_pool = evaluator._pool
+
+        # Rechargement des règles pendant le flux: un autre lot démarre sur la nouvelle version
+        new_lines = [lines async for lines in evaluator.stream(_body(payloads[:3]), rule_set, "v2")]
+        assert evaluator._pool is not old_pool and old_pool.retired and old_pool in evaluator._pools
+
+        resume.set()
+        old_lines += [lines async for lines in old_stream]
+        assert old_pool not in evaluator._pools
+        return "".join(old_lines).splitlines(), "".join(new_lines).splitlines()
+
+    try:
+        old_lines, new_lines = asyncio.run(run())
+    finally:
+        evaluator.shutdown()
+    assert [json.loads(line)["index"] for line in old_lines] == list(range(12))
+    assert [json.loads(line)["index"] for line in new_lines] == [0, 1, 2]
+    assert not any("error" in line for line in old_lines + new_lines)
+
+
+def test_broken_pool_yields_an_error_line_and_is_recreated(rule_set, monkeypatch):
+    payloads = _payloads(4)
+    evaluator = BatchEvaluator(workers=1, chunk_size=2)
+    try:
+        monkeypatch.setattr(batch, "_evaluate_chunk_in_worker", _crash)
+        lines = _stream(evaluator, rule_set, payloads)
+        assert "Batch worker crashed" in lines[-1]["error"]
+        assert evaluator._pool is None
+
+        monkeypatch.undo()
+        lines = _stream(evaluator, rule_set, payloads)
+        assert [line["index"] for line in lines] == [0, 1, 2, 3]
+        assert all("result" in line for line in lines)
+    finally:
+        evaluator.shutdown()
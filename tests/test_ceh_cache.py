@@ -0,0 +1,103 @@
+# CORE
+from datetime import date
+import copy
+import json
+
+# THIRD PARTY
+import pytest
+
+# OWN
+from ceh_utils.cache import DecisionCache, fingerprint
+from ceh_utils.engine import compile_rules
+from files_utils.tools import load_rules_from_yaml
+from tests.test_ceh_engine import PAYLOAD_PATH, RULES_PATH, TODAY, generate_payloads
+
+# Les règles livrées expirent le 2024-06-01
+EXPIRED = date(2024, 7, 1)
+
+
+class CountingRuleSet:
+    """Règles compilées dont les évaluations complètes sont comptées."""
+
+    def __init__(self, rules):
+        self.rule_set = compile_rules(copy.deepcopy(rules), current_date=TODAY)
+        self.matches = 0
+
+    def __getattr__(self, name):
+        return getattr(self.rule_set, name)
+
+    def match(self, *args, **kwargs):
+        self.matches += 1
+        return self.rule_set.match(*args, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def rules():
+    return load_rules_from_yaml(RULES_PATH)
+
+
+@pytest.fixture
+def payload():
+    with open(PAYLOAD_PATH) as f:
+        return json.load(f)
+
+
+def test_cached_decisions_equal_direct_evaluation(rules):
+    cache = DecisionCache(maxsize=1024)
+    rule_set = CountingRuleSet(rules)
+    payloads = list(generate_payloads(300, seed=1))
+    for ceh_data in payloads + payloads:
+        assert cache.evaluate(rule_set, "v1", ceh_data, TODAY) == rule_set.rule_set.evaluate(ceh_data, TODAY)
+    assert rule_set.matches < len(payloads) * 2
+    assert cache.stats()["hits"] > 0
+
+
+def test_fields_not_read_by_the_rules_hit_the_cache(rules, payload):
+    cache = DecisionCache(maxsize=8)
+    rule_set = CountingRuleSet(rules)
+    cache.evaluate(rule_set, "v1", payload, TODAY)
+    payload["version"] = "autre"
+    payload["lastChangeDate"] = "2024-01-02T00:00:00"
+    cache.evaluate(rule_set, "v1", payload, TODAY)
+    assert rule_set.matches == 1
+
+
+def test_rules_version_change_invalidates_the_key(rules, payload):
+    cache = DecisionCache(maxsize=8)
+    first = CountingRuleSet(rules)
+    selected = cache.evaluate(first, "v1", payload, TODAY)
+    assert selected is not None
+
+    # Nouvelle version sans la règle retenue: la décision de v1 n'est pas resservie
+    reloaded = CountingRuleSet([rule for rule in rules if rule["conditions"]["code"] != selected[5]])
+    assert cache.evaluate(reloaded, "v2", payload, TODAY) == reloaded.rule_set.evaluate(payload, TODAY)
+    assert cache.evaluate(reloaded, "v2", payload, TODAY) != selected
+    assert reloaded.matches == 1
+
+
+def test_date_change_invalidates_the_key(rules, payload):
+    cache = DecisionCache(maxsize=8)
+    rule_set = CountingRuleSet(rules)
+    assert cache.evaluate(rule_set, "v1", payload, TODAY) is not None
+    # Le lendemain de l'expiration, plus aucune règle n'est valide
+    assert cache.evaluate(rule_set, "v1", payload, EXPIRED) is None
+    assert rule_set.matches == 2
+
+
+def test_unhashable_values_are_fingerprinted():
+    values = ("a", [1, {"b": 2}], {"c": [3]}, None)
+    key = fingerprint(values)
+    assert hash(key) == hash(fingerprint(("a", [1, {"b": 2}], {"c": [3]}, None)))
+    assert fingerprint(("a", [1, {"b": 3}], {"c": [3]}, None)) != key
+    # Une liste et la chaîne de son JSON ne se confondent pas
+    assert fingerprint(("[1]",)) != fingerprint(([1],))
+    assert fingerprint(("a", 1)) == ("a", 1)
+
+
+def test_disabled_cache_always_evaluates(rules, payload):
+    cache = DecisionCache(maxsize=0)
+    rule_set = CountingRuleSet(rules)
+    for _ in range(3):
+        cache.evaluate(rule_set, "v1", payload, TODAY)
+    assert rule_set.evaluate(payload, TODAY) is not None
+    assert cache.stats()["size"] == 0
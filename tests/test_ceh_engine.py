@@ -0,0 +1,136 @@
+# CORE
+from datetime import date
+import copy
+import json
+import random
+
+# THIRD PARTY
+import pytest
+
+# OWN
+import ceh_utils.tools as tools
+from ceh_utils.engine import compile_rules
+from ceh_utils.tools import apply_rules, select_highest_priority_rule
+from ceh_utils.vectorized import flatten_payloads, match_frame
+from data.rules_data.path_transcoding import path_transcoding
+from files_utils.tools import load_rules_from_yaml
+
+RULES_PATH = './data/rules_data/rules.yaml'
+PAYLOAD_PATH = './tests/cas_de_test/test_01.json'
+# Les règles livrées expirent le 2024-06-01
+TODAY = date(2024, 1, 1)
+
+# Valeurs tirées pour chaque chemin lu par les règles: attendues, autres, absentes, d'autres types
+VALUES = {
+    "à la maison": [True, False, None, "true"],
+    "autoroute": [True, False, None, 1, 0],
+    "type d'incident véhicule": ["panne", "accident", None, ""],
+    "assureur": ["MC", "MAIF", None],
+    "benef insultant": [True, False, None],
+    "ville": ["Lille", "Paris", "lille", None],
+    "type de demande": ["Claim", "RoadSideAssistance", None],
+    "is abuser": [True, False, None],
+    "intent": ["assistance_habitation", "assistance_deces", "autre", None],
+}
+MISSING = object()
+
+
+class FakeDate(date):
+    @classmethod
+    def today(cls):
+        return TODAY
+
+
+def set_path(payload, path, value):
+    """Écrit `value` au chemin (clefs et indices), ou supprime la clef pour MISSING."""
+    parts = [int(part) if part.isdecimal() else part for part in path.replace("]", "").replace("[", ".").split(".")]
+    node = payload
+    for part in parts[:-1]:
+        if isinstance(part, int):
+            node = node[part]
+        else:
+            node = node.setdefault(part, {})
+    if value is MISSING:
+        node.pop(parts[-1], None)
+    else:
+        node[parts[-1]] = value
+
+
+def generate_payloads(count, seed=0):
+    randomizer = random.Random(seed)
+    with open(PAYLOAD_PATH) as f:
+        base = json.load(f)
+    for _ in range(count):
+        payload = copy.deepcopy(base)
+        for name, values in VALUES.items():
+            set_path(payload, path_transcoding[name], randomizer.choice(values + [MISSING]))
+        # "temps d'attente" n'a pas de transcodage: le chemin est lu tel quel, à la racine
+        waiting = randomizer.choice([0, 5, 9.5, 10, 42, None, "12", MISSING])
+        if waiting is not MISSING:
+            payload["temps d'attente"] = waiting
+        yield payload
+
+
+@pytest.fixture
+def legacy_today(monkeypatch):
+    monkeypatch.setattr(tools, "date", FakeDate)
+
+
+def test_rule_set_matches_apply_rules_on_shipped_rules(legacy_today):
+    rules = load_rules_from_yaml(RULES_PATH)
+    rule_set = compile_rules(copy.deepcopy(rules), current_date=TODAY)
+    selected = 0
+    for payload in generate_payloads(900):
+        expected = apply_rules(payload, copy.deepcopy(rules))
+        assert rule_set.match(payload, TODAY) == expected
+        assert rule_set.evaluate(payload, TODAY) == select_highest_priority_rule(expected)
+        selected += bool(expected)
+    # Les tirages couvrent des documents avec et sans règle retenue
+    assert 0 < selected < 900
+
+
+def random_rules(randomizer, count):
+    paths = ["a.b", "a.c", "d[0].e", "d[1].e", "f"]
+    rules = []
+    for number in range(count):
+        members = {}
+        for member in range(randomizer.randint(0, 3)):
+            value = randomizer.choice([1, 2, 3, True, False, None, "x", "y",
+                                       "> 2", ">= 2", "< 2", "<= 1", "= 3", "< 1 or > 2"])
+            members[f"m{member}"] = {"path": randomizer.choice(paths), "value": value}
+        rules.append({"conditions": {
+            "condition_members": members, "message": f"message {number}", "name": f"rule {number}",
+            "priority": randomizer.randint(1, 3), "created_at": date(2023, 1, randomizer.randint(1, 28)),
+            "validity": randomizer.choice([None, date(2023, 12, 31), date(2030, 1, 1)]), "code": f"R{number}",
+        }})
+    return rules
+
+
+def random_payload(randomizer):
+    value = lambda: randomizer.choice([0, 1, 2, 2.5, 3, 4, True, False, None, "x", "y", [1], {"k": 1}])
+    payload = {"a": {"b": value(), "c": value()}, "d": [{"e": value()} for _ in range(randomizer.randint(0, 2))]}
+    if randomizer.random() < 0.7:
+        payload["f"] = value()
+    return payload
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rule_set_matches_apply_rules_on_random_rules(seed, legacy_today):
+    randomizer = random.Random(seed)
+    rules = random_rules(randomizer, 40)
+    rule_set = compile_rules(copy.deepcopy(rules), current_date=TODAY)
+    for _ in range(200):
+        payload = random_payload(randomizer)
+        expected = apply_rules(payload, copy.deepcopy(rules))
+        assert rule_set.match(payload, TODAY) == expected, payload
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_vectorized_masks_match_the_rule_set(seed):
+    randomizer = random.Random(seed)
+    rule_set = compile_rules(random_rules(randomizer, 40), current_date=TODAY)
+    payloads = [random_payload(randomizer) for _ in range(200)]
+    frame = match_frame(flatten_payloads(payloads, rule_set), rule_set, TODAY)
+    for row, payload in enumerate(payloads):
+        expected = {matched[5] for matched in rule_set.match(payload, TODAY)}
+        assert set(frame.columns[frame.iloc[row].to_numpy()]) == expected, payload
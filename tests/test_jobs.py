@@ -0,0 +1,113 @@
+# CORE
+import asyncio
+
+# THIRD PARTY
+import pytest
+
+# OWN
+from methodes_utils.jobs import DONE, QUEUED, RUNNING, JobQueue, QueueFull, requeue_interrupted_jobs
+
+DEAD_WORKER_PID = 999999
+
+
+async def _wait_until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await condition():
+        assert asyncio.get_running_loop().time() < deadline, "timeout"
+        await asyncio.sleep(0.01)
+
+
+async def _has_status(queue, job_ids, status):
+    return all([(await queue.get(job_id))["status"] == status for job_id in job_ids])
+
+
+def _queue(path, handler, workers=1):
+    queue = JobQueue(str(path), workers=workers)
+    queue.register("echo", handler)
+    return queue
+
+
+def test_jobs_of_a_dead_worker_are_resumed_by_its_replacement(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+
+    async def run():
+        async def blocked(payload):
+            await asyncio.Event().wait()
+
+        # Worker qui meurt avec un travail en cours et deux en file (tâches annulées, rien de rendu)
+        dead = _queue(path, blocked)
+        dead.owner = DEAD_WORKER_PID
+        await dead.start(requeue_running=False, resume_queued=False)
+        job_ids = [await dead.submit("echo", {"n": n}) for n in range(3)]
+        await _wait_until(lambda: _has_status(dead, job_ids[:1], RUNNING))
+        for task in dead._tasks:
+            task.cancel()
+        await asyncio.gather(*dead._tasks, return_exceptions=True)
+        assert [(await dead.get(job_id))["status"] for job_id in job_ids] == [RUNNING, QUEUED, QUEUED]
+
+        assert requeue_interrupted_jobs(str(path), owner=DEAD_WORKER_PID) == 3
+
+        async def echo(payload):
+            return payload
+
+        replacement = _queue(path, echo)
+        await replacement.start(requeue_running=False, resume_queued=True)
+        await _wait_until(lambda: _has_status(replacement, job_ids, DONE))
+        assert [(await replacement.get(job_id))["result"] for job_id in job_ids] == [{"n": 0}, {"n": 1}, {"n": 2}]
+        await replacement.stop()
+
+    asyncio.run(run())
+
+
+def test_released_jobs_are_taken_by_one_worker_only(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+
+    async def run():
+        calls = []
+
+        async def record(payload):
+            calls.append(payload["n"])
+            return payload
+
+        submitter = _queue(path, record)
+        for n in range(20):
+            await submitter.submit("echo", {"n": n})
+        await submitter.stop()  # Sans worker démarré: les travaux sont rendus
+
+        workers = [_queue(path, record, workers=2) for _ in range(3)]
+        for queue in workers:
+            queue.owner = id(queue)
+        await asyncio.gather(*(queue.start(requeue_running=False) for queue in workers))
+        await _wait_until(lambda: asyncio.sleep(0, len(calls) >= 20))
+        await asyncio.sleep(0.05)
+        assert sorted(calls) == list(range(20))
+        for queue in workers:
+            await queue.stop()
+
+    asyncio.run(run())
+
+
+def test_pending_limit_and_depth_are_shared_by_the_workers(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+
+    async def run():
+        async def blocked(payload):
+            await asyncio.Event().wait()
+
+        # Deux workers sur la même base, sans tâches démarrées: les travaux restent en file
+        workers = [_queue(path, blocked) for _ in range(2)]
+        for queue, owner in zip(workers, (1, 2)):
+            queue.owner, queue.max_pending = owner, 3
+        await workers[0].submit("echo", {})
+        await workers[1].submit("echo", {})
+        await workers[0].submit("echo", {})
+        # La limite compte les travaux de tous les workers
+        with pytest.raises(QueueFull):
+            await workers[1].submit("echo", {})
+        assert [(await queue.stats())["queued"] for queue in workers] == [3, 3]
+        assert (await workers[0].stats())["running"] == 0
+        assert workers[1].snapshot()["queued"] == 3
+        for queue in workers:
+            await queue.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,78 @@
+# CORE
+import asyncio
+from types import SimpleNamespace
+
+# THIRD PARTY
+import httpx
+import openai
+import pytest
+
+# OWN
+import llm_utils.client as client
+from llm_utils.client import LLMClient
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/files")
+
+
+def _timeout():
+    return openai.APITimeoutError(request=REQUEST)
+
+
+def _rate_limit():
+    return openai.RateLimitError("rate limited", response=httpx.Response(429, request=REQUEST), body=None)
+
+
+class Flaky:
+    """Lève les erreurs données puis renvoie un résultat."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(status="completed")
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    monkeypatch.setattr(client, "OPENAI_BACKOFF_BASE", 0)
+    return LLMClient(api_key="test", max_concurrency=1)
+
+
+def test_idempotent_call_is_retried_after_a_timeout(llm):
+    function = Flaky(_timeout())
+    asyncio.run(llm.call(function))
+    assert function.calls == 2
+
+
+def test_creation_is_not_retried_after_a_timeout(llm):
+    function = Flaky(_timeout())
+    with pytest.raises(openai.APITimeoutError):
+        asyncio.run(llm.call(function, idempotent=False))
+    assert function.calls == 1
+
+
+def test_creation_is_retried_after_a_rate_limit(llm):
+    function = Flaky(_rate_limit())
+    asyncio.run(llm.call(function, idempotent=False))
+    assert function.calls == 2
+
+
+def test_poll_releases_the_concurrency_slot_between_reads(llm):
+    statuses = iter(["queued", "in_progress", "completed"])
+
+    async def retrieve(run_id, thread_id):
+        return SimpleNamespace(id=run_id, status=next(statuses))
+
+    async def run():
+        other = Flaky()
+        poll = asyncio.create_task(llm.poll(retrieve, ("queued", "in_progress"), "run_1", thread_id="t", interval=0.05))
+        await asyncio.sleep(0.01)
+        # Un seul emplacement: l'autre appel passe pendant l'attente entre deux lectures
+        await asyncio.wait_for(llm.call(other), 0.04)
+        return await poll
+
+    assert asyncio.run(run()).status == "completed"
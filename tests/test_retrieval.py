@@ -0,0 +1,93 @@
+# CORE
+import asyncio
+
+# THIRD PARTY
+import pytest
+
+# OWN
+import methodes_utils.retrieval as retrieval
+from methodes_utils.retrieval import LocalIndex, LocalRetriever, build_index, chunk_pages, tokenize
+
+PAGES = [
+    "Article 1. Le contrat couvre le remorquage du vehicule en cas de panne sur la voie publique.",
+    "Article 2. Les frais d hebergement sont pris en charge dans la limite de trois nuits.",
+    "Article 3. Le vol du vehicule doit etre declare a l assureur sous deux jours ouvres.",
+]
+
+
+def write_pdf(path, pages):
+    """PDF minimal, une ligne de texte (Helvetica) par page, lisible par pypdf."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in pages:
+        stream = f"BT /F1 10 Tf 20 800 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    content, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(content))
+        content += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(content)
+    content += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    content += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    content += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(content)
+    return str(path)
+
+
+@pytest.fixture
+def contract(tmp_path):
+    return write_pdf(tmp_path / "contrat.pdf", PAGES)
+
+
+def test_tokenize_drops_accents_and_stopwords():
+    assert tokenize("Le véhicule est-il assuré ?") == ["vehicule", "assure"]
+
+
+def test_chunk_pages_overlap():
+    chunks = chunk_pages(["abcdefghijklmnopqrstuvwxy"], size=10, overlap=4)
+    assert [chunk["text"] for chunk in chunks] == ["abcdefghij", "ghijklmnop", "mnopqrstuv", "stuvwxy"]
+    assert {chunk["page"] for chunk in chunks} == {1}
+
+
+def test_bm25_ranks_the_matching_page_first(contract, tmp_path):
+    directory = str(tmp_path / "index" / "hash")
+    build_index(contract, directory)
+    index = LocalIndex(directory)
+
+    assert index.search("remorquage en cas de panne")[0].page == 1
+    assert index.search("combien de nuits d hebergement")[0].page == 2
+    passages = index.search("declarer le vol du vehicule")
+    assert passages[0].page == 3
+    # "vehicule" est aussi en page 1, avec un score moindre
+    assert [passage.page for passage in passages] == [3, 1]
+    assert passages[0].score > passages[1].score
+    assert index.search("piscine") == []
+
+
+def test_stub_answer_works_offline(contract, tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval, "METHODE_LOCAL_LLM", "stub")
+
+    async def no_model(*args, **kwargs):
+        raise AssertionError("the model must not be called")
+
+    monkeypatch.setattr(retrieval, "openai_complete", no_model)
+    retriever = LocalRetriever(index_dir=str(tmp_path / "index"))
+
+    result = asyncio.run(retriever.answer("Que couvre le remorquage ?", contract, "hash", k=1))
+
+    assert result["sources"] == [1]
+    assert "[page 1] Article 1." in result["answer"]
+    assert "Question: Que couvre le remorquage ?" in result["answer"]
+
+    async def stream():
+        return [event async for event in retriever.stream_answer("hebergement", contract, "hash", k=1)]
+
+    events = asyncio.run(stream())
+    assert events[-1][0] == "result" and events[-1][1]["sources"] == [2]
+    assert retriever.stats()["hits"] == 1
@@ -0,0 +1,109 @@
+# CORE
+from types import SimpleNamespace
+
+# THIRD PARTY
+import pytest
+
+# OWN
+import rh_utils.cache as cache
+from rh_utils.cache import EvaluationCache, MemoryBackend, SQLiteBackend, normalize_answer, question_scope
+
+SCOPE = question_scope("survey", 1, "Quel est le délai de préavis ?", "Un mois")
+OTHER_SCOPE = question_scope("survey", 2, "Quel est le délai de préavis ?", "Un mois")
+TTL = 60.0
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=clock))
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path, clock):
+    if request.param == "memory":
+        backend = MemoryBackend(maxsize=3, ttl=TTL)
+        backend._entries.clock = clock
+        yield backend
+    else:
+        backend = SQLiteBackend(str(tmp_path / "rh" / "cache.sqlite3"), maxsize=3, ttl=TTL)
+        yield backend
+        backend.close()
+
+
+def test_normalize_answer():
+    assert normalize_answer("  Un MOIS, à compter de l'envoi !") == "un mois a compter de l envoi"
+    assert normalize_answer(None) == ""
+
+
+def test_question_change_changes_the_scope():
+    assert question_scope("survey", "1", "Q", "R") == question_scope("survey", 1, "Q", "R")
+    assert question_scope("survey", 1, "Q", "R") != question_scope("survey", 1, "Q", "R modifiée")
+
+
+def test_exact_hit_after_normalization(backend):
+    evaluation_cache = EvaluationCache(backend)
+    evaluation_cache.set(SCOPE, "Un mois.", "Correct")
+
+    assert evaluation_cache.get(SCOPE, "  un MOIS ") == "Correct"
+    assert evaluation_cache.get(OTHER_SCOPE, "un mois") is None
+    assert evaluation_cache.get(SCOPE, "deux mois") is None
+    assert evaluation_cache.stats() == {"size": 1, "exact_hits": 1, "similar_hits": 0, "misses": 2, "hit_ratio": 1 / 3}
+
+
+def test_similar_hit_takes_the_closest_answer(backend):
+    evaluation_cache = EvaluationCache(backend, similarity=0.8)
+    evaluation_cache.set(SCOPE, "le preavis est d un mois", "Correct")
+    evaluation_cache.set(SCOPE, "le preavis est de trois mois", "Faux")
+
+    assert evaluation_cache.get(SCOPE, "le preavis est d'un mois exactement") == "Correct"
+    assert evaluation_cache.get(SCOPE, "le préavis est de trois mois pleins") == "Faux"
+    assert evaluation_cache.get(SCOPE, "aucune idee") is None
+    assert evaluation_cache.get(OTHER_SCOPE, "le preavis est d un mois") is None
+    assert (evaluation_cache.similar_hits, evaluation_cache.misses) == (2, 2)
+
+
+def test_evaluations_expire_after_the_ttl(backend, clock):
+    evaluation_cache = EvaluationCache(backend, similarity=0.5)
+    evaluation_cache.set(SCOPE, "un mois", "Correct")
+    clock.now += TTL - 1
+    assert evaluation_cache.get(SCOPE, "un mois") == "Correct"
+
+    clock.now += 2
+    assert evaluation_cache.get(SCOPE, "un mois") is None
+    assert evaluation_cache.get(SCOPE, "un mois environ") is None
+
+
+def test_least_recently_used_evaluation_is_evicted(backend, clock):
+    evaluation_cache = EvaluationCache(backend)
+    for number, answer in enumerate(["un", "deux", "trois"]):
+        clock.now += 1
+        evaluation_cache.set(SCOPE, answer, f"evaluation {number}")
+    clock.now += 1
+    assert evaluation_cache.get(SCOPE, "un") == "evaluation 0"
+
+    clock.now += 1
+    evaluation_cache.set(SCOPE, "quatre", "evaluation 3")
+    assert len(backend) == 3
+    assert evaluation_cache.get(SCOPE, "deux") is None
+    assert evaluation_cache.get(SCOPE, "un") == "evaluation 0"
+
+
+def test_sqlite_evaluations_survive_a_restart(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    backend = SQLiteBackend(path, ttl=TTL)
+    EvaluationCache(backend).set(SCOPE, "Un mois", "Correct")
+    backend.close()
+
+    backend = SQLiteBackend(path, ttl=TTL)
+    assert EvaluationCache(backend).get(SCOPE, "un mois") == "Correct"
+    backend.close()
@@ -0,0 +1,122 @@
+# CORE
+import asyncio
+
+# THIRD PARTY
+import pytest
+
+# OWN
+from cache_utils.singleflight import SingleFlight
+
+
+class Call:
+    """Appel bloqué jusqu'à `release`, qui compte ses exécutions et ses annulations."""
+
+    def __init__(self, result="result", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        self.started.set()
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_calls_are_coalesced():
+    async def run():
+        flight, call = SingleFlight("test"), Call()
+        waiters = [asyncio.create_task(flight.do("key", call)) for _ in range(5)]
+        await call.started.wait()
+        call.release.set()
+        assert await asyncio.gather(*waiters) == ["result"] * 5
+        assert call.calls == 1
+        assert flight.stats() == {"in_flight": 0, "executed": 1, "shared": 4}
+
+        # Rien n'est gardé une fois l'appel terminé
+        call.release.set()
+        assert await flight.do("key", call) == "result"
+        assert call.calls == 2
+
+    asyncio.run(run())
+
+
+def test_distinct_keys_are_not_coalesced():
+    async def run():
+        flight, call = SingleFlight("test"), Call()
+        call.release.set()
+        await asyncio.gather(flight.do("a", call), flight.do("b", call))
+        assert call.calls == 2
+
+    asyncio.run(run())
+
+
+def test_error_is_shared_by_every_caller():
+    async def run():
+        flight, call = SingleFlight("test"), Call(error=ValueError("boom"))
+        waiters = [asyncio.create_task(flight.do("key", call)) for _ in range(3)]
+        await call.started.wait()
+        call.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert [type(result) for result in results] == [ValueError] * 3
+        assert call.calls == 1
+        assert len(flight) == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def run():
+        flight, call = SingleFlight("test"), Call()
+        leaving = asyncio.create_task(flight.do("key", call))
+        staying = asyncio.create_task(flight.do("key", call))
+        await call.started.wait()
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        call.release.set()
+        assert await staying == "result"
+        assert (call.calls, call.cancelled) == (1, 0)
+
+    asyncio.run(run())
+
+
+def test_call_is_cancelled_when_every_caller_leaves():
+    async def run():
+        flight, call = SingleFlight("test"), Call()
+        waiters = [asyncio.create_task(flight.do("key", call)) for _ in range(2)]
+        await call.started.wait()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert call.cancelled == 1
+        assert len(flight) == 0
+
+        # Un nouvel appelant relance l'appel
+        call.release.set()
+        assert await flight.do("key", call) == "result"
+        assert call.calls == 2
+
+    asyncio.run(run())
+
+
+def test_timeout_cancels_the_call_for_every_caller():
+    async def run():
+        flight, call = SingleFlight("test", timeout=0.05), Call()
+        waiters = [asyncio.create_task(flight.do("key", call)) for _ in range(2)]
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert [type(result) for result in results] == [asyncio.TimeoutError] * 2
+        assert (call.calls, call.cancelled) == (1, 1)
+        assert len(flight) == 0
+
+    asyncio.run(run())
@@ -0,0 +1,99 @@
+# CORE
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+# OWN
+import methodes_utils.manager as manager
+from methodes_utils.manager import AssistantManager
+from methodes_utils.vector_stores import IndexedDocument, VectorStoreIndex
+
+
+def _document(content_hash, number):
+    return IndexedDocument(content_hash, f"vs_{number}", f"file_{number}")
+
+
+def test_documents_are_shared_by_the_processes(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    first, second = VectorStoreIndex(path, 10, None), VectorStoreIndex(path, 10, None)
+
+    assert first.add(_document("a", 1)) == (_document("a", 1), [])
+    assert second.get("a") == _document("a", 1)
+    # Même document indexé en même temps par un autre worker: le premier enregistré est gardé
+    assert second.add(_document("a", 2)) == (_document("a", 1), [_document("a", 2)])
+    assert second.stats()["hits"] == 1
+
+
+def test_each_evicted_document_is_returned_to_one_process(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    first, second = VectorStoreIndex(path, 2, None), VectorStoreIndex(path, 2, None)
+    first.add(_document("a", 1))
+    time.sleep(0.01)
+    second.add(_document("b", 2))
+    time.sleep(0.01)
+    second.get("a")  # "a" plus récent que "b"
+    time.sleep(0.01)
+
+    _, evicted = first.add(_document("c", 3))
+    assert evicted == [_document("b", 2)]
+    assert second.purge() == []
+    assert second.get("b") is None and len(second) == 2
+
+
+def test_unused_documents_expire(tmp_path):
+    index = VectorStoreIndex(str(tmp_path / "index.sqlite3"), 10, 0.05)
+    index.add(_document("a", 1))
+    time.sleep(0.1)
+    assert index.get("a") is None
+    assert index.purge() == [_document("a", 1)]
+    # Une ligne expirée non purgée est remplacée, et son vector store rendu pour suppression
+    index.add(_document("b", 2))
+    time.sleep(0.1)
+    assert index.add(_document("b", 3)) == (_document("b", 3), [_document("b", 2)])
+
+
+def test_remove_keeps_a_newer_document(tmp_path):
+    index = VectorStoreIndex(str(tmp_path / "index.sqlite3"), 10, None)
+    index.add(_document("a", 1))
+    index.remove(_document("a", 0))
+    assert index.get("a") == _document("a", 1)
+    index.remove(_document("a", 1))
+    assert index.get("a") is None
+
+
+def test_workers_index_a_document_once_and_delete_only_evicted_stores(tmp_path, monkeypatch):
+    numbers = itertools.count(1)
+    deleted = []
+
+    async def create_vector_store(name, expires_days):
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(id=f"vs_{next(numbers)}")
+
+    async def create_file_batch(file_path, vector_store_id):
+        return SimpleNamespace(id=f"file_of_{vector_store_id}"), None
+
+    async def delete_vector_store(vector_store_id, file_ids):
+        deleted.append(vector_store_id)
+
+    monkeypatch.setattr(manager, "create_vector_store", create_vector_store)
+    monkeypatch.setattr(manager, "create_file_batch", create_file_batch)
+    monkeypatch.setattr(manager, "delete_vector_store", delete_vector_store)
+    path = str(tmp_path / "index.sqlite3")
+
+    async def run():
+        workers = [AssistantManager(max_vector_stores=2, index_path=path) for _ in range(2)]
+        # Le même contrat reçu au même moment par les deux workers
+        documents = await asyncio.gather(*(worker.get_vector_store("contrat.pdf", "a") for worker in workers))
+        await asyncio.gather(*(worker.close() for worker in workers))
+        assert documents[0] == documents[1]
+        assert deleted == [vs for vs in ("vs_1", "vs_2") if vs != documents[0].vector_store_id]
+
+        await workers[1].get_vector_store("autre.pdf", "b")
+        await workers[0].get_vector_store("contrat.pdf", "a")
+        await workers[0].get_vector_store("troisieme.pdf", "c")
+        await asyncio.gather(*(worker.close() for worker in workers))
+        # "b", le moins récemment utilisé des deux workers, est le seul supprimé
+        assert deleted[1:] == ["vs_3"]
+
+    asyncio.run(run())
@@ -0,0 +1,72 @@
+# CORE
+from datetime import date
+import asyncio
+import copy
+import json
+import os
+
+# THIRD PARTY
+import yaml
+
+# OWN
+from ceh_utils.registry import RulesRegistry
+from ceh_utils.weather import WEATHER_KEY, StubWeatherProvider, WeatherEnricher, coarse_location
+from data.rules_data.path_transcoding import path_transcoding
+from tests.test_ceh_engine import PAYLOAD_PATH
+
+SNOW_RULE = {"conditions": {
+    "condition_members": {"weather": {"path": "météo", "value": "neige"}},
+    "message": "neige", "name": "Neige", "priority": 0, "code": "NEIGE",
+    "created_at": date(2023, 1, 1), "validity": date(2999, 1, 1),
+}}
+
+
+class RecordingProvider(StubWeatherProvider):
+    def __init__(self, weather):
+        super().__init__(weather)
+        self.locations = []
+
+    async def fetch(self, location):
+        self.locations.append(location)
+        return await super().fetch(location)
+
+
+def write_transcoding(path, transcoding):
+    with open(path, "w") as f:
+        f.write(f"path_transcoding = {transcoding!r}\n")
+    # mtime différent même si deux écritures tombent dans la même tick
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10**9,) * 2)
+
+
+def test_location_follows_the_reloaded_transcoding(tmp_path):
+    rules_path, transcoding_path = tmp_path / "rules.yaml", tmp_path / "path_transcoding.py"
+    rules_path.write_text(yaml.safe_dump([SNOW_RULE], allow_unicode=True))
+    write_transcoding(transcoding_path, path_transcoding)
+    registry = RulesRegistry(str(rules_path), str(transcoding_path))
+    registry.load()
+
+    with open(PAYLOAD_PATH) as f:
+        payload = json.load(f)
+    address = payload["_embedded"]["documents"][0]["content"]["collectedData"]["requestGeneralInformation"]["address"]
+    address["department"] = "59"
+    payload["region"] = {"code": "75"}
+    assert coarse_location(payload, registry.current.rule_set.transcoding) == ("department", "59")
+
+    # Le département est déplacé dans le document: nouveau transcodage, rechargé à chaud
+    write_transcoding(transcoding_path, dict(path_transcoding, departement="region.code"))
+    assert registry.reload_if_changed()
+    rule_set = registry.current.rule_set
+    assert coarse_location(payload, rule_set.transcoding) == ("department", "75")
+
+    async def enrich():
+        provider = RecordingProvider({"condition": "neige", "temperature": -2})
+        enricher = WeatherEnricher(provider, budget=1)
+        document = copy.deepcopy(payload)
+        await enricher.enrich(rule_set, document)
+        await enricher.close()
+        return document, provider
+
+    document, provider = asyncio.run(enrich())
+    assert document[WEATHER_KEY]["condition"] == "neige"
+    assert rule_set.evaluate(document)[5] == "NEIGE"
+    assert provider.locations == [("department", "75")]